@@ -0,0 +1,99 @@
+"""Ansible lookup returning every object of a NetBox list endpoint, using scripts/netbox_client.py."""
+import os
+import sys
+
+from ansible.errors import AnsibleError
+from ansible.module_utils.parsing.convert_bool import boolean
+from ansible.plugins.lookup import LookupBase
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "scripts"))
+from netbox_client import NetBoxClient  # noqa: E402
+from netbox_snapshot import SNAPSHOT_DB, NetBoxSnapshot, UnsupportedQuery  # noqa: E402
+
+DOCUMENTATION = """
+name: netbox_api
+short_description: Fetch all objects of NetBox list endpoints
+description:
+  - Returns the objects of one or more NetBox list endpoints (e.g. C(ipam/vlans)), following the
+    pagination to the last page. Every other keyword argument is passed to NetBox as filter.
+  - Connections are kept open and reused by every lookup of the same NetBox in one playbook run.
+  - Endpoints kept in the local snapshot (scripts/netbox_snapshot.py, C(NETBOX_SNAPSHOT_DB)) are read
+    from it after fetching only the objects changed in NetBox. Other endpoints and filters the
+    snapshot cannot apply are fetched from NetBox.
+options:
+  _terms:
+    description: Endpoints below /api, e.g. C(dcim/devices).
+    required: true
+  url:
+    description: NetBox URL, with or without /api. Defaults to the C(netbox_url) variable or C(NETBOX_URL).
+  token:
+    description: API token. Defaults to the C(netbox_token) variable or C(NETBOX_TOKEN).
+  validate_certs:
+    description: Verify the TLS certificate. Defaults to the C(netbox_validate_certs) variable, else true.
+  ca_path:
+    description: CA bundle to verify against. Defaults to the C(netbox_cert) variable or C(NETBOX_CERT).
+  brief:
+    description: Return NetBox's minimal representation of every object.
+  fields:
+    description: Fields to return (NetBox 4.0 and later).
+  snapshot:
+    description: Read from the local snapshot when possible. Defaults to true unless C(NETBOX_SNAPSHOT_DB) is empty.
+"""
+
+EXAMPLES = """
+- name: All L2 VLANs of site dc1
+  ansible.builtin.set_fact:
+    vlans: "{{ query('netbox_api', 'ipam/vlans', site='dc1', role='l2') }}"
+"""
+
+OPTIONS = ("url", "token", "validate_certs", "ca_path", "brief", "fields", "snapshot")
+
+# One client (and snapshot) per NetBox, URL and token, shared by all lookups in this process
+_clients = {}
+_snapshots = {}
+
+
+class LookupModule(LookupBase):
+
+    def _setting(self, kwargs, variables, name, variable, env=None):
+        if name in kwargs:
+            return kwargs[name]
+        if variable in variables:
+            return self._templar.template(variables[variable])
+        return os.environ.get(env) if env else None
+
+    def run(self, terms, variables=None, **kwargs):
+        variables = variables or {}
+        url = self._setting(kwargs, variables, "url", "netbox_url", "NETBOX_URL")
+        token = self._setting(kwargs, variables, "token", "netbox_token", "NETBOX_TOKEN")
+        if not url or not token:
+            raise AnsibleError("netbox_api: set url and token, or the netbox_url and netbox_token variables")
+        validate_certs = self._setting(kwargs, variables, "validate_certs", "netbox_validate_certs")
+        if validate_certs is not None and not boolean(validate_certs, strict=False):
+            verify = False
+        else:
+            verify = self._setting(kwargs, variables, "ca_path", "netbox_cert", "NETBOX_CERT") or True
+        filters = {key: value for key, value in kwargs.items() if key not in OPTIONS}
+
+        key = (url, token, str(verify))
+        if key not in _clients:
+            _clients[key] = NetBoxClient(url, token, verify)
+        client = _clients[key]
+        snapshot = None
+        if SNAPSHOT_DB and boolean(kwargs.get("snapshot", True), strict=False):
+            if key not in _snapshots:
+                _snapshots[key] = NetBoxSnapshot(SNAPSHOT_DB, client)
+            snapshot = _snapshots[key]
+        results = []
+        for endpoint in terms:
+            try:
+                if snapshot is not None:
+                    try:
+                        results.extend(snapshot.iterate(endpoint, kwargs.get("brief", False), kwargs.get("fields"), **filters))
+                        continue
+                    except UnsupportedQuery:
+                        pass
+                results.extend(client.iterate(endpoint, kwargs.get("brief", False), kwargs.get("fields"), **filters))
+            except Exception as e:
+                raise AnsibleError(f"netbox_api: fetching {endpoint} failed: {e}")
+        return results
@@ -11,4 +11,7 @@ required_settings = {
 }
 
 # This is a dictionary of settings that have default values.
-default_settings = {}
+default_settings = {
+    # URL/jobs - when set, the output of the last triggered ANTA run is streamed live on the page
+    'anta_jobs_url': None,
+}
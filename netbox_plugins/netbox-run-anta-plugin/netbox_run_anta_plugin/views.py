@@ -9,8 +9,39 @@ from django.shortcuts import render, redirect
 from django.views import View
 from django.contrib import messages
 from django.conf import settings
+from django.core.cache import cache
 from .models import AntaStatus
-from markdown_it import MarkdownIt  
+
+STATUS_CACHE_KEY = 'netbox_run_anta_plugin:status'
+REPORT_CACHE_KEY = 'netbox_run_anta_plugin:report'
+
+
+def fetch_status_hash(status_url):
+    """Returns the current status file hash, revalidating the cached one with If-None-Match."""
+    cached_hash = cache.get(STATUS_CACHE_KEY)
+    headers = {'If-None-Match': f'"{cached_hash}"'} if cached_hash else {}
+    response = requests.get(status_url, headers=headers, timeout=5)
+    if response.status_code == 304 and cached_hash:
+        return cached_hash
+    response.raise_for_status()
+    current_hash = response.json().get('file_hash')
+    if not current_hash: raise ValueError("Hash not found in API response")
+    cache.set(STATUS_CACHE_KEY, current_hash, None)
+    return current_hash
+
+
+def fetch_report_html(report_url):
+    """Returns the report as an HTML fragment rendered by the server, downloaded only when it changed."""
+    cached = cache.get(REPORT_CACHE_KEY)
+    headers = {'If-None-Match': cached['etag']} if cached else {}
+    response = requests.get(report_url, params={'format': 'html'}, headers=headers, timeout=10)
+    if response.status_code == 304 and cached:
+        return cached['html']
+    response.raise_for_status()
+    etag = response.headers.get('ETag')
+    if etag:
+        cache.set(REPORT_CACHE_KEY, {'etag': etag, 'html': response.text}, None)
+    return response.text
 
 class AntaStatusView(View):
     template_name = 'netbox_run_anta_plugin/run-anta.html'
@@ -19,25 +50,37 @@ class AntaStatusView(View):
         plugin_settings = settings.PLUGINS_CONFIG.get('netbox_run_anta_plugin', {})
         status_url = plugin_settings.get('anta_status_url')
         report_url = plugin_settings.get('anta_report_url') 
+        jobs_url = plugin_settings.get('anta_jobs_url')
         
         context = {
             'button_color': 'secondary',
             'api_error': False,
             'html_report': None,
+            'stream_url': None,
         }
 
+        # Tail the output of the last ANTA run triggered from this session, if the server exposes it
+        job_id = request.session.get('anta_job_id')
+        if jobs_url and job_id:
+            job_url = f"{jobs_url.rstrip('/')}/{job_id}"
+            try:
+                response = requests.get(job_url, timeout=5)
+                job_status = response.json().get('status') if response.ok else None
+                if response.status_code == 404 or job_status not in ('queued', 'running'):
+                    # Shown one last time with its final status, then no longer followed
+                    request.session.pop('anta_job_id', None)
+                if response.status_code != 404:
+                    context['stream_url'] = f"{job_url}/stream"
+            except (requests.exceptions.RequestException, ValueError):
+                context['stream_url'] = f"{job_url}/stream"
+
         if not status_url or not report_url:
             messages.error(request, "ANTA status or report URL is not configured in configuration.py.")
             context['api_error'] = True
             return render(request, self.template_name, context)
 
         try:
-            response = requests.get(status_url, timeout=5)
-            response.raise_for_status()
-            data = response.json()
-            current_hash = data.get('file_hash')
-            if not current_hash: raise ValueError("Hash not found in API response")
-            context['current_hash'] = current_hash
+            context['current_hash'] = fetch_status_hash(status_url)
         except (requests.exceptions.RequestException, ValueError) as e:
             messages.error(request, f"Could not get status from remote server: {e}")
             context['api_error'] = True
@@ -48,17 +91,10 @@ class AntaStatusView(View):
         context['button_color'] = 'red' if context['current_hash'] != context['last_hash'] else 'green'
 
         try:
-            report_response = requests.get(report_url, timeout=10)
-            report_response.raise_for_status()
-            report_data = report_response.json()
-            report_content = report_data.get('report_content', '')
-            
-            # Convert Markdown to HTML
-            md = MarkdownIt()
-            md.enable('table')
-            context['html_report'] = md.render(report_content)
+            # The server renders the Markdown report to HTML and caches it per report version
+            context['html_report'] = fetch_report_html(report_url)
 
-        except (requests.exceptions.RequestException, ValueError) as e:
+        except requests.exceptions.RequestException as e:
             messages.warning(request, f"Could not fetch latest report: {e}")
             context['html_report'] = "<p class='text-warning'>Could not load report content.</p>"
 
@@ -75,10 +111,7 @@ class AntaStatusView(View):
             return redirect('plugins:netbox_run_anta_plugin:anta_status')
 
         try:
-            status_response = requests.get(status_url, timeout=5)
-            status_response.raise_for_status()
-            current_hash = status_response.json().get('file_hash')
-            if not current_hash: raise ValueError("Hash not found in API response")
+            current_hash = fetch_status_hash(status_url)
         except (requests.exceptions.RequestException, ValueError) as e:
             messages.error(request, f"Could not get current status before triggering webhook: {e}")
             return redirect('plugins:netbox_run_anta_plugin:anta_status')
@@ -95,8 +128,10 @@ class AntaStatusView(View):
             status_obj = AntaStatus.objects.get(pk=1)
             status_obj.last_known_hash = current_hash
             status_obj.save()
-            
-            messages.success(request, f"Successfully triggered ANTA test. Server responded: {trigger_response.json().get('message')}")
+
+            trigger_data = trigger_response.json()
+            request.session['anta_job_id'] = trigger_data.get('job_id')
+            messages.success(request, f"Successfully triggered ANTA test. Server responded: {trigger_data.get('message')}")
 
         except requests.exceptions.RequestException as e:
             messages.error(request, f"Failed to send trigger webhook: {e}")
@@ -1,10 +1,44 @@
 import hmac
 import hashlib
 import json
+import time
+import uuid
 import requests
 from datetime import datetime
 from django.conf import settings
 
+
+def new_trace_id():
+    """Returns a new trace ID for one VLAN rollout, the same format the webhook server uses."""
+    return uuid.uuid4().hex
+
+
+def send_spans(plugin_settings, spans):
+    """Posts spans to the trace collector of the webhook server (TRACE_COLLECTOR_URL), if one is configured."""
+    collector_url = plugin_settings.get('TRACE_COLLECTOR_URL')
+    if not collector_url:
+        return
+    headers = {'Content-Type': 'application/json'}
+    if plugin_settings.get('TRACE_COLLECTOR_TOKEN'):
+        headers['Authorization'] = f"Bearer {plugin_settings['TRACE_COLLECTOR_TOKEN']}"
+    try:
+        requests.post(collector_url, json=spans, headers=headers, timeout=5)
+    except requests.exceptions.RequestException as e:
+        print(f"BACKGROUND THREAD: Could not send trace spans: {e}")
+
+
+def make_span(trace_id, name, start, end, failed=False, **attrs):
+    return {
+        'trace_id': trace_id,
+        'span_id': uuid.uuid4().hex[:16],
+        'name': name,
+        'service': 'netbox',
+        'start': start,
+        'end': end,
+        'status': 'error' if failed else 'ok',
+        'attrs': attrs,
+    }
+
 def trigger_ansible_sync(vlan_data):
     plugin_settings = settings.PLUGINS_CONFIG.get('netbox_vlan_creator_status_plugin', {})
     webhook_url = plugin_settings.get('WEBHOOK_URL')
@@ -12,6 +46,8 @@ def trigger_ansible_sync(vlan_data):
 
     vlan_db_id = vlan_data.get('id')
     vlan_vid = vlan_data.get('vid')
+    trace_id = vlan_data.get('trace_id') or new_trace_id()
+    thread_started_at = time.time()
 
     print(f"BACKGROUND THREAD: Starting sync for VLAN DB ID: {vlan_db_id}, VLAN Tag: {vlan_vid}")
 
@@ -22,6 +58,7 @@ def trigger_ansible_sync(vlan_data):
     payload = {
         'event': 'vlan_created',
         'timestamp': datetime.utcnow().isoformat(),
+        'trace_id': trace_id,
         'data': {
             'vlan_db_id': vlan_db_id,
             'vlan_tag_id': vlan_vid
@@ -40,10 +77,19 @@ def trigger_ansible_sync(vlan_data):
         'X-Hook-Signature': signature
     }
 
-    print(f"BACKGROUND THREAD: Sending webhook to {webhook_url}")
+    print(f"BACKGROUND THREAD: Sending webhook to {webhook_url} (trace {trace_id})")
+    sent_at = time.time()
+    failed = False
     try:
         response = requests.post(webhook_url, data=json_payload, headers=headers, timeout=15)
         response.raise_for_status()
         print(f"BACKGROUND THREAD SUCCESS: Server responded with status {response.status_code}.")
     except requests.exceptions.RequestException as e:
+        failed = True
         print(f"BACKGROUND THREAD FAILED to send webhook: {e}")
+
+    # The click in NetBox (VLAN, prefix and interfaces saved) and the webhook call
+    spans = [make_span(trace_id, 'netbox.webhook_send', sent_at, time.time(), failed, vlan_db_id=vlan_db_id)]
+    if vlan_data.get('requested_at'):
+        spans.insert(0, make_span(trace_id, 'netbox.vlan_create', vlan_data['requested_at'], thread_started_at, vlan_db_id=vlan_db_id))
+    send_spans(plugin_settings, spans)
@@ -1,5 +1,6 @@
 import threading
 import logging
+import time
 
 from django.shortcuts import render, redirect
 from django.views.generic import View
@@ -13,7 +14,7 @@ from dcim.models import Site, Device, DeviceRole, Interface
 from extras.models import Tag
 
 from .forms import VlanCreatorForm, VlanDeleterForm
-from .utils import trigger_ansible_sync
+from .utils import new_trace_id, trigger_ansible_sync
 
 
 logger = logging.getLogger(__name__)
@@ -104,6 +105,7 @@ class VlanCreatorView(View):
         return render(request, self.template_name, {'form': form})
 
     def post(self, request):
+        requested_at = time.time()
         form = VlanCreatorForm(request.POST)
         if form.is_valid():
             data = form.cleaned_data
@@ -132,14 +134,16 @@ class VlanCreatorView(View):
                         # Create a dictionary containing BOTH the database ID and the VLAN Tag.
                         vlan_data_for_webhook = {
                             'id': vlan.id,   # The Database ID (e.g., 447)
-                            'vid': vlan.vid  # The VLAN Tag (e.g., 69)
+                            'vid': vlan.vid,  # The VLAN Tag (e.g., 69)
+                            'trace_id': new_trace_id(),  # Follows the VLAN through the whole pipeline
+                            'requested_at': requested_at,
                         }
                         
                         # Pass this dictionary as the argument to the background thread.
                         # The comma is important: args=(vlan_data_for_webhook,)
                         thread = threading.Thread(target=trigger_ansible_sync, args=(vlan_data_for_webhook,))
                         thread.start()
-                        messages.info(request, "Automation pipeline has been triggered for VLAN sync.")
+                        messages.info(request, f"Automation pipeline has been triggered for VLAN sync (trace {vlan_data_for_webhook['trace_id']}).")
                     else:
                         messages.warning(request, f"VLAN {data['vlan_id']} in site {data['vlan_site'].name} already exists. No actions taken.")
 
@@ -9,6 +9,8 @@ PLUGINS_CONFIG = {
     'netbox_vlan_creator_status_plugin': {
         'WEBHOOK_URL': 'URL',
         'WEBHOOK_SECRET': 'SECRET',
+        # Optional: trace spans of every VLAN rollout
+        'TRACE_COLLECTOR_URL': 'URL/traces',
     },
     'netbox_sync_manager_plugin': {
         'WEBHOOK_URL': 'URL',
@@ -18,6 +20,7 @@ PLUGINS_CONFIG = {
         'webhook_url': 'URL',
         'webhook_secret': 'SECRET',
         'anta_status_url': 'URL/status',
-        'anta_report_url': 'URL/latest-report'
+        'anta_report_url': 'URL/latest-report',
+        'anta_jobs_url': 'URL/jobs'
     }
 }
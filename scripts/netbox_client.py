@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+"""Shared NetBox REST client for the scripts and the netbox_api lookup plugin.
+
+One requests session per client keeps the TLS connections to NetBox open between calls,
+failed requests are retried with backoff, and list endpoints are paginated transparently,
+fetching several pages at a time:
+
+    client = NetBoxClient.from_env()
+    for vlan in client.iterate("ipam/vlans", site="dc1", fields=["id", "vid", "name"]):
+        ...
+"""
+import os
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs, urlencode, urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# NetBox's default MAX_PAGE_SIZE
+PAGE_SIZE = int(os.environ.get("NETBOX_PAGE_SIZE", "1000"))
+RETRIES = int(os.environ.get("NETBOX_RETRIES", "3"))
+POOL_SIZE = int(os.environ.get("NETBOX_POOL_SIZE", "10"))
+TIMEOUT = float(os.environ.get("NETBOX_TIMEOUT", "30"))
+# Longer list filters (e.g. vlan_id of every VLAN) are split into several queries to keep
+# the URL below the request line limit of NetBox's web server
+FILTER_CHUNK = int(os.environ.get("NETBOX_FILTER_CHUNK", "200"))
+# Pages fetched at the same time once the first page has told how many objects there are
+PAGE_WORKERS = int(os.environ.get("NETBOX_PAGE_WORKERS", "4"))
+
+
+class NetBoxClient:
+    """Keep-alive session against the NetBox REST API.
+
+    url may end with or without /api. verify is passed to requests: a CA bundle path,
+    True or False.
+    """
+
+    def __init__(
+        self, url, token, verify=True, page_size=PAGE_SIZE, retries=RETRIES, pool_size=POOL_SIZE, timeout=TIMEOUT,
+        filter_chunk=FILTER_CHUNK, page_workers=PAGE_WORKERS,
+    ):
+        url = url.rstrip("/")
+        self.api_url = url if url.endswith("/api") else f"{url}/api"
+        self.page_size = page_size
+        self.filter_chunk = filter_chunk
+        self.page_workers = page_workers
+        self.timeout = timeout
+        self.session = requests.Session()
+        self.session.headers.update({
+            "Authorization": f"Token {token}",
+            "Accept": "application/json",
+        })
+        self.session.verify = verify
+        # Connection errors, throttling and gateway errors are retried, honouring Retry-After
+        retry = Retry(
+            total=retries,
+            backoff_factor=0.5,
+            status_forcelist=(429, 500, 502, 503, 504),
+            allowed_methods=frozenset({"GET", "PATCH", "PUT", "DELETE"}),
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=retry)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    @classmethod
+    def from_env(cls, **options):
+        """Creates a client from NETBOX_URL, NETBOX_TOKEN (or NETBOX_API_TOKEN) and NETBOX_CERT."""
+        token = os.environ.get("NETBOX_TOKEN") or os.environ.get("NETBOX_API_TOKEN")
+        if not os.environ.get("NETBOX_URL") or not token:
+            raise ValueError("NETBOX_URL and NETBOX_TOKEN (or NETBOX_API_TOKEN) must be set")
+        return cls(os.environ["NETBOX_URL"], token, os.environ.get("NETBOX_CERT") or True, **options)
+
+    def close(self):
+        self.session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+    def url(self, endpoint):
+        return f"{self.api_url}/{endpoint.strip('/')}/"
+
+    def request(self, method, endpoint, **kwargs):
+        """Sends a request to an endpoint such as "ipam/vlans/12" and returns the response, raising on HTTP errors."""
+        response = self.session.request(method, self.url(endpoint), timeout=self.timeout, **kwargs)
+        response.raise_for_status()
+        return response
+
+    def get(self, endpoint, **params):
+        return self.request("GET", endpoint, params=params).json()
+
+    def patch(self, endpoint, data):
+        return self.request("PATCH", endpoint, json=data).json()
+
+    @staticmethod
+    def list_params(filters, brief=False, fields=None):
+        """Query parameters of a list request. List values become repeated parameters (role=a&role=b)."""
+        params = {key: value for key, value in filters.items() if value is not None}
+        if brief:
+            params["brief"] = "true"
+        if fields:
+            params["fields"] = ",".join(fields)
+        return params
+
+    def iterate(self, endpoint, brief=False, fields=None, **filters):
+        """Yields every object of a list endpoint, following the "next" links page by page.
+
+        brief returns NetBox's minimal representation; fields (NetBox 4.0+) selects the
+        fields to return. Both make pages smaller and faster to serialize. A list filter
+        longer than filter_chunk values is sent as several queries, e.g. the prefixes of
+        2,000 VLANs as 10 queries with 200 vlan_id values each. An empty list filter
+        matches nothing (NetBox would ignore it and return everything).
+        """
+        if any(isinstance(value, (list, tuple)) and not value for value in filters.values()):
+            return
+        long_key = next(
+            (key for key, value in filters.items() if isinstance(value, (list, tuple)) and len(value) > self.filter_chunk),
+            None,
+        )
+        if long_key is None:
+            yield from self._iterate_pages(endpoint, self.list_params(filters, brief, fields))
+            return
+        values, seen = list(filters[long_key]), set()
+        for offset in range(0, len(values), self.filter_chunk):
+            chunk = dict(filters, **{long_key: values[offset:offset + self.filter_chunk]})
+            # An object can match values of several chunks, e.g. tags
+            for obj in self.iterate(endpoint, brief, fields, **chunk):
+                if obj.get("id") not in seen:
+                    seen.add(obj.get("id"))
+                    yield obj
+
+    def _get_page(self, url, params=None):
+        response = self.session.get(url, params=params, timeout=self.timeout)
+        response.raise_for_status()
+        return response.json()
+
+    def _iterate_pages(self, endpoint, params):
+        """Yields the objects of every page, in order.
+
+        The first page tells the total count and, through its "next" link, the page size
+        NetBox actually applied (it caps limit at MAX_PAGE_SIZE). The remaining pages are
+        then requested page_workers at a time by offset.
+        """
+        params.setdefault("limit", self.page_size)
+        page = self._get_page(self.url(endpoint), params)
+        yield from page["results"]
+        if not page.get("next"):
+            return
+        next_url = urlparse(page["next"])
+        query = parse_qs(next_url.query)
+        step = int(query["offset"][0])
+        urls = [
+            next_url._replace(query=urlencode(dict(query, offset=[str(offset)]), doseq=True)).geturl()
+            for offset in range(step, page["count"], step)
+        ]
+        if self.page_workers <= 1:
+            for url in urls:
+                yield from self._get_page(url)["results"]
+            return
+        with ThreadPoolExecutor(max_workers=self.page_workers) as pool:
+            for result in pool.map(self._get_page, urls):
+                yield from result["results"]
+
+    def list(self, endpoint, brief=False, fields=None, **filters):
+        return list(self.iterate(endpoint, brief, fields, **filters))
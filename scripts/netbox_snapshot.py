@@ -0,0 +1,285 @@
+#!/usr/bin/env python3
+"""Local SQLite snapshot of the NetBox objects the sync reads, refreshed incrementally.
+
+The first read of an endpoint downloads all of its objects. Later reads only ask NetBox
+for the objects changed since the newest last_updated already stored
+(last_updated__gte), plus the IDs of all objects (brief, in NetBox's order). Stored
+objects whose ID is gone were deleted (or moved out of the endpoint's scope) and are
+dropped, unknown IDs are fetched, and objects are returned in NetBox's order, so the
+playbooks render the same files with and without the snapshot. Every
+NETBOX_SNAPSHOT_RECONCILE seconds an endpoint is downloaded in full again, which also
+refreshes nested data that changes without touching the object itself, such as the name
+of a VRF shown in a prefix.
+
+Filters are applied locally, so e.g. one prefix query per VLAN costs no round trip:
+
+    with NetBoxClient.from_env() as client:
+        snapshot = NetBoxSnapshot.from_env(client)
+        vlans = snapshot.list("ipam/vlans", site="dc1", role="l2")
+
+    python scripts/netbox_snapshot.py --refresh      # refresh every endpoint
+    python scripts/netbox_snapshot.py --full         # full reconcile of every endpoint
+"""
+import argparse
+import json
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+from netbox_client import NetBoxClient
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS netbox_objects (
+    endpoint TEXT NOT NULL,
+    id INTEGER NOT NULL,
+    last_updated TEXT,
+    position INTEGER,
+    data TEXT NOT NULL,
+    PRIMARY KEY (endpoint, id)
+);
+CREATE TABLE IF NOT EXISTS netbox_endpoints (
+    endpoint TEXT PRIMARY KEY,
+    scope TEXT NOT NULL,
+    refreshed_at REAL NOT NULL,
+    reconciled_at REAL NOT NULL
+);
+"""
+
+# Columns added after the first release, created on existing databases
+MIGRATIONS = {
+    "position": "INTEGER",
+}
+
+# Endpoints kept in the snapshot, with the filters that bound what is stored of them.
+# Anycast IPs are left out: NetBox filters them to the l3leaf devices of the fabric, which
+# is smaller than a copy of every anycast IP.
+SNAPSHOT_ENDPOINTS = {
+    "dcim/devices": {"site": "dc1"},
+    "dcim/interfaces": {"site": "dc1"},
+    "ipam/vlans": {"site": "dc1"},
+    "ipam/prefixes": {},
+    "ipam/vrfs": {},
+}
+SNAPSHOT_DB = os.environ.get("NETBOX_SNAPSHOT_DB", os.path.join(tempfile.gettempdir(), "netbox-avd-snapshot.db"))
+RECONCILE_INTERVAL = float(os.environ.get("NETBOX_SNAPSHOT_RECONCILE", "3600"))
+# Objects changed this long before the newest stored last_updated are fetched again, for
+# changes whose transaction committed after a later one
+OVERLAP = timedelta(seconds=60)
+
+
+def _key(value):
+    """The part of a nested object a filter compares with: slug, choice value, or the value itself."""
+    if isinstance(value, dict):
+        for field in ("slug", "value", "name"):
+            if field in value:
+                return str(value[field])
+        return None
+    return None if value is None else str(value)
+
+
+def _nested_id(value):
+    return str(value["id"]) if isinstance(value, dict) and "id" in value else None
+
+
+# NetBox filters that can be applied to the stored objects, by what they compare
+LOCAL_FILTERS = {
+    "site": lambda obj: [_key(obj.get("site"))],
+    "role": lambda obj: [_key(obj.get("role") or obj.get("device_role"))],
+    "tag": lambda obj: [_key(tag) for tag in obj.get("tags") or []],
+    "vid": lambda obj: [_key(obj.get("vid"))],
+    "vlan_id": lambda obj: [_nested_id(obj.get("vlan"))],
+    "device_id": lambda obj: [_nested_id(obj.get("device"))],
+    "device": lambda obj: [_key((obj.get("device") or {}).get("name"))],
+}
+
+
+def _as_list(value):
+    return [str(item) for item in value] if isinstance(value, (list, tuple, set)) else [str(value)]
+
+
+class UnsupportedQuery(Exception):
+    """Raised for queries the snapshot cannot answer; the caller asks NetBox instead."""
+
+
+class NetBoxSnapshot:
+    """SQLite copy of SNAPSHOT_ENDPOINTS, read with the same filters as the NetBox API."""
+
+    def __init__(self, db_path, client, endpoints=None, reconcile_interval=RECONCILE_INTERVAL):
+        self.db_path = db_path
+        self.client = client
+        self.endpoints = SNAPSHOT_ENDPOINTS if endpoints is None else endpoints
+        self.reconcile_interval = reconcile_interval
+        # Each endpoint is refreshed once per process, e.g. once per playbook task
+        self._refreshed = set()
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        with self._connect() as conn:
+            conn.executescript(SCHEMA)
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(netbox_objects)")}
+            for column, definition in MIGRATIONS.items():
+                if column not in columns:
+                    conn.execute(f"ALTER TABLE netbox_objects ADD COLUMN {column} {definition}")
+
+    @classmethod
+    def from_env(cls, client):
+        """Returns the snapshot at NETBOX_SNAPSHOT_DB, or None if it is set to an empty value."""
+        return cls(SNAPSHOT_DB, client) if SNAPSHOT_DB else None
+
+    @contextmanager
+    def _connect(self):
+        """Yields a short-lived connection that commits on success and is always closed."""
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def _scope(self, endpoint):
+        return self.endpoints[endpoint]
+
+    def _store(self, conn, endpoint, objects, positions=None):
+        """Inserts or replaces objects. Their position is set by _order unless given."""
+        conn.executemany(
+            "INSERT OR REPLACE INTO netbox_objects (endpoint, id, last_updated, position, data) VALUES (?, ?, ?, ?, ?)",
+            [
+                (endpoint, obj["id"], obj.get("last_updated"), positions[index] if positions else None, json.dumps(obj))
+                for index, obj in enumerate(objects)
+            ],
+        )
+
+    @staticmethod
+    def _order(conn, endpoint, ids):
+        """Deletes the objects whose ID is not in ids and numbers the others in the order of ids."""
+        conn.execute("CREATE TEMP TABLE live_ids (id INTEGER PRIMARY KEY, position INTEGER NOT NULL)")
+        conn.executemany(
+            "INSERT INTO live_ids (id, position) VALUES (?, ?)",
+            [(object_id, position) for position, object_id in enumerate(ids)],
+        )
+        conn.execute("DELETE FROM netbox_objects WHERE endpoint = ? AND id NOT IN (SELECT id FROM live_ids)", (endpoint,))
+        conn.execute(
+            "UPDATE netbox_objects SET position = (SELECT position FROM live_ids WHERE live_ids.id = netbox_objects.id) "
+            "WHERE endpoint = ?",
+            (endpoint,),
+        )
+        conn.execute("DROP TABLE live_ids")
+
+    def reconcile(self, endpoint):
+        """Downloads an endpoint in full and replaces what is stored of it."""
+        objects = list(self.client.iterate(endpoint, **self._scope(endpoint)))
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute("DELETE FROM netbox_objects WHERE endpoint = ?", (endpoint,))
+            self._store(conn, endpoint, objects, positions=range(len(objects)))
+            conn.execute(
+                "INSERT OR REPLACE INTO netbox_endpoints (endpoint, scope, refreshed_at, reconciled_at) VALUES (?, ?, ?, ?)",
+                (endpoint, json.dumps(self._scope(endpoint), sort_keys=True), now, now),
+            )
+        return len(objects)
+
+    def refresh(self, endpoint, full=False):
+        """Brings an endpoint up to date. Returns the number of objects transferred."""
+        with self._connect() as conn:
+            state = conn.execute(
+                "SELECT scope, reconciled_at FROM netbox_endpoints WHERE endpoint = ?", (endpoint,)
+            ).fetchone()
+            newest = conn.execute(
+                "SELECT MAX(last_updated) FROM netbox_objects WHERE endpoint = ?", (endpoint,)
+            ).fetchone()[0]
+        if (
+            full
+            or state is None
+            or newest is None
+            or state[0] != json.dumps(self._scope(endpoint), sort_keys=True)
+            or time.time() - state[1] > self.reconcile_interval
+        ):
+            return self.reconcile(endpoint)
+
+        since = (datetime.fromisoformat(newest.replace("Z", "+00:00")) - OVERLAP).isoformat()
+        changed = list(self.client.iterate(endpoint, last_updated__gte=since, **self._scope(endpoint)))
+        # Every ID in NetBox's order: catches deletions even when as many objects were
+        # created, and keeps the stored objects in the order the API returns them
+        ids = [obj["id"] for obj in self.client.iterate(endpoint, brief=True, **self._scope(endpoint))]
+        with self._connect() as conn:
+            self._store(conn, endpoint, changed)
+            stored = {row[0] for row in conn.execute("SELECT id FROM netbox_objects WHERE endpoint = ?", (endpoint,))}
+        # Created between the two queries, or moved into the scope without a newer last_updated
+        missing = [object_id for object_id in ids if object_id not in stored]
+        added = list(self.client.iterate(endpoint, id=missing, **self._scope(endpoint))) if missing else []
+        with self._connect() as conn:
+            self._store(conn, endpoint, added)
+            self._order(conn, endpoint, ids)
+            conn.execute("UPDATE netbox_endpoints SET refreshed_at = ? WHERE endpoint = ?", (time.time(), endpoint))
+        return len(changed) + len(ids) + len(added)
+
+    def _ensure_fresh(self, endpoint):
+        if endpoint not in self._refreshed:
+            self.refresh(endpoint)
+            self._refreshed.add(endpoint)
+
+    def _check(self, endpoint, filters):
+        if endpoint not in self.endpoints:
+            raise UnsupportedQuery(f"{endpoint} is not part of the snapshot")
+        scope = self._scope(endpoint)
+        local = {}
+        for key, value in filters.items():
+            if value is None or key in ("limit", "offset", "ordering"):
+                continue
+            if key in scope:
+                # Everything stored matches the scope filter, and nothing outside it is stored
+                if sorted(_as_list(value)) != sorted(_as_list(scope[key])):
+                    raise UnsupportedQuery(f"{endpoint} is only stored for {key}={scope[key]}")
+                continue
+            if key not in LOCAL_FILTERS:
+                raise UnsupportedQuery(f"Filter '{key}' of {endpoint} cannot be applied to the snapshot")
+            local[key] = set(_as_list(value))
+        return local
+
+    def iterate(self, endpoint, brief=False, fields=None, **filters):
+        """Yields the stored objects matching filters (repeated values match any), refreshing the endpoint first.
+
+        brief and fields are accepted for compatibility with NetBoxClient.iterate; the
+        snapshot always returns complete objects. Raises UnsupportedQuery for endpoints or
+        filters it cannot serve.
+        """
+        local = self._check(endpoint, filters)
+        self._ensure_fresh(endpoint)
+        with self._connect() as conn:
+            rows = conn.execute("SELECT data FROM netbox_objects WHERE endpoint = ? ORDER BY position, id", (endpoint,)).fetchall()
+        for (data,) in rows:
+            obj = json.loads(data)
+            if all(set(LOCAL_FILTERS[key](obj)) & values for key, values in local.items()):
+                yield obj
+
+    def list(self, endpoint, brief=False, fields=None, **filters):
+        return list(self.iterate(endpoint, brief, fields, **filters))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--db", default=SNAPSHOT_DB, help="Snapshot database (NETBOX_SNAPSHOT_DB)")
+    parser.add_argument("--refresh", action="store_true", help="Refresh every endpoint incrementally")
+    parser.add_argument("--full", action="store_true", help="Download every endpoint in full")
+    args = parser.parse_args()
+    if not args.db:
+        parser.error("NETBOX_SNAPSHOT_DB is empty, the snapshot is disabled")
+
+    with NetBoxClient.from_env() as client:
+        snapshot = NetBoxSnapshot(args.db, client)
+        for endpoint in snapshot.endpoints:
+            started = time.monotonic()
+            transferred = snapshot.refresh(endpoint, full=args.full) if args.refresh or args.full else None
+            with snapshot._connect() as conn:
+                stored = conn.execute("SELECT COUNT(*) FROM netbox_objects WHERE endpoint = ?", (endpoint,)).fetchone()[0]
+            if transferred is None:
+                print(f"{endpoint}: {stored} objects")
+            else:
+                print(f"{endpoint}: {stored} objects, {transferred} transferred in {time.monotonic() - started:.2f}s")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
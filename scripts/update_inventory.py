@@ -1,14 +1,15 @@
 #!/usr/bin/env python3
 
 import os
-import requests
 import yaml
 from jinja2 import Environment, FileSystemLoader
 
+from netbox_client import NetBoxClient
+from netbox_snapshot import NetBoxSnapshot
+
 # NetBox Configuration
 NETBOX_URL = os.environ["NETBOX_URL"]
 NETBOX_TOKEN = os.environ["NETBOX_TOKEN"]
-HEADERS = {"Authorization": f"Token {NETBOX_TOKEN}"}
 NETBOX_CERT = os.environ["NETBOX_CERT"]
 
 # CVP Configuration
@@ -16,12 +17,28 @@ CVP_HOST = os.environ["CVP_HOST"]
 CVP_USER = os.environ["CVP_USER"]
 CVP_PASSWORD = os.environ["CVP_PASSWORD"]
 
-def get_netbox_devices(role_slug):
-    """Fetch devices from NetBox based on role slug and site dc1."""
-    url = f"{NETBOX_URL}/api/dcim/devices/?role={role_slug}&site=dc1"
-    response = requests.get(url, headers=HEADERS, verify=NETBOX_CERT)
-    response.raise_for_status()
-    return response.json()["results"]
+# Device role slug -> inventory group passed to the template
+ROLE_GROUPS = {"spine": "spines", "l3leaf": "l3_leaves", "l2leaf": "l2_leaves"}
+
+
+def device_role(device):
+    # NetBox < 3.6 calls the field device_role
+    return (device.get("role") or device.get("device_role") or {}).get("slug")
+
+
+def get_netbox_devices(client, role_slugs):
+    """Fetch all devices (every page) of the given roles in site dc1 with one query, grouped by role slug.
+
+    client is a NetBoxClient or a NetBoxSnapshot; both take the same filters.
+    """
+    devices = {role_slug: [] for role_slug in role_slugs}
+    for device in client.iterate(
+        "dcim/devices", role=list(role_slugs), site="dc1", fields=["name", "primary_ip", "role", "device_role"]
+    ):
+        role_slug = device_role(device)
+        if role_slug in devices:
+            devices[role_slug].append(device)
+    return devices
 
 def main():
     # Check for required environment variables
@@ -30,29 +47,22 @@ def main():
     if missing_vars:
         raise ValueError(f"Missing required environment variables: {', '.join(missing_vars)}")
 
-    # Fetch devices by role slugs
-    spines = [
-        {"name": device["name"], "ip": device["primary_ip"]["address"].split("/")[0] if device["primary_ip"] else "0.0.0.0"}
-        for device in get_netbox_devices("spine")
-    ]
-    l3_leaves = [
-        {"name": device["name"], "ip": device["primary_ip"]["address"].split("/")[0] if device["primary_ip"] else "0.0.0.0"}
-        for device in get_netbox_devices("l3leaf")
-    ]
-    l2_leaves = [
-        {"name": device["name"], "ip": device["primary_ip"]["address"].split("/")[0] if device["primary_ip"] else "0.0.0.0"}
-        for device in get_netbox_devices("l2leaf")
-    ]
+    # Fetch the devices of all roles in one query and split them by role locally. The
+    # local snapshot only asks NetBox for the devices changed since the last run.
+    with NetBoxClient(NETBOX_URL, NETBOX_TOKEN, NETBOX_CERT) as client:
+        devices_by_role = get_netbox_devices(NetBoxSnapshot.from_env(client) or client, ROLE_GROUPS)
 
     # Prepare data for template
     template_data = {
         "cvp_host": CVP_HOST,
         "cvp_user": CVP_USER,
         "cvp_password": CVP_PASSWORD,
-        "spines": spines,
-        "l3_leaves": l3_leaves,
-        "l2_leaves": l2_leaves
     }
+    for role_slug, group in ROLE_GROUPS.items():
+        template_data[group] = [
+            {"name": device["name"], "ip": device["primary_ip"]["address"].split("/")[0] if device["primary_ip"] else "0.0.0.0"}
+            for device in devices_by_role[role_slug]
+        ]
 
     # Render template
     env = Environment(loader=FileSystemLoader("templates"))
@@ -3,6 +3,8 @@ import os
 import sys
 import requests
 
+from netbox_client import NetBoxClient
+
 # --- CONFIGURATION ---
 NETBOX_URL = os.environ.get("NETBOX_URL")
 NETBOX_API_TOKEN = os.environ.get("NETBOX_API_TOKEN") 
@@ -18,12 +20,6 @@ def update_vlan_status(vlan_id, new_status):
         print(f"Error: Certificate file not found at path: {NETBOX_CERT}")
         sys.exit(1)
 
-    api_url = f"{NETBOX_URL.rstrip('/')}/api/ipam/vlans/{vlan_id}/"
-    headers = {
-        "Authorization": f"Token {NETBOX_API_TOKEN}",
-        "Content-Type": "application/json",
-        "Accept": "application/json",
-    }
     payload = {
         "custom_fields": {
             "deployment_status": new_status
@@ -32,8 +28,8 @@ def update_vlan_status(vlan_id, new_status):
 
     print(f"Updating NetBox: Setting VLAN {vlan_id} status to '{new_status}'...")
     try:
-        response = requests.patch(api_url, headers=headers, json=payload, timeout=10, verify=NETBOX_CERT)
-        response.raise_for_status()
+        with NetBoxClient(NETBOX_URL, NETBOX_API_TOKEN, NETBOX_CERT, timeout=10) as client:
+            client.patch(f"ipam/vlans/{vlan_id}", payload)
         print(f"Successfully updated VLAN {vlan_id} status.")
     except requests.exceptions.SSLError as e:
         print(f"SSL Error updating NetBox: {e}")
@@ -0,0 +1,205 @@
+import json
+import os
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import warnings
+from collections import deque
+
+from rich.console import Console
+
+console = Console()
+
+# Written by a playbook child as its very last line: the sentinel followed by the exit code
+EXIT_SENTINEL = "\0ANSIBLE_ENGINE_EXIT "
+
+# Number of trailing output lines returned by run_playbook, e.g. for error messages
+OUTPUT_TAIL_LINES = 50
+
+
+def load_env_file(env_file):
+    """Sources a shell environment file once and returns the resulting environment as a dict."""
+    result = subprocess.run(
+        ["bash", "-c", f"source {env_file} && env -0"], capture_output=True, check=True
+    )
+    env = {}
+    for entry in result.stdout.decode("utf-8", errors="replace").split("\0"):
+        if "=" in entry:
+            key, value = entry.split("=", 1)
+            env[key] = value
+    return env
+
+
+def _warm_up():
+    """Imports ansible-playbook and installs the collection loader once, before any fork."""
+    from ansible.cli.playbook import PlaybookCLI  # noqa: F401
+    from ansible.executor.playbook_executor import PlaybookExecutor  # noqa: F401
+    from ansible.plugins.loader import init_plugin_loader
+
+    init_plugin_loader()
+    # Every forked run calls init_plugin_loader again and reuses the warm collection loader
+    warnings.filterwarnings("ignore", message="AnsibleCollectionFinder has already been configured")
+
+
+def _run_request(conn):
+    """Runs one ansible-playbook request in a freshly forked child. Never returns."""
+    returncode = 1
+    try:
+        request = json.loads(conn.makefile("rb").readline())
+        os.chdir(request["workdir"])
+        os.environ.clear()
+        os.environ.update(request["env"])
+        # Everything the run prints, including Ansible's own workers, goes straight to the client
+        os.dup2(conn.fileno(), 1)
+        os.dup2(conn.fileno(), 2)
+        sys.stdout.reconfigure(line_buffering=True)
+        sys.stderr.reconfigure(line_buffering=True)
+
+        from ansible.cli.playbook import PlaybookCLI
+
+        try:
+            PlaybookCLI.cli_executor(["ansible-playbook", *request["argv"]])
+            returncode = 0
+        except SystemExit as e:
+            returncode = e.code if isinstance(e.code, int) else 1
+    except Exception as e:
+        print(f"ansible engine: {e}", file=sys.stderr)
+    finally:
+        sys.stdout.flush()
+        sys.stderr.flush()
+        os.write(1, f"\n{EXIT_SENTINEL}{returncode}\n".encode())
+        os._exit(0)
+
+
+def serve(socket_path):
+    """Main loop of the engine process: warms up once, then forks one child per playbook run."""
+    _warm_up()
+    parent_pid = os.getppid()
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    server.bind(socket_path)
+    server.listen()
+    server.settimeout(5)
+    # Children are reaped automatically; they restore the default handler for their own subprocesses
+    signal.signal(signal.SIGCHLD, signal.SIG_IGN)
+    print("ready", flush=True)
+    while True:
+        try:
+            conn, _ = server.accept()
+        except socket.timeout:
+            if os.getppid() != parent_pid:
+                # The webhook server is gone, so is the engine
+                os._exit(0)
+            continue
+        if os.fork() == 0:
+            server.close()
+            signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+            _run_request(conn)
+        conn.close()
+
+
+class AnsibleEngine:
+    """Runs playbooks either through a warm, pre-forking ansible-core engine or as plain subprocesses.
+
+    The environment file is sourced once at start instead of for every playbook. In the
+    in-process mode a helper process imports ansible-core and installs the collection loader
+    once, then forks a child per playbook that calls the ansible-playbook CLI class directly,
+    so a run only pays for the fork and the tasks themselves.
+    """
+
+    def __init__(self, env_file, mode="auto", config_file=None):
+        self.env_file = env_file
+        self.mode = mode
+        self.config_file = config_file
+        self.env = None
+        self.inprocess = False
+        self._process = None
+        self._socket_path = None
+        self._start_lock = threading.Lock()
+
+    def start(self):
+        """Loads the environment file and, when possible, starts the warm engine process."""
+        with self._start_lock:
+            if self.env is None:
+                env = dict(os.environ)
+                env.update(load_env_file(self.env_file))
+                if self.config_file:
+                    # Ansible reads its config once when the engine imports it, not per playbook
+                    env["ANSIBLE_CONFIG"] = self.config_file
+                self.env = env
+                if self.mode in ("auto", "inprocess"):
+                    try:
+                        import ansible  # noqa: F401
+                        self.inprocess = True
+                    except ImportError:
+                        if self.mode == "inprocess":
+                            raise
+                        console.print("[bold yellow]ANSIBLE: ⚠️ ansible-core is not importable, falling back to subprocesses[/bold yellow]")
+                mode = "in-process (pre-forked engine)" if self.inprocess else "subprocess"
+                console.print(f"[bold green]ANSIBLE: ✔️ Engine ready, running playbooks {mode}[/bold green]")
+            if self.inprocess and (self._process is None or self._process.poll() is not None):
+                self._start_engine_process()
+
+    def _start_engine_process(self):
+        if self._process is not None:
+            console.print("[bold yellow]ANSIBLE: ⚠️ Engine process exited, restarting it[/bold yellow]")
+        self._socket_path = os.path.join(tempfile.mkdtemp(prefix="ansible-engine-"), "engine.sock")
+        # ansible-core insists on blocking stdio, so the engine gets its own pipe instead of ours
+        self._process = subprocess.Popen(
+            [sys.executable, os.path.abspath(__file__), self._socket_path],
+            env=self.env, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True,
+        )
+        for line in self._process.stdout:
+            if line.strip() == "ready":
+                break
+            console.print(f"ANSIBLE ENGINE: {line.rstrip()}", style="yellow", markup=False)
+        else:
+            raise RuntimeError("The Ansible engine process failed to start")
+        threading.Thread(target=self._drain_engine_output, args=(self._process,), daemon=True).start()
+
+    @staticmethod
+    def _drain_engine_output(process):
+        for line in process.stdout:
+            console.print(f"ANSIBLE ENGINE: {line.rstrip()}", style="yellow", markup=False)
+
+    def run_playbook(self, workdir, argv, on_line=None):
+        """Runs ansible-playbook with argv in workdir and returns (returncode, output tail).
+
+        Output is handed to on_line(line) as it is produced; only the last OUTPUT_TAIL_LINES
+        lines are kept in memory and returned.
+        """
+        self.start()
+        tail = deque(maxlen=OUTPUT_TAIL_LINES)
+
+        def handle(line):
+            tail.append(line)
+            if on_line:
+                on_line(line)
+
+        if not self.inprocess:
+            process = subprocess.Popen(
+                ["ansible-playbook", *argv], cwd=workdir, env=self.env,
+                stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True, errors="replace",
+            )
+            for line in process.stdout:
+                handle(line)
+            return process.wait(), "".join(tail)
+
+        returncode = 1
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as conn:
+            conn.connect(self._socket_path)
+            request = {"workdir": os.path.abspath(workdir), "argv": argv, "env": self.env}
+            conn.sendall(json.dumps(request).encode() + b"\n")
+            with conn.makefile("r", encoding="utf-8", errors="replace") as reader:
+                for line in reader:
+                    if line.startswith(EXIT_SENTINEL):
+                        returncode = int(line[len(EXIT_SENTINEL):])
+                        break
+                    handle(line)
+        return returncode, "".join(tail)
+
+
+if __name__ == "__main__":
+    serve(sys.argv[1])
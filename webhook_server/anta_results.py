@@ -0,0 +1,211 @@
+import csv
+import hashlib
+import io
+import sqlite3
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS anta_runs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    fabric TEXT NOT NULL,
+    commit_id TEXT,
+    report_sha256 TEXT NOT NULL,
+    created_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS anta_results (
+    run_id INTEGER NOT NULL REFERENCES anta_runs (id) ON DELETE CASCADE,
+    device TEXT NOT NULL,
+    category TEXT NOT NULL,
+    test TEXT NOT NULL,
+    description TEXT NOT NULL,
+    result TEXT NOT NULL,
+    messages TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS anta_runs_fabric_idx ON anta_runs (fabric, id);
+CREATE INDEX IF NOT EXISTS anta_results_run_idx ON anta_results (run_id, device, category, result);
+CREATE INDEX IF NOT EXISTS anta_results_result_idx ON anta_results (run_id, result, device);
+"""
+
+# Column names used by the CSV reports of the different ANTA/AVD versions
+COLUMNS = {
+    "device": ("device", "dut", "node"),
+    "test": ("test name", "test", "name"),
+    "category": ("test category", "categories", "test_category", "category"),
+    "description": ("test description", "description", "test_description"),
+    "result": ("test status", "result", "status"),
+    "messages": ("message(s)", "messages", "failure_reason", "result_messages"),
+}
+RESULTS = {"pass": "success", "passed": "success", "fail": "failure", "failed": "failure", "skip": "skipped"}
+FAILED_RESULTS = ("failure", "error")
+
+
+def parse_csv_report(content):
+    """Parses an ANTA CSV report into a list of result dicts with the keys of COLUMNS."""
+    reader = csv.DictReader(io.StringIO(content))
+    fields = {name.strip().lower(): name for name in reader.fieldnames or []}
+    columns = {}
+    for key, aliases in COLUMNS.items():
+        columns[key] = next((fields[alias] for alias in aliases if alias in fields), None)
+    if columns["device"] is None or columns["test"] is None or columns["result"] is None:
+        raise ValueError(f"Not an ANTA CSV report, columns: {', '.join(reader.fieldnames or [])}")
+    results = []
+    for row in reader:
+        result = {key: (row.get(column) or "").strip() if column else "" for key, column in columns.items()}
+        result["result"] = RESULTS.get(result["result"].lower(), result["result"].lower())
+        results.append(result)
+    return results
+
+
+class AntaResultStore:
+    """Keeps the results of ANTA runs per fabric, indexed by run, device, test category and result.
+
+    A report identical to the latest run of its fabric (same SHA-256) is not stored again,
+    so the same report seen from a job and again from a repository update is one run.
+    Only the newest max_runs runs of each fabric are kept.
+    """
+
+    def __init__(self, db_path, max_runs=100):
+        self.db_path = db_path
+        self.max_runs = max_runs
+        with self._connect() as conn:
+            conn.executescript(SCHEMA)
+
+    @contextmanager
+    def _connect(self):
+        """Yields a short-lived connection that commits on success and is always closed."""
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA foreign_keys = ON")
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def record(self, fabric, content, commit_id=None):
+        """Stores a CSV report as a new run. Returns (run id, True if it was new)."""
+        report_sha256 = hashlib.sha256(content.encode("utf-8")).hexdigest()
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT id, report_sha256 FROM anta_runs WHERE fabric = ? ORDER BY id DESC LIMIT 1", (fabric,)
+            ).fetchone()
+            if row is not None and row["report_sha256"] == report_sha256:
+                return row["id"], False
+        results = parse_csv_report(content)
+        with self._connect() as conn:
+            run_id = conn.execute(
+                "INSERT INTO anta_runs (fabric, commit_id, report_sha256, created_at) VALUES (?, ?, ?, ?)",
+                (fabric, commit_id, report_sha256, time.time()),
+            ).lastrowid
+            conn.executemany(
+                "INSERT INTO anta_results (run_id, device, category, test, description, result, messages) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [(run_id, r["device"], r["category"], r["test"], r["description"], r["result"], r["messages"]) for r in results],
+            )
+            conn.execute(
+                "DELETE FROM anta_runs WHERE fabric = ? AND id NOT IN "
+                "(SELECT id FROM anta_runs WHERE fabric = ? ORDER BY id DESC LIMIT ?)",
+                (fabric, fabric, self.max_runs),
+            )
+        return run_id, True
+
+    def _summary(self, conn, run):
+        counts = dict(conn.execute(
+            "SELECT result, COUNT(*) FROM anta_results WHERE run_id = ? GROUP BY result", (run["id"],)
+        ).fetchall())
+        devices = conn.execute("SELECT COUNT(DISTINCT device) FROM anta_results WHERE run_id = ?", (run["id"],)).fetchone()[0]
+        return {
+            "id": run["id"],
+            "fabric": run["fabric"],
+            "commit": run["commit_id"],
+            "created_at": datetime.fromtimestamp(run["created_at"]).isoformat(),
+            "devices": devices,
+            "results": counts,
+        }
+
+    def runs(self, fabric=None, limit=20):
+        """Returns the newest runs with their result counts."""
+        query = "SELECT * FROM anta_runs"
+        params = []
+        if fabric:
+            query += " WHERE fabric = ?"
+            params.append(fabric)
+        query += " ORDER BY id DESC LIMIT ?"
+        params.append(limit)
+        with self._connect() as conn:
+            return [self._summary(conn, run) for run in conn.execute(query, params).fetchall()]
+
+    def run(self, run_id=None, fabric=None):
+        """Returns the summary of a run, or of the latest run of fabric when run_id is None."""
+        with self._connect() as conn:
+            if run_id is None:
+                run = conn.execute("SELECT * FROM anta_runs WHERE fabric = ? ORDER BY id DESC LIMIT 1", (fabric,)).fetchone()
+            else:
+                run = conn.execute("SELECT * FROM anta_runs WHERE id = ?", (run_id,)).fetchone()
+            return self._summary(conn, run) if run else None
+
+    def failures(self, run_id, device=None, category=None):
+        """Returns the failed and errored tests of a run, grouped by device."""
+        query = "SELECT device, category, test, description, result, messages FROM anta_results WHERE run_id = ? AND result IN (?, ?)"
+        params = [run_id, *FAILED_RESULTS]
+        if device:
+            query += " AND device = ?"
+            params.append(device)
+        if category:
+            query += " AND category = ?"
+            params.append(category)
+        by_device = {}
+        with self._connect() as conn:
+            for row in conn.execute(query + " ORDER BY device, category, test", params):
+                result = dict(row)
+                by_device.setdefault(result.pop("device"), []).append(result)
+        return by_device
+
+    def diff(self, run_id):
+        """Compares a run with the previous run of its fabric.
+
+        Returns the tests whose result changed, and the tests that are new or gone. Only the
+        devices tested in this run are compared, so a run limited to a few devices does not
+        report the tests of all other devices as gone.
+        """
+        with self._connect() as conn:
+            run = conn.execute("SELECT * FROM anta_runs WHERE id = ?", (run_id,)).fetchone()
+            if run is None:
+                return None
+            previous = conn.execute(
+                "SELECT id FROM anta_runs WHERE fabric = ? AND id < ? ORDER BY id DESC LIMIT 1", (run["fabric"], run_id)
+            ).fetchone()
+            current = self._results(conn, run_id)
+            before = self._results(conn, previous["id"]) if previous else {}
+        devices = {key[0] for key in current}
+        before = {key: value for key, value in before.items() if key[0] in devices}
+        changed, added, removed = [], [], []
+        for key, result in current.items():
+            if key not in before:
+                added.append(self._entry(key, result))
+            elif before[key] != result:
+                changed.append(dict(self._entry(key, result), previous=before[key]))
+        for key, result in before.items():
+            if key not in current:
+                removed.append(self._entry(key, result))
+        return {
+            "run": run_id,
+            "previous_run": previous["id"] if previous else None,
+            "changed": changed,
+            "added": added,
+            "removed": removed,
+        }
+
+    @staticmethod
+    def _results(conn, run_id):
+        rows = conn.execute(
+            "SELECT device, category, test, description, result FROM anta_results WHERE run_id = ?", (run_id,)
+        ).fetchall()
+        return {(row["device"], row["category"], row["test"], row["description"]): row["result"] for row in rows}
+
+    @staticmethod
+    def _entry(key, result):
+        device, category, test, description = key
+        return {"device": device, "category": category, "test": test, "description": description, "result": result}
@@ -0,0 +1,137 @@
+"""Works out which devices an ANTA run has to validate after a change.
+
+A device is validated when its intended config or structured config changed since the
+last validated commit, together with its BGP and MLAG peers and directly connected
+devices (their sessions and links involve the changed device as well). Changes to the
+custom ANTA catalogs or to the ANTA playbooks require a run over the whole fabric.
+
+Only needs the standard library and PyYAML, so the CI runner can use it as well:
+
+    python webhook_server/anta_scope.py --intended-dir intended --state reports/.validated_commit
+
+prints "all" for a full run, nothing if no device changed, or else the comma-separated
+devices to pass to ansible-playbook --limit.
+"""
+import argparse
+import os
+import subprocess
+import sys
+
+import yaml
+
+# A change below any of these paths affects the tests of every device
+FULL_RUN_PATHS = ("anta.yml", "dev-anta.yml", "custom_anta_catalogs/", "dev_custom_anta_catalogs/")
+CONFIG_SUFFIXES = {"configs": (".cfg",), "structured_configs": (".yml", ".yaml")}
+
+
+def needs_full_run(changed_files):
+    return any(path == spec or path.startswith(spec) for path in changed_files for spec in FULL_RUN_PATHS)
+
+
+def changed_devices(changed_files, intended_dir="intended"):
+    """Returns the devices whose intended config or structured config is among changed_files."""
+    devices = set()
+    for path in changed_files:
+        directory, file_name = os.path.split(path)
+        for subdir, suffixes in CONFIG_SUFFIXES.items():
+            stem, suffix = os.path.splitext(file_name)
+            if directory == f"{intended_dir}/{subdir}" and suffix in suffixes:
+                devices.add(stem)
+    return devices
+
+
+def structured_config_peers(structured_config):
+    """Returns the hostnames a structured config refers to as link, MLAG or BGP peer."""
+    peers = set()
+    for section in ("ethernet_interfaces", "port_channel_interfaces"):
+        for interface in structured_config.get(section) or []:
+            if interface.get("peer"):
+                peers.add(interface["peer"])
+    for neighbor in (structured_config.get("router_bgp") or {}).get("neighbors") or []:
+        if neighbor.get("peer"):
+            peers.add(neighbor["peer"])
+    return peers
+
+
+def load_neighbors(structured_configs_dir):
+    """Returns the devices with a structured config and a map of every device to its peers, in both directions."""
+    devices = set()
+    neighbors = {}
+    if not os.path.isdir(structured_configs_dir):
+        return devices, neighbors
+    for file_name in sorted(os.listdir(structured_configs_dir)):
+        device, suffix = os.path.splitext(file_name)
+        if suffix not in CONFIG_SUFFIXES["structured_configs"]:
+            continue
+        with open(os.path.join(structured_configs_dir, file_name)) as f:
+            structured_config = yaml.safe_load(f) or {}
+        devices.add(device)
+        for peer in structured_config_peers(structured_config):
+            neighbors.setdefault(device, set()).add(peer)
+            neighbors.setdefault(peer, set()).add(device)
+    return devices, neighbors
+
+
+def validation_scope(changed_files, root, intended_dir="intended"):
+    """Returns None for a full run, else the sorted devices to validate (empty if nothing changed)."""
+    if needs_full_run(changed_files):
+        return None
+    devices, neighbors = load_neighbors(os.path.join(root, intended_dir, "structured_configs"))
+    scope = set()
+    for device in changed_devices(changed_files, intended_dir):
+        scope.add(device)
+        scope.update(neighbors.get(device, ()))
+    # Removed devices, and peers outside the fabric, cannot be validated
+    return sorted(scope & devices)
+
+
+def read_validated_commit(state_file):
+    try:
+        with open(state_file) as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def write_validated_commit(state_file, commit):
+    os.makedirs(os.path.dirname(state_file) or ".", exist_ok=True)
+    with open(state_file, "w") as f:
+        f.write(f"{commit}\n")
+
+
+def _git_changed_files(root, since):
+    result = subprocess.run(
+        ["git", "diff", "--name-only", "--no-renames", since, "HEAD"], cwd=root, capture_output=True, text=True
+    )
+    if result.returncode != 0:
+        return None
+    return result.stdout.splitlines()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--root", default=".", help="Root of the repository checkout")
+    parser.add_argument("--intended-dir", default="intended", help="AVD output directory of the fabric")
+    parser.add_argument("--state", required=True, help="File holding the last validated commit")
+    parser.add_argument("--record", action="store_true", help="Write the current HEAD to the state file and exit")
+    args = parser.parse_args()
+
+    state_file = os.path.join(args.root, args.state)
+    if args.record:
+        head = subprocess.run(["git", "rev-parse", "HEAD"], cwd=args.root, capture_output=True, text=True, check=True)
+        write_validated_commit(state_file, head.stdout.strip())
+        return 0
+
+    since = read_validated_commit(state_file)
+    changed_files = _git_changed_files(args.root, since) if since else None
+    if changed_files is None:
+        # Nothing validated yet, or the commit is not in this clone
+        print("all")
+        return 0
+    scope = validation_scope(changed_files, args.root, args.intended_dir)
+    print("all" if scope is None else ",".join(scope))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
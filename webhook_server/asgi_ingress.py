@@ -0,0 +1,205 @@
+import asyncio
+import inspect
+import json
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from email.utils import formatdate, parsedate_to_datetime
+from urllib.parse import parse_qsl
+
+
+class Headers:
+    """Case-insensitive, read-only view of the request headers of an ASGI scope."""
+
+    def __init__(self, raw_headers):
+        self._headers = {}
+        for name, value in raw_headers:
+            self._headers.setdefault(name.decode("latin-1").lower(), value.decode("latin-1"))
+
+    def get(self, name, default=None):
+        return self._headers.get(name.lower(), default)
+
+    def __getitem__(self, name):
+        return self._headers[name.lower()]
+
+    def __contains__(self, name):
+        return name.lower() in self._headers
+
+
+class Request:
+    def __init__(self, scope, body):
+        self.method = scope["method"]
+        self.path = scope["path"]
+        self.args = dict(parse_qsl(scope.get("query_string", b"").decode("latin-1")))
+        self.headers = Headers(scope.get("headers", []))
+        self.body = body
+
+    def best_encoding(self, encodings):
+        """Picks the first of encodings that Accept-Encoding allows with the highest quality, like Flask's best_match."""
+        accepted = {}
+        for item in self.headers.get("Accept-Encoding", "").split(","):
+            name, _, params = item.strip().partition(";")
+            if not name:
+                continue
+            quality = 1.0
+            for param in params.split(";"):
+                key, _, value = param.strip().partition("=")
+                if key == "q":
+                    try:
+                        quality = float(value)
+                    except ValueError:
+                        quality = 0.0
+            accepted[name.strip().lower()] = quality
+        best, best_quality = "identity", 0.0
+        for encoding in encodings:
+            quality = accepted.get(encoding, accepted.get("*", 0.0))
+            if quality > best_quality:
+                best, best_quality = encoding, quality
+        return best
+
+    def is_fresh(self, etag, last_modified=None):
+        """True if the client's copy (If-None-Match, else If-Modified-Since) still matches etag/last_modified."""
+        if_none_match = self.headers.get("If-None-Match")
+        if if_none_match is not None:
+            # Weak comparison, as for GET requests
+            tags = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+            return "*" in tags or f'"{etag}"' in tags
+        if_modified_since = self.headers.get("If-Modified-Since")
+        if if_modified_since and last_modified is not None:
+            try:
+                return int(last_modified) <= parsedate_to_datetime(if_modified_since).timestamp()
+            except (TypeError, ValueError):
+                return False
+        return False
+
+
+class Response:
+    def __init__(self, body=b"", status=200, headers=None, content_type="application/json"):
+        self.body = body
+        self.status = status
+        self.headers = dict(headers or {})
+        if content_type:
+            self.headers.setdefault("Content-Type", content_type)
+
+    @classmethod
+    def json(cls, data, status=200, headers=None):
+        return cls(json.dumps(data).encode("utf-8"), status, headers)
+
+    def set_etag(self, etag, weak=False):
+        self.headers["ETag"] = f'{"W/" if weak else ""}"{etag}"'
+
+    def set_last_modified(self, timestamp):
+        self.headers["Last-Modified"] = formatdate(timestamp, usegmt=True)
+
+    def make_conditional(self, request, etag, last_modified=None):
+        """Turns a 200 into an empty 304 when the client already has this version."""
+        if self.status == 200 and request.is_fresh(etag, last_modified):
+            self.status = 304
+            self.body = b""
+            self.headers.pop("Content-Type", None)
+            self.headers.pop("Content-Encoding", None)
+        return self
+
+
+class BackgroundConsole:
+    """Prints to a rich Console from a daemon thread, so request handlers never wait on the terminal."""
+
+    def __init__(self, console):
+        self.console = console
+        self._queue = queue.SimpleQueue()
+        threading.Thread(target=self._run, name="console", daemon=True).start()
+
+    def print(self, *args, **kwargs):
+        self._queue.put((args, kwargs))
+
+    def _run(self):
+        while True:
+            args, kwargs = self._queue.get()
+            try:
+                self.console.print(*args, **kwargs)
+            except Exception:
+                pass
+
+
+class IngressApp:
+    """Minimal asyncio (ASGI) front-end for the hot endpoints of the sync server.
+
+    Routes registered here are answered on the event loop, or, with offload=True, on a
+    small thread pool (for handlers that touch SQLite). Any other path is passed on to
+    the WSGI fallback app, which runs in its own threads.
+    """
+
+    def __init__(self, fallback=None, executor_threads=8, fallback_threads=16):
+        self.fallback = fallback
+        self.executor_threads = executor_threads
+        self.fallback_threads = fallback_threads
+        self.routes = {}
+        self._executor = None
+        self._fallback_app = None
+
+    def route(self, method, path, offload=False):
+        def decorator(handler):
+            self.routes[(method, path)] = (handler, offload)
+            return handler
+        return decorator
+
+    async def run_in_executor(self, function, *args):
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.executor_threads, thread_name_prefix="ingress")
+        return await asyncio.get_running_loop().run_in_executor(self._executor, function, *args)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            while True:
+                message = await receive()
+                if message["type"] == "lifespan.startup":
+                    await send({"type": "lifespan.startup.complete"})
+                elif message["type"] == "lifespan.shutdown":
+                    if self._executor is not None:
+                        self._executor.shutdown(wait=False)
+                    await send({"type": "lifespan.shutdown.complete"})
+                    return
+        if scope["type"] != "http":
+            return
+
+        route = self.routes.get((scope["method"], scope["path"]))
+        if route is None:
+            if self._fallback_app is None:
+                await self._send(send, Response.json({"error": "Not found"}, 404))
+                return
+            await self._fallback_app(scope, receive, send)
+            return
+
+        handler, offload = route
+        body = b""
+        while True:
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                return
+            body += message.get("body", b"")
+            if not message.get("more_body"):
+                break
+        request = Request(scope, body)
+        if inspect.iscoroutinefunction(handler):
+            response = await handler(request)
+        elif offload:
+            response = await self.run_in_executor(handler, request)
+        else:
+            response = handler(request)
+        await self._send(send, response)
+
+    @staticmethod
+    async def _send(send, response):
+        headers = [(name.lower().encode("latin-1"), str(value).encode("latin-1")) for name, value in response.headers.items()]
+        headers.append((b"content-length", str(len(response.body)).encode("latin-1")))
+        await send({"type": "http.response.start", "status": response.status, "headers": headers})
+        await send({"type": "http.response.body", "body": response.body})
+
+    def serve(self, host, port):
+        """Serves the app with uvicorn. Raises ImportError if uvicorn or a2wsgi are not installed."""
+        import uvicorn
+        from a2wsgi import WSGIMiddleware
+
+        if self.fallback is not None:
+            self._fallback_app = WSGIMiddleware(self.fallback, workers=self.fallback_threads)
+        uvicorn.run(self, host=host, port=port, log_level="warning", access_log=False)
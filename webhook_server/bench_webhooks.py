@@ -0,0 +1,316 @@
+"""Load test for the sync webhook server, without Ansible, NetBox or Gitea.
+
+Starts sync_netbox_avd_cvaas.py as a subprocess against a throwaway repository whose
+origin is a local bare git remote, with a stub ansible-playbook first on the PATH that
+sleeps for --playbook-seconds and changes a file. Then fires HMAC-signed vlan_created,
+manual_sync and run_anta_test webhooks at /webhook from --concurrency threads, waits
+until the queue is drained and reports acceptance latency percentiles, job throughput,
+queue wait and the peak RSS of the server.
+
+    python bench_webhooks.py --requests 500 --concurrency 32 --mix vlan_created=8,manual_sync=1,run_anta_test=1
+
+Server settings (JOB_WORKERS, JOB_CONCURRENCY, SERVER_MODE, ...) are taken from the
+environment, so capacity changes can be compared run against run.
+"""
+import argparse
+import hashlib
+import hmac
+import json
+import os
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import requests
+from rich.console import Console
+from rich.table import Table
+
+console = Console()
+
+SERVER_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "sync_netbox_avd_cvaas.py")
+SECRET = "bench-secret"
+GIT_IDENTITY = {
+    "GIT_AUTHOR_NAME": "bench", "GIT_AUTHOR_EMAIL": "bench@localhost",
+    "GIT_COMMITTER_NAME": "bench", "GIT_COMMITTER_EMAIL": "bench@localhost",
+}
+
+STUB_PLAYBOOK = '''#!{python}
+"""Stands in for ansible-playbook: prints a few lines, sleeps and changes the files the real playbook would."""
+import os, sys, time, uuid
+playbook = next((arg for arg in sys.argv[1:] if arg.endswith(".yml") and arg != "inventory.yml"), "playbook.yml")
+print(f"PLAY [{{playbook}}] (benchmark stub) " + "*" * 40, flush=True)
+time.sleep(float(os.environ.get("BENCH_PLAYBOOK_SECONDS", "0.5")))
+if "anta" in playbook:
+    os.makedirs("reports", exist_ok=True)
+    with open("reports/ANDREAS_FABRIC-state.csv", "w") as f:
+        f.write("Device,Test Name,Test Status,Message(s),Test description,Test category\\n")
+        f.write(f"bench-leaf1,VerifyUptime,{{'success' if uuid.uuid4().int % 4 else 'failure'}},,uptime,system\\n")
+else:
+    os.makedirs("bench", exist_ok=True)
+    with open(os.path.join("bench", os.path.basename(playbook) + ".out"), "w") as f:
+        f.write(uuid.uuid4().hex + "\\n")
+print("PLAY RECAP *********", flush=True)
+'''
+
+
+def git(*args, cwd=None):
+    subprocess.run(["git", *args], cwd=cwd, check=True, capture_output=True, env=dict(os.environ, **GIT_IDENTITY))
+
+
+def create_workspace(root):
+    """Creates the bare remote, the main checkout (REPO_PATH) and the stub ansible-playbook."""
+    remote = os.path.join(root, "remote.git")
+    repo = os.path.join(root, "repo")
+    git("init", "-q", "--bare", "-b", "main", remote)
+    git("clone", "-q", remote, repo)
+    for directory in ("status", "reports", "group_vars", "intended/test_catalogs"):
+        os.makedirs(os.path.join(repo, directory), exist_ok=True)
+    with open(os.path.join(repo, "inventory.yml"), "w") as f:
+        f.write("all: {}\n")
+    with open(os.path.join(repo, "status", "latest_cvaas_cc_job.name"), "w") as f:
+        f.write("bench\n")
+    with open(os.path.join(repo, "reports", "ANDREAS_FABRIC-state.md"), "w") as f:
+        f.write("# Benchmark report\n")
+    # The ANTA job commits this directory along with the reports
+    with open(os.path.join(repo, "intended", "test_catalogs", "bench-leaf1-catalog.yml"), "w") as f:
+        f.write("anta.tests.system:\n  - VerifyUptime:\n      minimum: 1\n")
+    git("add", "-A", cwd=repo)
+    git("commit", "-q", "-m", "Benchmark seed", cwd=repo)
+    git("push", "-q", "origin", "HEAD:main", cwd=repo)
+
+    bin_dir = os.path.join(root, "bin")
+    os.makedirs(bin_dir)
+    stub = os.path.join(bin_dir, "ansible-playbook")
+    with open(stub, "w") as f:
+        f.write(STUB_PLAYBOOK.format(python=sys.executable))
+    os.chmod(stub, 0o755)
+    env_file = os.path.join(root, "env.sh")
+    with open(env_file, "w") as f:
+        f.write("# benchmark: nothing to source\n")
+    return repo, bin_dir, env_file
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_server(root, repo, bin_dir, env_file, port, args):
+    env = dict(os.environ)
+    env.update({
+        "NETBOX_WEBHOOK_SECRET": SECRET,
+        "GITEA_WEBHOOK_SECRET": SECRET,
+        "REPO_PATH": repo,
+        "ENV_FILE": env_file,
+        "SERVER_PORT": str(port),
+        "JOB_DB_PATH": os.path.join(root, "jobs.db"),
+        "WORKTREE_DIR": os.path.join(root, "worktrees"),
+        "TRACE_FILE": os.path.join(root, "traces.jsonl"),
+        "ANSIBLE_ENGINE": "subprocess",
+        # Stage fingerprints would query NetBox
+        "SYNC_STAGE_CACHE": "false",
+        "JOB_QUEUE_MAX_DEPTH": str(args.max_depth),
+        "BENCH_PLAYBOOK_SECONDS": str(args.playbook_seconds),
+        "PATH": bin_dir + os.pathsep + env.get("PATH", ""),
+        **GIT_IDENTITY,
+    })
+    if args.coalesce_window is not None:
+        env["SYNC_COALESCE_WINDOW"] = str(args.coalesce_window)
+    log = open(os.path.join(root, "server.log"), "w")
+    process = subprocess.Popen(
+        [sys.executable, SERVER_SCRIPT], cwd=os.path.dirname(SERVER_SCRIPT), env=env,
+        stdout=log, stderr=subprocess.STDOUT,
+    )
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"The server exited with code {process.returncode}, see {log.name}")
+        try:
+            requests.get(f"http://127.0.0.1:{port}/jobs?limit=1", timeout=1)
+            return process
+        except requests.ConnectionError:
+            time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError(f"The server did not start within 60 seconds, see {log.name}")
+
+
+def parse_mix(value):
+    mix = {}
+    for item in value.split(","):
+        event, _, weight = item.partition("=")
+        mix[event.strip()] = int(weight or 1)
+    return mix
+
+
+def build_payload(event, n):
+    payload = {"event": event, "timestamp": datetime.utcnow().isoformat(), "bench_id": uuid.uuid4().hex}
+    if event == "vlan_created":
+        payload["data"] = {"vlan_db_id": 10000 + n, "vlan_tag_id": 100 + n % 3900}
+    return json.dumps(payload).encode("utf-8")
+
+
+def fire(url, events, concurrency):
+    """Posts one signed webhook per event from concurrency threads. Returns [(event, status, seconds)]."""
+    local = threading.local()
+
+    def post(item):
+        n, event = item
+        if not hasattr(local, "session"):
+            local.session = requests.Session()
+        body = build_payload(event, n)
+        headers = {
+            "Content-Type": "application/json",
+            "X-Hook-Signature": hmac.new(SECRET.encode("utf-8"), body, hashlib.sha512).hexdigest(),
+        }
+        started = time.perf_counter()
+        try:
+            status = local.session.post(url, data=body, headers=headers, timeout=60).status_code
+        except requests.RequestException:
+            status = None
+        return event, status, time.perf_counter() - started
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        return list(pool.map(post, enumerate(events)))
+
+
+def wait_for_drain(base_url, timeout):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        depth = requests.get(f"{base_url}/jobs?limit=1", timeout=10).json()["depth"]
+        if depth["queued"] == 0 and depth["running"] == 0:
+            return True
+        time.sleep(0.5)
+    return False
+
+
+def peak_rss_kb(pid):
+    """Peak resident set size of a process in kB (VmHWM, Linux only)."""
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+
+def percentile(values, fraction):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(fraction * (len(values) - 1))))]
+
+
+def summarize(results, jobs, fire_seconds, rss_kb):
+    latencies = [seconds for _, status, seconds in results if status is not None]
+    statuses = {}
+    for _, status, _ in results:
+        statuses[status] = statuses.get(status, 0) + 1
+    timestamps = lambda job, field: datetime.fromisoformat(job[field]).timestamp() if job.get(field) else None
+    finished = [job for job in jobs if job["finished_at"]]
+    waits = [timestamps(job, "started_at") - timestamps(job, "created_at") for job in finished]
+    runtimes = [timestamps(job, "finished_at") - timestamps(job, "started_at") for job in finished]
+    span = (
+        max(timestamps(job, "finished_at") for job in finished) - min(timestamps(job, "created_at") for job in finished)
+        if finished else 0
+    )
+    kinds = {}
+    for job in jobs:
+        key = f"{job['kind']}/{job['status']}"
+        kinds[key] = kinds.get(key, 0) + 1
+    return {
+        "requests": len(results),
+        "requests_per_second": len(results) / fire_seconds if fire_seconds else None,
+        "status_codes": {str(status): count for status, count in sorted(statuses.items(), key=str)},
+        "accept_latency_ms": {
+            name: round(percentile(latencies, fraction) * 1000, 2) if latencies else None
+            for name, fraction in (("p50", 0.5), ("p90", 0.9), ("p99", 0.99), ("max", 1.0))
+        },
+        "jobs": kinds,
+        "jobs_per_second": len(finished) / span if span else None,
+        "queue_wait_s": {
+            name: round(percentile(waits, fraction), 2) if waits else None
+            for name, fraction in (("p50", 0.5), ("p90", 0.9), ("max", 1.0))
+        },
+        "job_runtime_s_avg": round(sum(runtimes) / len(runtimes), 2) if runtimes else None,
+        "server_peak_rss_mb": round(rss_kb / 1024, 1) if rss_kb else None,
+    }
+
+
+def print_summary(summary):
+    table = Table(title="Webhook server benchmark")
+    table.add_column("Metric", style="cyan")
+    table.add_column("Value", style="bold")
+    for key, value in summary.items():
+        if isinstance(value, dict):
+            value = ", ".join(f"{name}={item}" for name, item in value.items())
+        elif isinstance(value, float):
+            value = f"{value:.2f}"
+        table.add_row(key, str(value))
+    console.print(table)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=200, help="Number of webhooks to send")
+    parser.add_argument("--concurrency", type=int, default=16, help="Number of webhooks in flight at the same time")
+    parser.add_argument("--mix", default="vlan_created=8,manual_sync=1,run_anta_test=1", help="Weighted event types")
+    parser.add_argument("--playbook-seconds", type=float, default=0.5, help="Runtime of every stub playbook")
+    parser.add_argument("--coalesce-window", type=float, help="SYNC_COALESCE_WINDOW of the server (default: environment)")
+    parser.add_argument("--max-depth", type=int, default=10000, help="JOB_QUEUE_MAX_DEPTH of the server")
+    parser.add_argument("--drain-timeout", type=float, default=600, help="Seconds to wait for the queue to drain")
+    parser.add_argument("--seed", type=int, default=1, help="Seed of the event order")
+    parser.add_argument("--json", help="Also write the results as JSON to this file")
+    parser.add_argument("--keep", action="store_true", help="Keep the temporary workspace and server log")
+    args = parser.parse_args()
+
+    mix = parse_mix(args.mix)
+    rng = random.Random(args.seed)
+    events = rng.choices(list(mix), weights=list(mix.values()), k=args.requests)
+
+    root = tempfile.mkdtemp(prefix="webhook-bench-")
+    process = None
+    try:
+        repo, bin_dir, env_file = create_workspace(root)
+        port = free_port()
+        console.print(f"[bold blue]BENCH: Starting server on port {port} (workspace {root})[/bold blue]")
+        process = start_server(root, repo, bin_dir, env_file, port, args)
+        base_url = f"http://127.0.0.1:{port}"
+
+        console.print(f"[bold blue]BENCH: Sending {args.requests} webhooks with concurrency {args.concurrency}[/bold blue]")
+        started = time.perf_counter()
+        results = fire(f"{base_url}/webhook", events, args.concurrency)
+        fire_seconds = time.perf_counter() - started
+
+        console.print("[bold blue]BENCH: Waiting for the queue to drain[/bold blue]")
+        if not wait_for_drain(base_url, args.drain_timeout):
+            console.print("[bold yellow]BENCH: ⚠️ Queue not drained before the timeout, job numbers are partial[/bold yellow]")
+        jobs = requests.get(f"{base_url}/jobs?limit={args.requests + 100}", timeout=30).json()["jobs"]
+        summary = summarize(results, jobs, fire_seconds, peak_rss_kb(process.pid))
+        print_summary(summary)
+        if args.json:
+            with open(args.json, "w") as f:
+                json.dump(summary, f, indent=2)
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait(timeout=30)
+        if args.keep:
+            console.print(f"[bold yellow]BENCH: Workspace kept in {root}[/bold yellow]")
+        else:
+            shutil.rmtree(root, ignore_errors=True)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,69 @@
+import hashlib
+import sqlite3
+import time
+from contextlib import contextmanager
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS deliveries (
+    key TEXT PRIMARY KEY,
+    job_id INTEGER,
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS deliveries_created_idx ON deliveries (created_at);
+"""
+
+
+def delivery_key(source, headers, body, header_names=("X-Delivery-ID",)):
+    """Identifies a webhook delivery by its delivery id header, or else by a digest of the raw body."""
+    for name in header_names:
+        if headers.get(name):
+            return f"{source}:id:{headers[name]}"
+    return f"{source}:sha256:{hashlib.sha256(body).hexdigest()}"
+
+
+class DeliveryStore:
+    """Remembers which webhook deliveries were already accepted, and the job each one queued.
+
+    Keys are forgotten after ttl seconds, so the table stays small and a genuinely
+    repeated event (e.g. a manual redelivery the next day) is processed again.
+    """
+
+    def __init__(self, db_path, ttl=86400):
+        self.db_path = db_path
+        self.ttl = ttl
+        with self._connect() as conn:
+            conn.executescript(SCHEMA)
+
+    @contextmanager
+    def _connect(self):
+        """Yields a short-lived connection that commits on success and is always closed."""
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def claim(self, key):
+        """Claims a delivery key. Returns (True, None) for a new delivery, else (False, job_id of the first one)."""
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute("DELETE FROM deliveries WHERE created_at < ?", (now - self.ttl,))
+            inserted = conn.execute(
+                "INSERT OR IGNORE INTO deliveries (key, job_id, created_at) VALUES (?, NULL, ?)", (key, now)
+            ).rowcount
+            if inserted:
+                return True, None
+            row = conn.execute("SELECT job_id FROM deliveries WHERE key = ?", (key,)).fetchone()
+        return False, row["job_id"] if row else None
+
+    def record(self, key, job_id):
+        """Stores the job a claimed delivery queued (or was merged into)."""
+        with self._connect() as conn:
+            conn.execute("UPDATE deliveries SET job_id = ? WHERE key = ?", (job_id, key))
+
+    def release(self, key):
+        """Forgets a claimed delivery that could not be queued, so a retry is processed."""
+        with self._connect() as conn:
+            conn.execute("DELETE FROM deliveries WHERE key = ?", (key,))
@@ -0,0 +1,155 @@
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+
+from rich.console import Console
+
+console = Console()
+
+
+class CachedFile:
+    """Keeps the content and SHA-256 hash of a file in memory until the file changes.
+
+    While a FileWatcher watches the file the cache is trusted until the watcher reports a
+    change. Without one, every access compares the file's mtime, size and inode (a single
+    stat call) and only re-reads the file when they differ.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.watched = False
+        self._lock = threading.Lock()
+        self._generation = 0
+        self._cached_generation = None
+        self._stat_key = None
+        self._snapshot = None
+
+    def invalidate(self):
+        with self._lock:
+            self._generation += 1
+
+    def _stat_key_now(self):
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return (st.st_mtime_ns, st.st_size, st.st_ino)
+
+    def cached(self):
+        """Returns (True, snapshot) while a watched file has not changed, else (False, None).
+
+        Never touches the disk, so it can be called on an event loop; on a miss call
+        snapshot() in an executor.
+        """
+        with self._lock:
+            if self.watched and self._cached_generation == self._generation:
+                return True, self._snapshot
+        return False, None
+
+    def snapshot(self):
+        """Returns a dict with 'hash', 'content' (bytes) and 'mtime', or None if the file is missing."""
+        with self._lock:
+            generation = self._generation
+            if self._cached_generation == generation and self.watched:
+                return self._snapshot
+        stat_key = self._stat_key_now()
+        with self._lock:
+            if self._cached_generation == generation and stat_key == self._stat_key:
+                return self._snapshot
+        snapshot = None
+        if stat_key is not None:
+            try:
+                with open(self.path, 'rb') as f:
+                    content = f.read()
+                snapshot = {
+                    "hash": hashlib.sha256(content).hexdigest(),
+                    "content": content,
+                    "mtime": stat_key[0] / 1e9,
+                }
+            except FileNotFoundError:
+                stat_key = None
+        with self._lock:
+            # A change reported while we were reading leaves the cache invalid for the next call
+            self._cached_generation = generation
+            self._stat_key = stat_key
+            self._snapshot = snapshot
+        return snapshot
+
+
+class FileWatcher:
+    """Invalidates CachedFile objects on filesystem change notifications (via the optional watchdog package)."""
+
+    def __init__(self):
+        self._files = {}
+        self._observer = None
+
+    def watch(self, cached_file):
+        self._files[os.path.realpath(cached_file.path)] = cached_file
+        return cached_file
+
+    def start(self):
+        try:
+            from watchdog.events import FileSystemEventHandler
+            from watchdog.observers import Observer
+        except ImportError:
+            console.print("[bold yellow]WATCH: ⚠️ watchdog is not installed, checking file mtimes on every request instead[/bold yellow]")
+            return
+
+        files = self._files
+
+        class Handler(FileSystemEventHandler):
+            def on_any_event(self, event):
+                for path in (event.src_path, getattr(event, "dest_path", "")):
+                    cached_file = files.get(os.path.realpath(path)) if path else None
+                    if cached_file is not None:
+                        cached_file.invalidate()
+
+        self._observer = Observer()
+        directories = {}
+        for path, cached_file in self._files.items():
+            directory = os.path.dirname(path)
+            if os.path.isdir(directory):
+                directories.setdefault(directory, []).append(cached_file)
+        for directory, cached_files in directories.items():
+            self._observer.schedule(Handler(), directory, recursive=False)
+            for cached_file in cached_files:
+                # Drop whatever was cached before the watch was in place
+                cached_file.invalidate()
+                cached_file.watched = True
+        self._observer.daemon = True
+        self._observer.start()
+        console.print(f"[bold green]WATCH: ✔️ Watching {len(directories)} directories for file changes[/bold green]")
+
+
+class RenderCache:
+    """Memoizes representations derived from file content (rendered, compressed), keyed by e.g. the file hash.
+
+    Only the most recently used max_entries results are kept.
+    """
+
+    def __init__(self, max_entries=16):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Returns the cached value for key, or None."""
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                return self._entries[key]
+        return None
+
+    def get_or_create(self, key, factory):
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                return self._entries[key]
+        # Built outside the lock; two threads racing on a new key just both build it once
+        value = factory()
+        with self._lock:
+            self._entries[key] = value
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return value
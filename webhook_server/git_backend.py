@@ -0,0 +1,269 @@
+import os
+import subprocess
+import threading
+import uuid
+from contextlib import contextmanager
+from urllib.parse import urlparse
+
+from rich.console import Console
+
+try:
+    import pygit2
+except ImportError:
+    pygit2 = None
+
+console = Console()
+
+
+class GitError(Exception):
+    """Raised when a git operation fails, with the git output in stderr."""
+
+    def __init__(self, message, stderr=""):
+        super().__init__(message)
+        self.stderr = stderr or message
+
+
+class CliGitBackend:
+    """Runs git operations by executing the git binary in the repository or worktree directory."""
+
+    name = "cli"
+
+    def _git(self, path, *args, check=True):
+        result = subprocess.run(["git", *args], cwd=path, capture_output=True, text=True)
+        if check and result.returncode != 0:
+            raise GitError(f"git {' '.join(args)} failed with exit code {result.returncode}", result.stderr)
+        return result
+
+    def resolve(self, path, rev):
+        """Returns the commit id rev points to, or None if it does not exist."""
+        result = self._git(path, "rev-parse", "--verify", "--quiet", f"{rev}^{{commit}}", check=False)
+        return result.stdout.strip() if result.returncode == 0 else None
+
+    def is_ancestor(self, path, ancestor, descendant):
+        return self._git(path, "merge-base", "--is-ancestor", ancestor, descendant, check=False).returncode == 0
+
+    def changed_files(self, path, old, new="HEAD"):
+        """Returns the paths that differ between two commits; a rename counts as a deletion and an addition."""
+        return self._git(path, "diff", "--name-only", "--no-renames", old, new).stdout.splitlines()
+
+    def status(self, path, pathspecs=None):
+        """Returns the paths with staged, unstaged or untracked changes, optionally limited to pathspecs."""
+        output = self._git(path, "status", "--porcelain", "--", *(pathspecs or [])).stdout
+        return [line[3:] for line in output.splitlines() if line]
+
+    def add(self, path, pathspecs=None):
+        """Stages new, modified and deleted files, like git add ."""
+        self._git(path, "add", "--all", "--", *(pathspecs or ["."]))
+
+    def commit(self, path, message):
+        """Commits the index on top of HEAD. Returns the new commit id, or None if nothing changed."""
+        if self._git(path, "diff", "--cached", "--quiet", check=False).returncode == 0:
+            return None
+        self._git(path, "commit", "-q", "-m", message)
+        return self.resolve(path, "HEAD")
+
+    def fetch(self, path, remote="origin"):
+        self._git(path, "fetch", remote)
+
+    def push(self, path, remote, refspec):
+        self._git(path, "push", remote, refspec)
+
+    def reset_detached(self, path, rev):
+        """Detaches HEAD at rev and makes the working tree match it, dropping untracked files."""
+        self._git(path, "checkout", "--detach", "--force", rev)
+        self._git(path, "clean", "-fdq")
+
+    def fast_forward(self, path, branch, target):
+        """Checks out branch and fast-forwards it to target; fails if that is not a fast-forward."""
+        if self._git(path, "symbolic-ref", "--short", "-q", "HEAD", check=False).stdout.strip() != branch:
+            self._git(path, "checkout", branch)
+        self._git(path, "merge", "--ff-only", target)
+
+
+class Pygit2GitBackend(CliGitBackend):
+    """Runs git operations in-process with libgit2, keeping one open repository per directory.
+
+    Fetch and push reuse one set of credentials: GIT_REMOTE_USERNAME/GIT_REMOTE_PASSWORD
+    for HTTPS remotes, the SSH agent for SSH remotes. If libgit2 cannot authenticate (e.g.
+    the remote relies on a git credential helper), network operations fall back to the git
+    binary for the rest of the run.
+    """
+
+    name = "pygit2"
+
+    def __init__(self):
+        self._repos = {}
+        self._repos_lock = threading.Lock()
+        self._cli_network = False
+        self._username = os.environ.get("GIT_REMOTE_USERNAME")
+        self._password = os.environ.get("GIT_REMOTE_PASSWORD")
+
+    @contextmanager
+    def _open(self, path):
+        """Yields the cached repository of path; libgit2 repositories must not be shared between threads."""
+        path = os.path.realpath(path)
+        with self._repos_lock:
+            entry = self._repos.get(path)
+            if entry is None:
+                entry = self._repos[path] = (pygit2.Repository(path), threading.RLock())
+        repo, lock = entry
+        with lock:
+            yield repo
+
+    def forget(self, path):
+        """Drops the cached repository of a worktree that is being removed."""
+        with self._repos_lock:
+            entry = self._repos.pop(os.path.realpath(path), None)
+        if entry is not None:
+            with entry[1]:
+                entry[0].free()
+
+    def _credentials(self, url, username_from_url, allowed_types):
+        if allowed_types & pygit2.enums.CredentialType.USERPASS_PLAINTEXT and self._username and self._password:
+            return pygit2.UserPass(self._username, self._password)
+        if allowed_types & pygit2.enums.CredentialType.SSH_KEY:
+            return pygit2.KeypairFromAgent(username_from_url or urlparse(url).username or "git")
+        return None
+
+    def _callbacks(self):
+        return pygit2.RemoteCallbacks(credentials=self._credentials)
+
+    def _network(self, operation, path, *args):
+        if self._cli_network:
+            return getattr(super(), operation)(path, *args)
+        try:
+            return getattr(self, f"_{operation}")(path, *args)
+        except pygit2.GitError as e:
+            if "auth" not in str(e).lower() and "credential" not in str(e).lower():
+                raise GitError(f"git {operation} failed: {e}") from e
+            console.print(f"[bold yellow]GIT: ⚠️ libgit2 could not authenticate ({e}), using the git binary for fetch/push[/bold yellow]")
+            self._cli_network = True
+            return getattr(super(), operation)(path, *args)
+
+    def resolve(self, path, rev):
+        with self._open(path) as repo:
+            try:
+                return str(repo.revparse_single(rev).peel(pygit2.Commit).id)
+            except (KeyError, ValueError, pygit2.GitError):
+                return None
+
+    def is_ancestor(self, path, ancestor, descendant):
+        if ancestor == descendant:
+            return True
+        with self._open(path) as repo:
+            return repo.descendant_of(descendant, ancestor)
+
+    def changed_files(self, path, old, new="HEAD"):
+        with self._open(path) as repo:
+            try:
+                diff = repo.diff(repo.revparse_single(old), repo.revparse_single(new))
+            except (KeyError, ValueError, pygit2.GitError) as e:
+                raise GitError(f"git diff {old} {new} failed: {e}") from e
+            paths = set()
+            for delta in diff.deltas:
+                paths.add(delta.old_file.path)
+                paths.add(delta.new_file.path)
+        return sorted(paths)
+
+    @staticmethod
+    def _matches(file_path, pathspecs):
+        return not pathspecs or any(
+            file_path == spec.rstrip("/") or file_path.startswith(spec.rstrip("/") + "/") for spec in pathspecs
+        )
+
+    def status(self, path, pathspecs=None):
+        changed = []
+        with self._open(path) as repo:
+            statuses = repo.status()
+        for file_path, flags in statuses.items():
+            if flags & pygit2.enums.FileStatus.IGNORED or flags == pygit2.enums.FileStatus.CURRENT:
+                continue
+            if self._matches(file_path, pathspecs):
+                changed.append(file_path)
+        return changed
+
+    def add(self, path, pathspecs=None):
+        with self._open(path) as repo:
+            index = repo.index
+            index.read()
+            index.add_all(pathspecs or [])
+            # add_all only sees files on disk, deleted files have to be removed from the index
+            for file_path, flags in repo.status().items():
+                if flags & pygit2.enums.FileStatus.WT_DELETED and self._matches(file_path, pathspecs):
+                    index.remove(file_path)
+            index.write()
+
+    def commit(self, path, message):
+        with self._open(path) as repo:
+            index = repo.index
+            index.read()
+            tree = index.write_tree()
+            head = repo.head.peel(pygit2.Commit)
+            if tree == head.tree_id:
+                return None
+            signature = repo.default_signature
+            return str(repo.create_commit("HEAD", signature, signature, message, tree, [head.id]))
+
+    def fetch(self, path, remote="origin"):
+        self._network("fetch", path, remote)
+
+    def _fetch(self, path, remote):
+        with self._open(path) as repo:
+            repo.remotes[remote].fetch(callbacks=self._callbacks())
+
+    def push(self, path, remote, refspec):
+        self._network("push", path, remote, refspec)
+
+    def _push(self, path, remote, refspec):
+        source, _, destination = refspec.partition(":")
+        if not destination.startswith("refs/"):
+            destination = f"refs/heads/{destination}"
+        rejected = []
+        callbacks = self._callbacks()
+        callbacks.push_update_reference = lambda ref, status: rejected.append(f"{ref}: {status}") if status else None
+        with self._open(path) as repo:
+            temporary = None
+            if source == "HEAD":
+                # libgit2 only pushes references, so a detached HEAD goes through a temporary one.
+                # Worktrees share refs/, hence the unique name.
+                temporary = source = f"refs/push-tmp/{uuid.uuid4().hex}"
+                repo.references.create(source, repo.head.target, force=True)
+            try:
+                repo.remotes[remote].push([f"{source}:{destination}"], callbacks=callbacks)
+            finally:
+                if temporary:
+                    repo.references.delete(temporary)
+        if rejected:
+            raise GitError(f"git push rejected: {', '.join(rejected)}")
+
+    def reset_detached(self, path, rev):
+        with self._open(path) as repo:
+            commit = repo.revparse_single(rev).peel(pygit2.Commit)
+            repo.checkout_tree(
+                commit, strategy=pygit2.enums.CheckoutStrategy.FORCE | pygit2.enums.CheckoutStrategy.REMOVE_UNTRACKED
+            )
+            repo.set_head(commit.id)
+
+    def fast_forward(self, path, branch, target):
+        with self._open(path) as repo:
+            head = repo.head.target
+            if not self.is_ancestor(path, str(head), target):
+                raise GitError(f"{target} is not a fast-forward of {head}")
+            commit = repo.get(target)
+            try:
+                repo.checkout_tree(commit, strategy=pygit2.enums.CheckoutStrategy.SAFE)
+            except pygit2.GitError as e:
+                raise GitError(f"Could not check out {target}: {e}") from e
+            repo.references.create(f"refs/heads/{branch}", commit.id, force=True)
+            repo.set_head(f"refs/heads/{branch}")
+
+
+def create_git_backend(mode="auto"):
+    """Returns the in-process pygit2 backend when available (or requested), else the git binary backend."""
+    if mode in ("auto", "pygit2") and pygit2 is not None:
+        return Pygit2GitBackend()
+    if mode == "pygit2":
+        raise ImportError("GIT_BACKEND=pygit2 requires the pygit2 package")
+    if mode == "auto":
+        console.print("[bold yellow]GIT: ⚠️ pygit2 is not installed, running the git binary for every operation[/bold yellow]")
+    return CliGitBackend()
@@ -0,0 +1,72 @@
+import threading
+from collections import OrderedDict, deque
+
+from job_queue import current_job_id
+
+
+class JobLog:
+    """A bounded ring buffer of output lines for one job that readers can tail while it grows.
+
+    Every line gets a sequence number, so a reader that fell behind by more than the buffer
+    size simply continues with the oldest line still kept.
+    """
+
+    def __init__(self, max_lines):
+        self._lines = deque(maxlen=max_lines)
+        self._next_seq = 0
+        self._closed = False
+        self._cond = threading.Condition()
+
+    def append(self, line):
+        with self._cond:
+            self._lines.append((self._next_seq, line))
+            self._next_seq += 1
+            self._cond.notify_all()
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    def read(self, since=0, timeout=None):
+        """Returns (entries, next_since, closed) for lines with a sequence number >= since.
+
+        Blocks for up to timeout seconds while there is nothing new and the log is still open.
+        """
+        with self._cond:
+            if since >= self._next_seq and not self._closed:
+                self._cond.wait(timeout=timeout)
+            entries = [(seq, line) for seq, line in self._lines if seq >= since]
+            next_since = entries[-1][0] + 1 if entries else max(since, self._next_seq)
+            return entries, next_since, self._closed
+
+
+class JobLogRegistry:
+    """Keeps the logs of the most recent jobs; older logs are dropped to keep memory flat."""
+
+    def __init__(self, max_lines=2000, max_jobs=50):
+        self.max_lines = max_lines
+        self.max_jobs = max_jobs
+        self._logs = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, job_id, create=False):
+        with self._lock:
+            log = self._logs.get(job_id)
+            if log is None and create:
+                log = self._logs[job_id] = JobLog(self.max_lines)
+                while len(self._logs) > self.max_jobs:
+                    self._logs.popitem(last=False)
+            return log
+
+    def emit(self, line, job_id=None):
+        """Appends a line to the log of job_id, or of the job the calling thread runs."""
+        job_id = job_id if job_id is not None else current_job_id.get()
+        if job_id is None:
+            return
+        self.get(job_id, create=True).append(line.rstrip("\n"))
+
+    def close(self, job_id):
+        log = self.get(job_id)
+        if log is not None:
+            log.close()
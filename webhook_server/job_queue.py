@@ -0,0 +1,316 @@
+import contextvars
+import json
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+from rich.console import Console
+
+console = Console()
+
+# Id of the job the calling worker thread is executing, for handlers that need it.
+current_job_id = contextvars.ContextVar("current_job_id", default=None)
+
+# Returned by a handler that found nothing to do. The job then finishes as "unchanged";
+# False makes it "failed" and any other result "succeeded".
+UNCHANGED = "unchanged"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    kind TEXT NOT NULL,
+    payload TEXT NOT NULL DEFAULT '{}',
+    status TEXT NOT NULL DEFAULT 'queued',
+    created_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL,
+    error TEXT
+);
+CREATE INDEX IF NOT EXISTS jobs_status_idx ON jobs (status, id);
+"""
+
+# Indexes on migrated columns, created after the migrations ran
+INDEXES = """
+CREATE INDEX IF NOT EXISTS jobs_shard_status_idx ON jobs (shard, status, id);
+"""
+
+# Columns added after the first release, created on existing databases at startup.
+MIGRATIONS = {
+    "run_after": "REAL NOT NULL DEFAULT 0",
+    "coalesce_key": "TEXT",
+    "priority": "INTEGER NOT NULL DEFAULT 0",
+    "shard": "TEXT",
+}
+
+
+class QueueFullError(Exception):
+    """Raised when a job is submitted while the queue is at its depth limit."""
+
+    def __init__(self, message, retry_after=None):
+        super().__init__(message)
+        # Suggested number of seconds before submitting again
+        self.retry_after = retry_after
+
+
+class JobQueue:
+    """A durable job queue stored in SQLite and drained by a fixed pool of worker threads.
+
+    concurrency caps how many jobs of a kind run at the same time, and jobs of kinds with a
+    higher priority are started first, so a backlog of one kind cannot starve another.
+
+    Several queues can share one database as shards: each only sees the jobs of its own
+    shard and has its own workers, depth limit and caps. Job ids stay unique across shards.
+    """
+
+    def __init__(self, db_path, handlers, workers=1, max_depth=50, poll_interval=5, concurrency=None, priorities=None,
+                 shard=None, adopt_unsharded=False):
+        self.db_path = db_path
+        self.shard = shard
+        # Jobs queued before the database was sharded are picked up by this shard
+        self.adopt_unsharded = adopt_unsharded
+        self.handlers = handlers
+        self.workers = workers
+        self.max_depth = max_depth
+        self.poll_interval = poll_interval
+        self.concurrency = concurrency or {}
+        self.priorities = priorities or {}
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition()
+        self._threads = []
+        # Callbacks run by the worker thread: on_start(job) and on_finish(job, status)
+        self.on_start = []
+        self.on_finish = []
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(SCHEMA)
+            columns = {row["name"] for row in conn.execute("PRAGMA table_info(jobs)")}
+            for column, definition in MIGRATIONS.items():
+                if column not in columns:
+                    conn.execute(f"ALTER TABLE jobs ADD COLUMN {column} {definition}")
+            conn.executescript(INDEXES)
+
+    @contextmanager
+    def _connect(self):
+        """Yields a short-lived connection that commits on success and is always closed."""
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    @staticmethod
+    def _to_dict(row):
+        if row is None:
+            return None
+        job = dict(row)
+        job["payload"] = json.loads(job["payload"])
+        for field in ("created_at", "started_at", "finished_at", "run_after"):
+            if job[field] is not None:
+                job[field] = datetime.fromtimestamp(job[field]).isoformat()
+        return job
+
+    def start(self):
+        """Re-queues jobs interrupted by a restart and starts the worker threads."""
+        with self._lock, self._connect() as conn:
+            if self.adopt_unsharded and self.shard is not None:
+                conn.execute("UPDATE jobs SET shard = ? WHERE shard IS NULL", (self.shard,))
+            recovered = conn.execute(
+                "UPDATE jobs SET status = 'queued', started_at = NULL WHERE status = 'running' AND shard IS ?",
+                (self.shard,),
+            ).rowcount
+        if recovered:
+            console.print(f"[bold yellow]JOBS: ♻️ Re-queued {recovered} job(s) interrupted by the last shutdown[/bold yellow]")
+        for i in range(self.workers):
+            name = f"job-worker-{self.shard}-{i + 1}" if self.shard else f"job-worker-{i + 1}"
+            thread = threading.Thread(target=self._worker, name=name, daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        shard = f" for {self.shard}" if self.shard else ""
+        console.print(f"[bold green]JOBS: ✔️ Started {self.workers} worker(s){shard}, queue depth limit {self.max_depth}[/bold green]")
+        if self.concurrency:
+            caps = ", ".join(f"{kind}={cap}" for kind, cap in self.concurrency.items())
+            console.print(f"[bold green]JOBS: ✔️ Concurrency caps: {caps}[/bold green]")
+
+    def submit(self, kind, payload=None, coalesce_key=None, merge=None, delay=0, max_delay=None):
+        """Persists a new job and wakes a worker. Raises QueueFullError when the queue is full.
+
+        When coalesce_key is given and a job with the same key is still queued, the new payload
+        is folded into it with merge(existing, new) instead of creating a second job. Each merge
+        pushes the start of that job back by delay seconds, but never beyond max_delay seconds
+        after it was first queued.
+        """
+        if kind not in self.handlers:
+            raise ValueError(f"No handler registered for job kind '{kind}'")
+        payload = payload or {}
+        now = time.time()
+        with self._lock, self._connect() as conn:
+            if coalesce_key is not None:
+                row = conn.execute(
+                    "SELECT * FROM jobs WHERE status = 'queued' AND coalesce_key = ? AND shard IS ? ORDER BY id LIMIT 1",
+                    (coalesce_key, self.shard),
+                ).fetchone()
+                if row is not None:
+                    merged = merge(json.loads(row["payload"]), payload) if merge else payload
+                    run_after = now + delay
+                    if max_delay is not None:
+                        run_after = min(run_after, row["created_at"] + max_delay)
+                    conn.execute(
+                        "UPDATE jobs SET payload = ?, run_after = ? WHERE id = ?",
+                        (json.dumps(merged), run_after, row["id"]),
+                    )
+                    job = self._to_dict(conn.execute("SELECT * FROM jobs WHERE id = ?", (row["id"],)).fetchone())
+                    job["coalesced"] = True
+                    return job
+            depth = conn.execute(
+                "SELECT COUNT(*) FROM jobs WHERE status = 'queued' AND shard IS ?", (self.shard,)
+            ).fetchone()[0]
+            if depth >= self.max_depth:
+                raise QueueFullError(f"Job queue is full ({depth} queued jobs)", self._retry_after(conn, depth))
+            cursor = conn.execute(
+                "INSERT INTO jobs (kind, payload, created_at, run_after, coalesce_key, priority, shard) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (kind, json.dumps(payload), now, now + delay, coalesce_key, self.priorities.get(kind, 0), self.shard),
+            )
+            job_id = cursor.lastrowid
+        with self._wakeup:
+            self._wakeup.notify()
+        job = self.get(job_id)
+        job["coalesced"] = False
+        return job
+
+    def get(self, job_id):
+        with self._connect() as conn:
+            row = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._to_dict(row)
+
+    def list(self, status=None, limit=50, all_shards=False):
+        """Returns the most recent jobs of this shard (or of every shard), newest first."""
+        conditions = []
+        params = []
+        if not all_shards:
+            conditions.append("shard IS ?")
+            params.append(self.shard)
+        if status:
+            conditions.append("status = ?")
+            params.append(status)
+        query = "SELECT * FROM jobs"
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+        query += " ORDER BY id DESC LIMIT ?"
+        params.append(limit)
+        with self._connect() as conn:
+            rows = conn.execute(query, params).fetchall()
+        return [self._to_dict(row) for row in rows]
+
+    def depth(self):
+        """Returns the number of queued and running jobs."""
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT status, COUNT(*) FROM jobs WHERE status IN ('queued', 'running') AND shard IS ? GROUP BY status",
+                (self.shard,),
+            ).fetchall()
+        counts = {"queued": 0, "running": 0}
+        counts.update({status: count for status, count in rows})
+        return counts
+
+    def _retry_after(self, conn, depth):
+        """Estimates the seconds until the queue has room, from the runtime of recent jobs."""
+        durations = [row[0] for row in conn.execute(
+            "SELECT finished_at - started_at FROM jobs WHERE status IN ('succeeded', 'unchanged', 'failed') "
+            "AND started_at IS NOT NULL AND shard IS ? ORDER BY id DESC LIMIT 20",
+            (self.shard,),
+        )]
+        if not durations:
+            return 30
+        average = sum(durations) / len(durations)
+        # A slot opens when one of the running jobs finishes
+        return int(min(max(average / self.workers, 5), 600))
+
+    def _blocked_kinds(self, conn):
+        """Returns the job kinds that are at their concurrency cap."""
+        running = dict(conn.execute(
+            "SELECT kind, COUNT(*) FROM jobs WHERE status = 'running' AND shard IS ? GROUP BY kind", (self.shard,)
+        ).fetchall())
+        return [kind for kind, cap in self.concurrency.items() if running.get(kind, 0) >= cap]
+
+    def _next_wait(self):
+        """Returns how long an idle worker should sleep before the next startable job is due."""
+        with self._connect() as conn:
+            blocked = self._blocked_kinds(conn)
+            next_run = conn.execute(
+                f"SELECT MIN(run_after) FROM jobs WHERE status = 'queued' AND shard IS ? "
+                f"AND kind NOT IN ({','.join('?' * len(blocked))})",
+                (self.shard, *blocked),
+            ).fetchone()[0]
+        if next_run is None:
+            return self.poll_interval
+        return min(self.poll_interval, max(next_run - time.time(), 0.05))
+
+    def _claim(self):
+        """Atomically moves the due job with the highest priority, oldest first, to running and returns it.
+
+        Jobs of a kind that is at its concurrency cap stay queued.
+        """
+        with self._lock, self._connect() as conn:
+            blocked = self._blocked_kinds(conn)
+            row = conn.execute(
+                f"SELECT * FROM jobs WHERE status = 'queued' AND run_after <= ? AND shard IS ? "
+                f"AND kind NOT IN ({','.join('?' * len(blocked))}) ORDER BY priority DESC, id LIMIT 1",
+                (time.time(), self.shard, *blocked),
+            ).fetchone()
+            if row is None:
+                return None
+            conn.execute(
+                "UPDATE jobs SET status = 'running', started_at = ? WHERE id = ?",
+                (time.time(), row["id"]),
+            )
+        return self.get(row["id"])
+
+    def _finish(self, job_id, status, error=None):
+        with self._lock, self._connect() as conn:
+            conn.execute(
+                "UPDATE jobs SET status = ?, finished_at = ?, error = ? WHERE id = ?",
+                (status, time.time(), error, job_id),
+            )
+        # A job of this kind may have been waiting for the slot that just became free
+        with self._wakeup:
+            self._wakeup.notify_all()
+
+    def _worker(self):
+        while True:
+            job = self._claim()
+            if job is None:
+                with self._wakeup:
+                    self._wakeup.wait(timeout=self._next_wait())
+                continue
+            console.print(f"[bold blue]JOBS: ▶️ Starting job {job['id']} ({job['kind']})[/bold blue]")
+            current_job_id.set(job["id"])
+            self._notify(self.on_start, job)
+            error = None
+            try:
+                result = self.handlers[job["kind"]](**job["payload"])
+                if result is False:
+                    status = "failed"
+                elif result == UNCHANGED:
+                    status = UNCHANGED
+                else:
+                    status = "succeeded"
+            except Exception as e:
+                console.print(f"[bold red]JOBS: ❌ Job {job['id']} raised an error: {e}[/bold red]")
+                status, error = "failed", str(e)
+            self._finish(job["id"], status, error)
+            console.print(f"[bold green]JOBS: ⏹️ Job {job['id']} ({job['kind']}) {status}[/bold green]")
+            self._notify(self.on_finish, job, status)
+            current_job_id.set(None)
+
+    @staticmethod
+    def _notify(callbacks, *args):
+        for callback in callbacks:
+            try:
+                callback(*args)
+            except Exception as e:
+                console.print(f"[bold red]JOBS: ❌ Job callback {callback.__name__} failed: {e}[/bold red]")
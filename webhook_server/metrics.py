@@ -0,0 +1,81 @@
+try:
+    from prometheus_client import CONTENT_TYPE_LATEST, Counter, Gauge, Histogram, generate_latest
+except ImportError:
+    CONTENT_TYPE_LATEST = "text/plain"
+    Counter = Gauge = Histogram = generate_latest = None
+
+# Playbooks and git operations take from seconds to many minutes
+DURATION_BUCKETS = (0.5, 1, 2.5, 5, 10, 20, 30, 60, 120, 300, 600, 1200, 1800, 3600)
+
+
+class _NoopMetric:
+    """Stands in for every metric when prometheus_client is not installed."""
+
+    def labels(self, *args, **kwargs):
+        return self
+
+    def inc(self, amount=1):
+        pass
+
+    def set(self, value):
+        pass
+
+    def set_function(self, function):
+        pass
+
+    def observe(self, amount):
+        pass
+
+    def time(self):
+        return self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def __call__(self, function):
+        return function
+
+
+def _metric(cls, name, documentation, labelnames=(), **kwargs):
+    if cls is None:
+        return _NoopMetric()
+    return cls(name, documentation, labelnames, **kwargs)
+
+
+ENABLED = generate_latest is not None
+
+GIT_SECONDS = _metric(
+    Histogram, "netbox_avd_git_seconds", "Time spent in git operations",
+    ["operation"], buckets=DURATION_BUCKETS,
+)
+PLAYBOOK_SECONDS = _metric(
+    Histogram, "netbox_avd_playbook_seconds", "Runtime of a single Ansible playbook",
+    ["playbook", "result"], buckets=DURATION_BUCKETS,
+)
+ANTA_RUN_SECONDS = _metric(
+    Histogram, "netbox_avd_anta_run_seconds", "Runtime of a complete ANTA job, including git",
+    buckets=DURATION_BUCKETS,
+)
+JOB_SECONDS = _metric(
+    Histogram, "netbox_avd_job_seconds", "Runtime of a job from start to finish",
+    ["kind", "status"], buckets=DURATION_BUCKETS,
+)
+WEBHOOKS_TOTAL = _metric(
+    Counter, "netbox_avd_webhooks_total",
+    "Webhooks by source and outcome (accepted, ignored, rejected, or failed when the queued job failed)",
+    ["source", "outcome"],
+)
+STAGE_CACHE_TOTAL = _metric(
+    Counter, "netbox_avd_stage_cache_total", "Sync stages skipped (hit) or run (miss) based on their input fingerprint",
+    ["stage", "result"],
+)
+QUEUE_DEPTH = _metric(Gauge, "netbox_avd_queue_depth", "Jobs waiting in the queue of a fabric", ["fabric"])
+ACTIVE_JOBS = _metric(Gauge, "netbox_avd_active_jobs", "Jobs of a fabric currently running", ["fabric"])
+
+
+def render_metrics():
+    """Returns (body, content type) of the current metrics in the Prometheus text format."""
+    return generate_latest(), CONTENT_TYPE_LATEST
@@ -0,0 +1,139 @@
+import hashlib
+import json
+import os
+import sqlite3
+import time
+from contextlib import contextmanager
+
+import requests
+from rich.console import Console
+
+console = Console()
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS stage_cache (
+    stage TEXT NOT NULL,
+    fingerprint TEXT NOT NULL,
+    outputs TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    PRIMARY KEY (stage, fingerprint)
+);
+"""
+
+
+def netbox_query_state(session, netbox_url, endpoint, params):
+    """Returns the object count and newest last_updated of a NetBox list query, fetching one object."""
+    response = session.get(
+        f"{netbox_url.rstrip('/')}/api/{endpoint}/",
+        params=list(params) + [("ordering", "-last_updated"), ("limit", "1")],
+        timeout=10,
+    )
+    response.raise_for_status()
+    data = response.json()
+    results = data.get("results") or [{}]
+    return {"count": data.get("count"), "last_updated": results[0].get("last_updated")}
+
+
+class StageCache:
+    """Remembers the output files of sync stages, keyed by a fingerprint of everything a stage reads.
+
+    A stage's fingerprint covers the contents of its input files (playbook, templates,
+    scripts and upstream outputs) and, for every NetBox query it makes, the number of
+    matching objects and the newest last_updated among them. Creating, changing or
+    deleting an object therefore changes the fingerprint. Entries older than ttl seconds
+    are ignored, which bounds the staleness from changes NetBox does not stamp on the
+    queried objects themselves (e.g. a renamed VLAN referenced by an interface).
+    """
+
+    def __init__(self, db_path, netbox_env, ttl=3600, keep=5):
+        self.db_path = db_path
+        # Environment holding NETBOX_URL, NETBOX_TOKEN and NETBOX_CERT, looked up on use
+        self.netbox_env = netbox_env
+        self.ttl = ttl
+        self.keep = keep
+        with self._connect() as conn:
+            conn.executescript(SCHEMA)
+
+    @contextmanager
+    def _connect(self):
+        """Yields a short-lived connection that commits on success and is always closed."""
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def fingerprint(self, name, stage, workdir):
+        """Returns the fingerprint of a stage's inputs in workdir, or None if NetBox could not be queried."""
+        digest = hashlib.sha256(name.encode())
+        for path in [stage["playbook"], *stage.get("inputs", [])]:
+            digest.update(f"\0file {path}\0".encode())
+            try:
+                with open(os.path.join(workdir, path), 'rb') as f:
+                    digest.update(f.read())
+            except FileNotFoundError:
+                digest.update(b"\0missing")
+        queries = stage.get("netbox", [])
+        if queries:
+            env = self.netbox_env()
+            try:
+                with requests.Session() as session:
+                    session.headers["Authorization"] = f"Token {env['NETBOX_TOKEN']}"
+                    session.headers["Accept"] = "application/json"
+                    session.verify = env.get("NETBOX_CERT") or True
+                    for endpoint, params in queries:
+                        state = netbox_query_state(session, env["NETBOX_URL"], endpoint, params)
+                        digest.update(f"\0netbox {endpoint} {sorted(params)} {json.dumps(state)}".encode())
+            except (KeyError, requests.exceptions.RequestException, ValueError) as e:
+                console.print(f"[bold yellow]STAGES: ⚠️ Could not fingerprint NetBox inputs of {name}, running it: {e}[/bold yellow]")
+                return None
+        return digest.hexdigest()
+
+    def lookup(self, name, fingerprint):
+        """Returns the cached {path: content} outputs for the fingerprint, or None."""
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT outputs FROM stage_cache WHERE stage = ? AND fingerprint = ? AND created_at >= ?",
+                (name, fingerprint, time.time() - self.ttl),
+            ).fetchone()
+        return json.loads(row["outputs"]) if row else None
+
+    def store(self, name, fingerprint, outputs):
+        """Stores the outputs of a stage run and keeps only the most recent entries per stage."""
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO stage_cache (stage, fingerprint, outputs, created_at) VALUES (?, ?, ?, ?)",
+                (name, fingerprint, json.dumps(outputs), time.time()),
+            )
+            conn.execute(
+                "DELETE FROM stage_cache WHERE stage = ? AND fingerprint NOT IN "
+                "(SELECT fingerprint FROM stage_cache WHERE stage = ? ORDER BY created_at DESC LIMIT ?)",
+                (name, name, self.keep),
+            )
+
+    @staticmethod
+    def read_outputs(stage, workdir):
+        """Returns {path: content} of the stage's output files in workdir (None for missing files)."""
+        outputs = {}
+        for path in stage.get("outputs", []):
+            try:
+                with open(os.path.join(workdir, path), 'r', encoding='utf-8') as f:
+                    outputs[path] = f.read()
+            except FileNotFoundError:
+                outputs[path] = None
+        return outputs
+
+    @staticmethod
+    def restore_outputs(outputs, workdir):
+        """Writes cached output files into workdir, exactly as the stage would have left them."""
+        for path, content in outputs.items():
+            target = os.path.join(workdir, path)
+            if content is None:
+                if os.path.exists(target):
+                    os.remove(target)
+                continue
+            os.makedirs(os.path.dirname(target) or workdir, exist_ok=True)
+            with open(target, 'w', encoding='utf-8') as f:
+                f.write(content)
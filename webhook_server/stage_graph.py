@@ -0,0 +1,112 @@
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from contextvars import copy_context
+
+from rich.console import Console
+
+console = Console()
+
+
+class StageGraphError(Exception):
+    """Raised when a stage graph references unknown stages or contains a cycle."""
+
+
+def validate_stage_graph(stages):
+    """Checks that every dependency exists and the graph is acyclic. Returns a topological order."""
+    for name, stage in stages.items():
+        for dep in stage.get("needs", []):
+            if dep not in stages:
+                raise StageGraphError(f"Stage '{name}' needs unknown stage '{dep}'")
+    order, visiting, done = [], set(), set()
+
+    def visit(name, path):
+        if name in done:
+            return
+        if name in visiting:
+            raise StageGraphError(f"Stage graph has a cycle: {' -> '.join(path + [name])}")
+        visiting.add(name)
+        for dep in stages[name].get("needs", []):
+            visit(dep, path + [name])
+        visiting.discard(name)
+        done.add(name)
+        order.append(name)
+
+    for name in stages:
+        visit(name, [])
+    return order
+
+
+def critical_path(stages, durations):
+    """Returns (seconds, [stage, ...]) for the longest dependency chain of the measured durations."""
+    finish, previous = {}, {}
+    for name in validate_stage_graph(stages):
+        if name not in durations:
+            continue
+        deps = [dep for dep in stages[name].get("needs", []) if dep in finish]
+        slowest = max(deps, key=lambda dep: finish[dep], default=None)
+        finish[name] = durations[name] + (finish[slowest] if slowest else 0)
+        previous[name] = slowest
+    if not finish:
+        return 0.0, []
+    name = max(finish, key=finish.get)
+    total, path = finish[name], []
+    while name:
+        path.append(name)
+        name = previous[name]
+    return total, list(reversed(path))
+
+
+def run_stage_graph(stages, run_stage, max_parallel=4):
+    """Runs every stage once all of its needs succeeded, independent stages concurrently.
+
+    run_stage(name, stage) must return True on success. After the first failure no new
+    stage is started; stages already running are allowed to finish. Returns
+    (ok, durations) where durations maps each finished stage to its runtime in seconds.
+    """
+    validate_stage_graph(stages)
+    pending = dict(stages)
+    succeeded, durations, running = set(), {}, {}
+    failed = None
+
+    def timed(name, stage):
+        started = time.monotonic()
+        try:
+            return run_stage(name, stage)
+        finally:
+            durations[name] = time.monotonic() - started
+
+    with ThreadPoolExecutor(max_workers=max_parallel, thread_name_prefix="stage") as executor:
+        while pending or running:
+            if failed is None:
+                for name, stage in list(pending.items()):
+                    if all(dep in succeeded for dep in stage.get("needs", [])):
+                        del pending[name]
+                        # Stage threads inherit the job context of the calling worker
+                        running[executor.submit(copy_context().run, timed, name, stage)] = name
+            if not running:
+                break
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                name = running.pop(future)
+                try:
+                    ok = future.result()
+                except Exception as e:
+                    console.print(f"[bold red]STAGES: ❌ Stage {name} raised an error: {e}[/bold red]")
+                    ok = False
+                if ok:
+                    succeeded.add(name)
+                elif failed is None:
+                    failed = name
+                    console.print(f"[bold red]STAGES: ❌ Stage {name} failed, not starting any further stages[/bold red]")
+    return failed is None and not pending, durations
+
+
+def report_stage_timings(stages, durations, wall_time):
+    """Prints the per-stage runtimes, the critical path and the time saved against a sequential run."""
+    for name, seconds in durations.items():
+        console.print(f"[bold cyan]STAGES: ⏱️ {name}: {seconds:.1f}s[/bold cyan]")
+    path_time, path = critical_path(stages, durations)
+    console.print(
+        f"[bold cyan]STAGES: ⏱️ Wall time {wall_time:.1f}s, critical path {' -> '.join(path) or 'N/A'} "
+        f"{path_time:.1f}s, sequential sum {sum(durations.values()):.1f}s[/bold cyan]"
+    )
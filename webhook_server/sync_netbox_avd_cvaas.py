@@ -3,15 +3,45 @@ import os
 import hmac
 import hashlib
 import sys
+import tempfile
+import json
+import threading
+import gzip
+import html
+import functools
+import shutil
 import requests 
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify, stream_with_context
 from rich import print
 from rich.console import Console
-from datetime import datetime
-import threading
+from datetime import datetime, timezone
 import time
 from waitress import serve
 from dotenv import load_dotenv
+from job_queue import UNCHANGED, JobQueue, QueueFullError, current_job_id
+from worktrees import WorktreePool
+from git_backend import GitError, create_git_backend
+from stage_graph import report_stage_timings, run_stage_graph, validate_stage_graph
+from ansible_engine import AnsibleEngine
+from job_logs import JobLogRegistry
+from file_cache import CachedFile, FileWatcher, RenderCache
+from stage_cache import StageCache
+from delivery_store import DeliveryStore, delivery_key
+import anta_scope
+from anta_results import AntaResultStore
+from asgi_ingress import BackgroundConsole, IngressApp, Response as IngressResponse
+import metrics
+import tracing
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    from markdown_it import MarkdownIt
+except ImportError:
+    MarkdownIt = None
 
 # --- Load Environment Variables ---
 load_dotenv() 
@@ -19,20 +49,183 @@ load_dotenv()
 # Flask app setup
 app = Flask(__name__)
 console = Console()
+# Console for the per-request messages; printed from a background thread in asgi mode
+request_console = console
 
 # --- CONFIGURATION ---
 NETBOX_WEBHOOK_SECRET = os.environ.get("NETBOX_WEBHOOK_SECRET")
 GITEA_WEBHOOK_SECRET = os.environ.get("GITEA_WEBHOOK_SECRET")
 
-ENV_FILE = "/home/andreasm/environment/netbox-env.sh"
-REPO_PATH = "/home/andreasm/avd_cv_deploy_cvaas"
-ANTA_PLAYBOOK = f"{REPO_PATH}/anta.yml"
-PLAYBOOKS = [
-    f"{REPO_PATH}/1-playbook-update_inventory-dev-prod.yml",
-    f"{REPO_PATH}/2-playbook-update_dc1_yml_according_to_inventory.yml",
-    f"{REPO_PATH}/3-playbook-update_network_services.yml",
-    f"{REPO_PATH}/4-playbook-update_connected_endpoints.yml"
-]
+ENV_FILE = os.environ.get("ENV_FILE", "/home/andreasm/environment/netbox-env.sh")
+REPO_PATH = os.environ.get("REPO_PATH", "/home/andreasm/avd_cv_deploy_cvaas")
+SERVER_PORT = int(os.environ.get("SERVER_PORT", "5000"))
+
+# Sync stages and what they depend on. Playbook 2 reads the inventory.yml written by
+# playbook 1; playbooks 3 and 4 only talk to NetBox and run alongside the others.
+# "inputs" (files besides the playbook) and "netbox" (API list queries) are everything a
+# stage reads, "outputs" what it writes. A stage whose inputs are unchanged since an
+# earlier run gets its cached outputs restored instead of running its playbook.
+DC1_DEVICES = [("site", "dc1")]
+SYNC_STAGES = {
+    "inventory": {
+        "playbook": "1-playbook-update_inventory-dev-prod.yml",
+        "needs": [],
+        "inputs": ["scripts/update_inventory.py", "scripts/netbox_client.py", "scripts/netbox_snapshot.py", "templates/inventory.yml.j2", "netbox_env.sh"],
+        "netbox": [("dcim/devices", DC1_DEVICES + [("role", "spine"), ("role", "l3leaf"), ("role", "l2leaf")])],
+        "outputs": ["inventory.yml", "dev-inventory.yml"],
+    },
+    "dc1": {
+        "playbook": "2-playbook-update_dc1_yml_according_to_inventory.yml",
+        "needs": ["inventory"],
+        "inputs": ["templates/update_dc1.j2", "inventory.yml", "group_vars/DC1.yml"],
+        "outputs": ["group_vars/DC1.yml"],
+    },
+    "network_services": {
+        "playbook": "3-playbook-update_network_services.yml",
+        "needs": [],
+        "inputs": ["templates/network_services.j2", "netbox_env.sh", "lookup_plugins/netbox_api.py", "scripts/netbox_client.py",
+                   "scripts/netbox_snapshot.py"],
+        "netbox": [
+            ("ipam/vlans", [("site", "dc1")]),
+            ("ipam/prefixes", []),
+            ("ipam/vrfs", []),
+            ("ipam/ip-addresses", [("role", "anycast")]),
+            ("dcim/devices", DC1_DEVICES + [("role", "l3leaf")]),
+            ("dcim/interfaces", DC1_DEVICES),
+        ],
+        "outputs": ["group_vars/NETWORK_SERVICES.yml"],
+    },
+    "connected_endpoints": {
+        "playbook": "4-playbook-update_connected_endpoints.yml",
+        "needs": [],
+        "inputs": ["templates/connected_endpoints.j2", "netbox_env.sh", "lookup_plugins/netbox_api.py", "scripts/netbox_client.py",
+                   "scripts/netbox_snapshot.py"],
+        "netbox": [
+            ("dcim/devices", DC1_DEVICES),
+            ("dcim/interfaces", DC1_DEVICES + [("tag", "endpoint")]),
+        ],
+        "outputs": ["group_vars/CONNECTED_ENDPOINTS.yml"],
+    },
+}
+SYNC_MAX_PARALLEL_STAGES = int(os.environ.get("SYNC_MAX_PARALLEL_STAGES", "4"))
+SYNC_STAGE_CACHE = os.environ.get("SYNC_STAGE_CACHE", "true").lower() in ("1", "true", "yes")
+SYNC_STAGE_CACHE_TTL = float(os.environ.get("SYNC_STAGE_CACHE_TTL", "3600"))
+validate_stage_graph(SYNC_STAGES)
+
+# Job queue: webhooks are persisted here and executed by a bounded pool of workers.
+# Every job runs in its own git worktree, so workers do not interfere with each other.
+JOB_DB_PATH = os.environ.get("JOB_DB_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "jobs.db"))
+JOB_WORKERS = int(os.environ.get("JOB_WORKERS", "2"))
+JOB_QUEUE_MAX_DEPTH = int(os.environ.get("JOB_QUEUE_MAX_DEPTH", "50"))
+
+
+def parse_kind_map(value):
+    """Parses "kind=number,kind=number" into a dict."""
+    return {kind.strip(): int(number) for kind, number in (item.split("=", 1) for item in value.split(",") if item.strip())}
+
+
+# Admission control: at most JOB_CONCURRENCY jobs of a kind run at the same time, and
+# queued jobs with a higher JOB_PRIORITIES value start first, so an ANTA run never waits
+# behind a backlog of syncs.
+JOB_CONCURRENCY = parse_kind_map(os.environ.get("JOB_CONCURRENCY", "sync=1,anta=1,repo_update=1"))
+JOB_PRIORITIES = parse_kind_map(os.environ.get("JOB_PRIORITIES", "anta=10,repo_update=5,sync=0"))
+# Seconds a webhook delivery is remembered; a repeated delivery within it is not queued again
+DELIVERY_TTL = float(os.environ.get("DELIVERY_TTL", "86400"))
+
+# Fabrics the server syncs and validates. Every fabric is a shard with its own job queue,
+# workers and worktrees, so churn on the dev fabric never delays a production sync.
+# NetBox webhooks are routed by a "fabric" field in the payload (or an X-Fabric header),
+# else by the "site" of the VLAN, else to DEFAULT_FABRIC. Fabrics may share a repository;
+# its main checkout is then kept up to date by the first of them. Playbooks and paths are
+# relative to the root of the worktree a job runs in; "inventory" is the Ansible inventory
+# that defines the fabric's group. Sync events for a fabric without "stages" are ignored.
+FABRICS = {
+    "prod": {
+        "group": "ANDREAS_FABRIC",
+        "repo_path": REPO_PATH,
+        "sites": ["dc1"],
+        "inventory": "inventory.yml",
+        "stages": SYNC_STAGES,
+        "anta_playbook": "anta.yml",
+        "anta_commit_paths": ["reports/", "intended/test_catalogs/"],
+        "intended_dir": "intended",
+        "validated_commit_file": "reports/.validated_commit",
+        "anta_csv_report": "reports/ANDREAS_FABRIC-state.csv",
+    },
+    "dev": {
+        "group": "ANDREAS_DEV_FABRIC",
+        "repo_path": REPO_PATH,
+        "sites": [],
+        "inventory": "dev-inventory.yml",
+        # The sync playbooks generate the prod fabric only; dev has no sync stages yet
+        "stages": {},
+        "anta_playbook": "dev-anta.yml",
+        "anta_commit_paths": ["dev_reports/", "dev_intended/test_catalog/"],
+        "intended_dir": "dev_intended",
+        "validated_commit_file": "dev_reports/.validated_commit",
+        "anta_csv_report": "dev_reports/ANDREAS_DEV_FABRIC-state.csv",
+    },
+}
+DEFAULT_FABRIC = os.environ.get("DEFAULT_FABRIC", "prod")
+# Attempts of an ANTA job to push its reports when main moves under it
+MAIN_PUSH_ATTEMPTS = int(os.environ.get("MAIN_PUSH_ATTEMPTS", "3"))
+# Worker threads per fabric, e.g. "prod=2,dev=1"; fabrics not listed get JOB_WORKERS
+FABRIC_WORKERS = parse_kind_map(os.environ.get("FABRIC_WORKERS", ""))
+
+# "changed" limits an ANTA run to the devices whose intended or structured config changed
+# since the last validated commit (recorded next to the reports), plus their BGP/MLAG and
+# link peers. "full" always validates the whole fabric. A run_anta_test event can override
+# it with a "scope" field.
+ANTA_SCOPE = os.environ.get("ANTA_SCOPE", "full")
+# ANTA runs kept per fabric in the result store of the job database
+ANTA_RESULT_RUNS = int(os.environ.get("ANTA_RESULT_RUNS", "100"))
+
+# Scratch directory for the per-job git worktrees; fabrics other than DEFAULT_FABRIC use a subdirectory
+WORKTREE_DIR = os.environ.get("WORKTREE_DIR", os.path.join(tempfile.gettempdir(), "netbox-avd-worktrees"))
+WORKTREE_MAX_IDLE = int(os.environ.get("WORKTREE_MAX_IDLE", "4"))
+
+# "pygit2" runs status/add/commit/fetch/push in-process with libgit2, "cli" runs the git
+# binary, "auto" prefers pygit2 when it is installed
+GIT_BACKEND = os.environ.get("GIT_BACKEND", "auto")
+
+# How playbooks are executed: "inprocess" forks them from a warm, preloaded ansible-core,
+# "subprocess" runs the ansible-playbook binary, "auto" prefers inprocess when possible.
+# ENV_FILE is sourced once at startup in both modes.
+ANSIBLE_ENGINE = os.environ.get("ANSIBLE_ENGINE", "auto")
+
+# Live job output: the last JOB_LOG_MAX_LINES lines of the last JOB_LOG_MAX_JOBS jobs are
+# kept in memory and can be tailed on /jobs/<id>/stream (Server-Sent Events).
+JOB_LOG_MAX_LINES = int(os.environ.get("JOB_LOG_MAX_LINES", "2000"))
+JOB_LOG_MAX_JOBS = int(os.environ.get("JOB_LOG_MAX_JOBS", "50"))
+STREAM_ALLOW_ORIGIN = os.environ.get("STREAM_ALLOW_ORIGIN", "*")
+SERVER_THREADS = int(os.environ.get("SERVER_THREADS", "16"))
+
+# "waitress" serves everything from SERVER_THREADS threads. "asgi" answers the webhooks,
+# /status and /latest-report from an asyncio event loop (uvicorn) and hands only the
+# SQLite work of a webhook to INGRESS_THREADS threads; the remaining endpoints are served
+# by the Flask app behind it. Falls back to waitress if uvicorn or a2wsgi is missing.
+SERVER_MODE = os.environ.get("SERVER_MODE", "waitress")
+INGRESS_THREADS = int(os.environ.get("INGRESS_THREADS", "8"))
+
+# Files served to the NetBox plugins from the main checkout, cached until they change
+STATUS_FILE = f"{REPO_PATH}/status/latest_cvaas_cc_job.name"
+REPORT_FILE = f"{REPO_PATH}/reports/ANDREAS_FABRIC-state.md"
+# Rendered/compressed variants of the report are kept for the last REPORT_CACHE_ENTRIES
+# combinations of file hash, format and encoding.
+REPORT_CACHE_ENTRIES = int(os.environ.get("REPORT_CACHE_ENTRIES", "16"))
+
+# Sync coalescing: vlan_created/manual_sync events that arrive while a sync is still
+# queued are merged into it. Each merge delays the sync by SYNC_COALESCE_WINDOW seconds,
+# up to SYNC_COALESCE_MAX_WAIT seconds after the first event.
+SYNC_COALESCE_WINDOW = float(os.environ.get("SYNC_COALESCE_WINDOW", "10"))
+SYNC_COALESCE_MAX_WAIT = float(os.environ.get("SYNC_COALESCE_MAX_WAIT", "60"))
+
+# Trace spans of every VLAN rollout (webhook, queue, playbooks, push, and the spans the
+# plugin and the CI jobs post to /traces) are appended to TRACE_FILE as JSON lines; an
+# empty value turns tracing off. /traces only accepts spans with TRACE_COLLECTOR_TOKEN as
+# Bearer token, and none at all while it is unset.
+TRACE_FILE = os.environ.get("TRACE_FILE", os.path.join(os.path.dirname(os.path.abspath(__file__)), "traces.jsonl"))
+TRACE_COLLECTOR_TOKEN = os.environ.get("TRACE_COLLECTOR_TOKEN")
 
 
 def print_startup_sequence():
@@ -54,256 +247,1007 @@ def print_startup_sequence():
     console.print("\r[bold green]🚀 SERVER ONLINE![/bold green]")
     console.print("[bold cyan]====================================[/bold cyan]")
     console.print("[bold white]🔥 Running on all addresses (0.0.0.0)[/bold white]")
-    console.print(f"[bold white]🌍 Network: http://{os.environ.get('SERVER_IP', '10.100.5.11')}:5000[/bold white]")
+    console.print(f"[bold white]🌍 Network: http://{os.environ.get('SERVER_IP', '10.100.5.11')}:{SERVER_PORT}[/bold white]")
     console.print("[bold cyan]====================================[/bold cyan]")
     console.print("[bold red]Press CTRL+C to shut down the galaxy![/bold red]")
 
 
-def run_ansible_playbooks(vlan_tag_id=None):
-    """Runs the list of Ansible playbooks, passing the VLAN Tag ID."""
-    for playbook in PLAYBOOKS:
-        try:
-            playbook_name = os.path.basename(playbook)
-            print(f"[bold blue]🚀 Running Ansible Playbook: {playbook_name} for VLAN Tag {vlan_tag_id or 'N/A'}[/bold blue]")
-            
-            extra_vars = f"-e 'netbox_vlan_id={vlan_tag_id}'" if vlan_tag_id else ""
-            command = f"source {ENV_FILE} && ansible-playbook {playbook} {extra_vars}"
-            
-            result = subprocess.run(
-                ["bash", "-c", command], cwd=REPO_PATH, capture_output=True, text=True
-            )
-            if result.returncode == 0:
-                print(f"[bold green]✔️ Playbook {playbook_name} executed successfully[/bold green]")
-                console.print(f"[bold green]📜 {playbook_name} Output:[/bold green]", style="green")
-                console.print(result.stdout, style="cyan")
-            else:
-                print(f"[bold red]❌ Playbook {playbook_name} failed:[/bold red] {result.stderr}")
-                return False
-        except subprocess.CalledProcessError as e:
-            print(f"[bold red]❌ Error executing playbook {playbook_name}:[/bold red] {e.stderr}")
-            return False
-    return True
+git_backend = create_git_backend(GIT_BACKEND)
+ansible_engine = AnsibleEngine(ENV_FILE, mode=ANSIBLE_ENGINE, config_file=f"{REPO_PATH}/ansible.cfg")
+job_logs = JobLogRegistry(max_lines=JOB_LOG_MAX_LINES, max_jobs=JOB_LOG_MAX_JOBS)
+file_watcher = FileWatcher()
+status_file = file_watcher.watch(CachedFile(STATUS_FILE))
+report_file = file_watcher.watch(CachedFile(REPORT_FILE))
+report_cache = RenderCache(max_entries=REPORT_CACHE_ENTRIES)
 
 
-def create_branch_and_push(vlan_data=None):
-    """Creates a new branch, runs playbooks, commits with BOTH IDs, and pushes."""
-    # Extract IDs from the dictionary if it exists
-    vlan_db_id = vlan_data.get('vlan_db_id') if vlan_data else None
-    vlan_tag_id = vlan_data.get('vlan_tag_id') if vlan_data else None
+def netbox_env():
+    """The sourced ENV_FILE, which holds the NetBox URL and token used for stage fingerprints."""
+    ansible_engine.start()
+    return ansible_engine.env
 
-    branch_name = datetime.now().strftime("sync-%Y%m%d-%H%M%S")
-    print(f"[bold blue]🔀 Preparing branch: {branch_name}[/bold blue]")
+
+stage_cache = StageCache(JOB_DB_PATH, netbox_env=netbox_env, ttl=SYNC_STAGE_CACHE_TTL)
+deliveries = DeliveryStore(JOB_DB_PATH, ttl=DELIVERY_TTL)
+anta_results = AntaResultStore(JOB_DB_PATH, max_runs=ANTA_RESULT_RUNS)
+tracing.configure(path=TRACE_FILE or None, collector_url=None, service="webhook_server")
+
+
+def stream_line(line, prefix):
+    """Sends one line of process output to the console and to the log of the current job."""
+    line = line.rstrip("\n")
+    console.print(f"[{prefix}] {line}", style="cyan", markup=False, highlight=False)
+    job_logs.emit(f"[{prefix}] {line}")
+
+
+def run_ansible_playbook(workdir, playbook, inventory):
+    """Runs a single Ansible playbook in workdir against inventory.
+
+    The sync playbooks regenerate their files from everything in NetBox, so they are not
+    told which VLANs triggered the sync.
+    """
+    playbook_name = os.path.basename(playbook)
     try:
-        os.chdir(REPO_PATH)
-        status_result = subprocess.run(
-            ["git", "status", "--porcelain"], capture_output=True, text=True, check=True
-        )
-        if status_result.stdout.strip():
-            print("[bold red]❌ Main branch has uncommitted changes. Please commit or stash them manually.[/bold red]")
-            return False
-        subprocess.run(["git", "fetch", "origin"], check=True)
-        print(f"[bold green]✔️ Creating new branch: {branch_name}[/bold green]")
-        subprocess.run(["git", "checkout", "-b", branch_name, "origin/main"], check=True)
-        
-        # Pass the VLAN Tag (vid) to the playbook runner
-        if not run_ansible_playbooks(vlan_tag_id=vlan_tag_id):
-            print("[bold red]❌ One or more playbooks failed, aborting Git operations[/bold red]")
-            subprocess.run(["git", "checkout", "main"], check=True)
-            subprocess.run(["git", "branch", "-D", branch_name], check=True)
-            return False
-            
-        subprocess.run(["git", "add", "."], check=True)
-        
-        # Commit message includes BOTH IDs for the Gitea pipeline
-        commit_message = f"Auto-sync triggered at {branch_name}"
-        if vlan_db_id and vlan_tag_id:
-            commit_message += f" for VLAN Tag: {vlan_tag_id} (DB_ID: {vlan_db_id})"
-            
-        commit_result = subprocess.run(
-            ["git", "commit", "-m", commit_message], capture_output=True, text=True
+        print(f"[bold blue]🚀 Running Ansible Playbook: {playbook_name}[/bold blue]")
+        job_logs.emit(f"🚀 Running Ansible Playbook: {playbook_name}")
+
+        # The inventory is passed explicitly: the engine's ansible.cfg is read once at startup
+        argv = ["-i", inventory, playbook]
+
+        started = time.monotonic()
+        returncode, output = ansible_engine.run_playbook(
+            workdir, argv, on_line=lambda line: stream_line(line, playbook_name)
         )
-        if "nothing to commit" in commit_result.stdout.lower():
-            print(f"[bold yellow]⚠️ No changes detected, skipping push.[/bold yellow]")
-            subprocess.run(["git", "checkout", "main"], check=True)
-            subprocess.run(["git", "branch", "-D", branch_name], check=True)
-            print(f"[bold green]✔️ Deleted branch '{branch_name}'[/bold green]")
+        metrics.PLAYBOOK_SECONDS.labels(
+            playbook=playbook_name, result="success" if returncode == 0 else "failure"
+        ).observe(time.monotonic() - started)
+        if returncode == 0:
+            print(f"[bold green]✔️ Playbook {playbook_name} executed successfully[/bold green]")
+            job_logs.emit(f"✔️ Playbook {playbook_name} executed successfully")
+            return True
+        print(f"[bold red]❌ Playbook {playbook_name} failed (exit code {returncode})[/bold red]")
+        job_logs.emit(f"❌ Playbook {playbook_name} failed (exit code {returncode})")
+        return False
+    except Exception as e:
+        print(f"[bold red]❌ Error executing playbook {playbook_name}:[/bold red] {e}")
+        return False
+
+
+def run_sync_stage(workdir, name, stage, inventory):
+    """Runs one sync stage, or restores its cached outputs when its inputs did not change."""
+    with tracing.span(f"sync.stage.{name}", cached=False) as span:
+        if not SYNC_STAGE_CACHE:
+            ok = run_ansible_playbook(workdir, stage["playbook"], inventory)
+            if not ok:
+                span["status"] = "error"
+            return ok
+        fingerprint = stage_cache.fingerprint(name, stage, workdir)
+        outputs = stage_cache.lookup(name, fingerprint) if fingerprint else None
+        if outputs is not None:
+            stage_cache.restore_outputs(outputs, workdir)
+            metrics.STAGE_CACHE_TOTAL.labels(stage=name, result="hit").inc()
+            span["cached"] = True
+            print(f"[bold green]⏭️ Inputs of stage {name} unchanged, skipping {os.path.basename(stage['playbook'])}[/bold green]")
+            job_logs.emit(f"⏭️ Inputs of stage {name} unchanged, skipping {os.path.basename(stage['playbook'])}")
+            return True
+        metrics.STAGE_CACHE_TOTAL.labels(stage=name, result="miss").inc()
+        if not run_ansible_playbook(workdir, stage["playbook"], inventory):
+            span["status"] = "error"
             return False
-            
-        print(f"[bold green]⬆️ Pushing branch: {branch_name} to remote[/bold green]")
-        subprocess.run(["git", "push", "origin", branch_name], check=True)
-        print(f"[bold green]✔️ Successfully pushed branch {branch_name}[/bold green]")
-        subprocess.run(["git", "checkout", "main"], check=True)
+        if fingerprint:
+            stage_cache.store(name, fingerprint, stage_cache.read_outputs(stage, workdir))
         return True
+
+
+def run_ansible_playbooks(workdir, stages, inventory):
+    """Runs the playbooks of stages in workdir, independent stages in parallel, stopping at the first failure."""
+    started = time.monotonic()
+    ok, durations = run_stage_graph(
+        stages,
+        lambda name, stage: run_sync_stage(workdir, name, stage, inventory),
+        max_parallel=SYNC_MAX_PARALLEL_STAGES,
+    )
+    report_stage_timings(stages, durations, time.monotonic() - started)
+    return ok
+
+
+def create_branch_and_push(fabric, vlans=None, traces=None):
+    """Runs playbooks in an isolated worktree, commits with BOTH IDs of every VLAN, and pushes a new branch.
+
+    The trace IDs of the merged events go into the commit message, so the CI pipeline can
+    record its spans under them.
+    """
+    vlans = vlans or []
+    worktree_pool = fabric.worktree_pool
+
+    prefix = "sync" if fabric.name == DEFAULT_FABRIC else f"sync-{fabric.name}"
+    branch_name = datetime.now().strftime(f"{prefix}-%Y%m%d-%H%M%S")
+    if current_job_id.get() is not None:
+        # Jobs run in parallel, so the timestamp alone is not unique
+        branch_name += f"-job{current_job_id.get()}"
+    print(f"[bold blue]🔀 Preparing branch: {branch_name}[/bold blue]")
+    try:
+        with metrics.GIT_SECONDS.labels(operation="fetch").time():
+            worktree_pool.fetch()
+        with worktree_pool.checkout("origin/main") as workdir:
+            print(f"[bold green]✔️ Creating new branch {branch_name} in worktree {workdir}[/bold green]")
+
+            if not run_ansible_playbooks(workdir, fabric.stages, fabric.inventory):
+                print("[bold red]❌ One or more playbooks failed, aborting Git operations[/bold red]")
+                return False
+
+            with metrics.GIT_SECONDS.labels(operation="commit_push").time(), tracing.span("sync.commit_push", branch=branch_name):
+                git_backend.add(workdir)
+
+                # Commit message includes BOTH IDs of every VLAN for the Gitea pipeline
+                commit_message = f"Auto-sync triggered at {branch_name}"
+                if vlans:
+                    commit_message += " for " + ", ".join(
+                        f"VLAN Tag: {vlan['vlan_tag_id']} (DB_ID: {vlan['vlan_db_id']})" for vlan in vlans
+                    )
+                commit_message += tracing.trace_trailer(traces)
+
+                commit_id = git_backend.commit(workdir, commit_message)
+                if commit_id is None:
+                    print(f"[bold yellow]⚠️ No changes detected, skipping push of '{branch_name}'.[/bold yellow]")
+                    job_logs.emit("⚠️ No changes detected, nothing to push")
+                    return UNCHANGED
+                job_logs.emit(f"📝 Committed {commit_id[:12]}: {commit_message.splitlines()[0]}")
+
+                # The worktree has a detached HEAD, so the branch only ever exists on the remote
+                print(f"[bold green]⬆️ Pushing branch: {branch_name} to remote[/bold green]")
+                git_backend.push(workdir, "origin", f"HEAD:refs/heads/{branch_name}")
+            print(f"[bold green]✔️ Successfully pushed branch {branch_name}[/bold green]")
+            job_logs.emit(f"⬆️ Pushed branch {branch_name}")
+            return True
     except Exception as e:
         print(f"[bold red]❌ Git/Ansible process failed: {e}[/bold red]")
-        subprocess.run(["git", "checkout", "main"], check=True)
         return False
 
 
-def run_anta_playbook():
-    """Pulls changes, runs ANTA playbook, and conditionally commits/pushes results."""
-    ALLOWED_PATHS_TO_COMMIT = ["reports/", "intended/test_catalogs/"]
+def anta_limit(fabric, workdir):
+    """Returns the devices an ANTA run in workdir has to validate, or None for the whole fabric."""
+    since = anta_scope.read_validated_commit(os.path.join(workdir, fabric.validated_commit_file))
+    if not since or not git_backend.resolve(workdir, since):
+        console.print("[bold yellow]⚠️ No validated commit recorded, validating the whole fabric[/bold yellow]")
+        return None
+    changed_files = git_backend.changed_files(workdir, since, "HEAD")
+    return anta_scope.validation_scope(changed_files, workdir, fabric.intended_dir)
+
+
+def record_anta_results(fabric, root):
+    """Stores the CSV report of a fabric found below root in the result store (once per report)."""
+    path = os.path.join(root, fabric.anta_csv_report)
     try:
-        console.print(f"[bold blue]🔄 Pulling latest changes from git in {REPO_PATH}...[/bold blue]")
-        subprocess.run(["git", "checkout", "main"], cwd=REPO_PATH, check=True, capture_output=True)
-        subprocess.run(["git", "pull", "origin", "main"], cwd=REPO_PATH, check=True, capture_output=True)
-        console.print("[bold green]✔️ Git pull successful on main branch.[/bold green]")
-        playbook_name = os.path.basename(ANTA_PLAYBOOK)
-        console.print(f"[bold blue]🚀 Running ANTA Playbook: {playbook_name}[/bold blue]")
-        command = f"source {ENV_FILE} && ansible-playbook -i inventory.yml {ANTA_PLAYBOOK}"
-        result = subprocess.run(["bash", "-c", command], cwd=REPO_PATH, capture_output=True, text=True)
-        if result.returncode == 0:
-            console.print(f"[bold green]✔️ Playbook {playbook_name} executed successfully[/bold green]")
+        with open(path, encoding='utf-8') as f:
+            content = f.read()
+        run_id, new = anta_results.record(fabric.name, content, git_backend.resolve(root, "HEAD"))
+    except FileNotFoundError:
+        return None
+    except (ValueError, OSError) as e:
+        console.print(f"[bold red]❌ Could not store ANTA results from {path}: {e}[/bold red]")
+        return None
+    if new:
+        console.print(f"[bold green]✔️ Stored ANTA results of {fabric.name} as run {run_id}[/bold green]")
+        job_logs.emit(f"🗃️ Stored ANTA results as run {run_id}")
+    return run_id
+
+
+def read_tree_files(workdir, paths):
+    """Returns {path: content} of every file below paths (files or directories) in workdir."""
+    files = {}
+    for path in paths:
+        target = os.path.join(workdir, path)
+        if os.path.isfile(target):
+            candidates = [target]
         else:
-            console.print(f"[bold red]❌ Playbook {playbook_name} failed. Aborting commit.[/bold red]")
-            console.print(result.stderr)
-            return
-        console.print("[bold blue]🔎 Checking for changes in specified directories...[/bold blue]")
-        status_result = subprocess.run(
-            ["git", "status", "--porcelain"] + ALLOWED_PATHS_TO_COMMIT,
-            cwd=REPO_PATH, capture_output=True, text=True, check=True
-        )
-        if not status_result.stdout.strip():
-            console.print("[bold yellow]⚠️ No changes detected in reports/ or intended/test_catalogs/. Nothing to commit.[/bold yellow]")
-            return
-        console.print("[bold green]✔️ Relevant changes found. Proceeding with commit.[/bold green]")
-        subprocess.run(["git", "add"] + ALLOWED_PATHS_TO_COMMIT, cwd=REPO_PATH, check=True)
-        commit_message = f"Auto-commit ANTA reports at {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}"
-        subprocess.run(["git", "commit", "-m", commit_message], cwd=REPO_PATH, check=True)
-        console.print(f"[bold green]✔️ Committed changes with message: '{commit_message}'[/bold green]")
-        subprocess.run(["git", "push", "origin", "main"], cwd=REPO_PATH, check=True)
-        console.print("[bold green]🚀 Successfully pushed changes to main branch.[/bold green]")
-    except subprocess.CalledProcessError as e:
+            candidates = [os.path.join(root, name) for root, _, names in os.walk(target) for name in names]
+        for candidate in candidates:
+            with open(candidate, 'rb') as f:
+                files[os.path.relpath(candidate, workdir)] = f.read()
+    return files
+
+
+def replace_tree_files(workdir, paths, files):
+    """Makes paths in workdir contain exactly files, as returned by read_tree_files."""
+    for path in paths:
+        target = os.path.join(workdir, path)
+        if os.path.isdir(target):
+            shutil.rmtree(target)
+        elif os.path.exists(target):
+            os.remove(target)
+    for path, content in files.items():
+        target = os.path.join(workdir, path)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        with open(target, 'wb') as f:
+            f.write(content)
+
+
+def push_to_main(fabric, workdir, paths, message):
+    """Commits the files below paths on top of the newest origin/main and pushes the commit to main.
+
+    Pushes to main are serialized across all fabrics of a repository. Main may still have
+    moved since workdir was checked out (another fabric's reports, a CI commit), so the
+    files are carried over onto the freshly fetched main before committing, and a rejected
+    push is retried the same way. Returns the commit id, or None if main already has the files.
+    """
+    with fabric.main_push_lock:
+        for attempt in range(1, MAIN_PUSH_ATTEMPTS + 1):
+            with metrics.GIT_SECONDS.labels(operation="fetch").time():
+                fabric.worktree_pool.fetch()
+            files = read_tree_files(workdir, paths)
+            git_backend.reset_detached(workdir, "origin/main")
+            replace_tree_files(workdir, paths, files)
+            git_backend.add(workdir, paths)
+            commit_id = git_backend.commit(workdir, message)
+            if commit_id is None:
+                return None
+            try:
+                git_backend.push(workdir, "origin", "HEAD:main")
+                return commit_id
+            except GitError as e:
+                if attempt == MAIN_PUSH_ATTEMPTS:
+                    raise
+                console.print(f"[bold yellow]⚠️ Push to main rejected (attempt {attempt}), retrying on the new main:[/bold yellow] {e.stderr}")
+
+
+@metrics.ANTA_RUN_SECONDS.time()
+def run_anta_playbook(fabric, scope=None, traces=None):
+    """Runs the ANTA playbook of a fabric on the latest main in an isolated worktree and conditionally commits/pushes results.
+
+    With scope "changed" only the devices affected since the last validated commit are tested.
+    """
+    ALLOWED_PATHS_TO_COMMIT = fabric.anta_commit_paths
+    worktree_pool = fabric.worktree_pool
+    scope = scope or ANTA_SCOPE
+    try:
+        console.print("[bold blue]🔄 Fetching latest changes from git...[/bold blue]")
+        with metrics.GIT_SECONDS.labels(operation="fetch").time():
+            worktree_pool.fetch()
+        with worktree_pool.checkout("origin/main") as workdir:
+            console.print(f"[bold green]✔️ Checked out origin/main in worktree {workdir}.[/bold green]")
+            playbook_name = os.path.basename(fabric.anta_playbook)
+            argv = ["-i", fabric.inventory, fabric.anta_playbook]
+            validated_commit = git_backend.resolve(workdir, "HEAD")
+            limit = anta_limit(fabric, workdir) if scope == "changed" else None
+            if limit is not None and not limit:
+                console.print("[bold green]✔️ No device changed since the last validated commit, skipping ANTA[/bold green]")
+                job_logs.emit("⏭️ No device changed since the last validated commit, skipping ANTA")
+                return UNCHANGED
+            if limit:
+                argv += ["--limit", ",".join(limit)]
+                job_logs.emit(f"🎯 Validating {len(limit)} affected device(s): {', '.join(limit)}")
+            console.print(f"[bold blue]🚀 Running ANTA Playbook: {playbook_name} ({', '.join(limit) if limit else fabric.group})[/bold blue]")
+            job_logs.emit(f"🚀 Running ANTA Playbook: {playbook_name}")
+            started = time.monotonic()
+            returncode, output = ansible_engine.run_playbook(
+                workdir, argv, on_line=lambda line: stream_line(line, playbook_name)
+            )
+            metrics.PLAYBOOK_SECONDS.labels(
+                playbook=playbook_name, result="success" if returncode == 0 else "failure"
+            ).observe(time.monotonic() - started)
+            if returncode == 0:
+                console.print(f"[bold green]✔️ Playbook {playbook_name} executed successfully[/bold green]")
+                job_logs.emit(f"✔️ Playbook {playbook_name} executed successfully")
+            else:
+                console.print(f"[bold red]❌ Playbook {playbook_name} failed. Aborting commit.[/bold red]")
+                job_logs.emit(f"❌ Playbook {playbook_name} failed (exit code {returncode}). Aborting commit.")
+                return False
+            record_anta_results(fabric, workdir)
+            # The next "changed" run diffs against the commit that was just validated
+            anta_scope.write_validated_commit(os.path.join(workdir, fabric.validated_commit_file), validated_commit)
+            console.print("[bold blue]🔎 Checking for changes in specified directories...[/bold blue]")
+            if not git_backend.status(workdir, ALLOWED_PATHS_TO_COMMIT):
+                console.print(f"[bold yellow]⚠️ No changes detected in {' or '.join(ALLOWED_PATHS_TO_COMMIT)}. Nothing to commit.[/bold yellow]")
+                return
+            console.print("[bold green]✔️ Relevant changes found. Proceeding with commit.[/bold green]")
+            commit_message = f"Auto-commit ANTA reports at {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}"
+            commit_id = push_to_main(fabric, workdir, ALLOWED_PATHS_TO_COMMIT, commit_message + tracing.trace_trailer(traces))
+            if commit_id is None:
+                console.print("[bold yellow]⚠️ Reports already on main, nothing to push.[/bold yellow]")
+                return
+            console.print(f"[bold green]✔️ Committed changes with message: '{commit_message}'[/bold green]")
+            job_logs.emit(f"📝 Committed {commit_id[:12]}: {commit_message}")
+            console.print("[bold green]🚀 Successfully pushed changes to main branch.[/bold green]")
+            job_logs.emit("⬆️ Pushed ANTA results to main")
+    except (subprocess.CalledProcessError, GitError) as e:
         console.print(f"[bold red]❌ A git or ansible process failed:[/bold red]")
         console.print(e.stderr)
+        return False
     except Exception as e:
         console.print(f"[bold red]❌ An unexpected error occurred:[/bold red] {str(e)}")
+        return False
+
+
+def update_local_repo(fabric, after=None):
+    """Fast-forwards the main checkout of a fabric (the one serving /status and /latest-report) to the pushed commit.
+
+    Only one update runs at a time; pushes arriving meanwhile are coalesced into a single
+    queued follow-up. Nothing is fetched when HEAD already is the pushed commit, and the
+    checkout is never moved backwards or onto a diverged history.
+    """
+    repo_path = fabric.repo_path
+    with fabric.repo_update_lock:
+        try:
+            head = git_backend.resolve(repo_path, "HEAD")
+            if after and head == after:
+                console.print(f"[bold green]GIT_UPDATE: ✔️ Already at {after[:12]}, nothing to do.[/bold green]")
+                return UNCHANGED
+            console.print("[bold blue]GIT_UPDATE: Gitea webhook received. Fetching latest changes...[/bold blue]")
+            # The fetch and the fast-forward write the shared .git directory, same as the job worktrees
+            with fabric.worktree_pool.git_lock:
+                with metrics.GIT_SECONDS.labels(operation="fetch").time():
+                    git_backend.fetch(repo_path, "origin")
+                target = (git_backend.resolve(repo_path, after) if after else None) or git_backend.resolve(repo_path, "origin/main")
+                if git_backend.is_ancestor(repo_path, target, head):
+                    console.print(f"[bold green]GIT_UPDATE: ✔️ HEAD already contains {target[:12]}, nothing to do.[/bold green]")
+                    return UNCHANGED
+                with metrics.GIT_SECONDS.labels(operation="pull").time():
+                    git_backend.fast_forward(repo_path, "main", target)
+            console.print(f"[bold green]GIT_UPDATE: ✔️ Repository fast-forwarded to {target[:12]}.[/bold green]")
+            # Picks up reports pushed by the CI pipeline
+            for other in fabrics.values():
+                if other.repo_path == repo_path:
+                    record_anta_results(other, repo_path)
+        except GitError as e:
+            console.print(f"[bold red]GIT_UPDATE: ❌ Git update failed (not a fast-forward?):[/bold red] {e.stderr}")
+            return False
+        except Exception as e:
+            console.print(f"[bold red]GIT_UPDATE: ❌ An unexpected error occurred:[/bold red] {str(e)}")
+            return False
+
+
+# Locks shared by every fabric that uses the same repository
+git_locks = {}
+repo_update_locks = {}
+main_push_locks = {}
+
+
+class Fabric:
+    """One entry of FABRICS with its worktree pool and job queue shard."""
+
+    def __init__(self, name, settings):
+        self.name = name
+        self.group = settings["group"]
+        self.repo_path = settings["repo_path"]
+        self.inventory = settings.get("inventory", "inventory.yml")
+        self.sites = settings.get("sites", [])
+        self.stages = settings.get("stages", SYNC_STAGES)
+        self.anta_playbook = settings["anta_playbook"]
+        self.anta_commit_paths = settings["anta_commit_paths"]
+        self.intended_dir = settings.get("intended_dir", "intended")
+        self.validated_commit_file = settings["validated_commit_file"]
+        self.anta_csv_report = settings["anta_csv_report"]
+        validate_stage_graph(self.stages)
+        # The first fabric of a repository keeps its main checkout up to date
+        self.owns_checkout = self.repo_path not in repo_update_locks
+        self.repo_update_lock = repo_update_locks.setdefault(self.repo_path, threading.Lock())
+        self.main_push_lock = main_push_locks.setdefault(self.repo_path, threading.Lock())
+        scratch_dir = WORKTREE_DIR if name == DEFAULT_FABRIC else os.path.join(WORKTREE_DIR, name)
+        self.worktree_pool = WorktreePool(
+            self.repo_path, scratch_dir, max_idle=WORKTREE_MAX_IDLE, backend=git_backend,
+            git_lock=git_locks.setdefault(self.repo_path, threading.Lock()),
+        )
+        self.jobs = JobQueue(
+            JOB_DB_PATH,
+            handlers={
+                "sync": functools.partial(create_branch_and_push, self),
+                "anta": functools.partial(run_anta_playbook, self),
+                "repo_update": functools.partial(update_local_repo, self),
+            },
+            workers=FABRIC_WORKERS.get(name, JOB_WORKERS),
+            max_depth=JOB_QUEUE_MAX_DEPTH,
+            concurrency=JOB_CONCURRENCY,
+            priorities=JOB_PRIORITIES,
+            shard=name,
+            adopt_unsharded=name == DEFAULT_FABRIC,
+        )
+        self.jobs.on_start.append(lambda job: job_logs.emit(f"▶️ Job {job['id']} ({job['kind']}, {name}) started", job['id']))
+        self.jobs.on_finish.append(lambda job, status: job_logs.emit(f"⏹️ Job {job['id']} ({job['kind']}, {name}) {status}", job['id']))
+        self.jobs.on_finish.append(lambda job, status: job_logs.close(job['id']))
+        self.jobs.on_finish.append(record_job_metrics)
+        self.jobs.on_start.append(start_job_trace)
+        self.jobs.on_finish.append(finish_job_trace)
+        metrics.QUEUE_DEPTH.labels(fabric=name).set_function(lambda: self.jobs.depth()["queued"])
+        metrics.ACTIVE_JOBS.labels(fabric=name).set_function(lambda: self.jobs.depth()["running"])
+
+    def start(self):
+        self.worktree_pool.start()
+        self.jobs.start()
+
+
+WEBHOOK_SOURCES = {"sync": "netbox", "anta": "netbox", "repo_update": "gitea"}
+
+
+def record_job_metrics(job, status):
+    """Records the runtime of a finished job and counts failed jobs as failed webhooks."""
+    started_at = datetime.fromisoformat(job["started_at"]).timestamp()
+    metrics.JOB_SECONDS.labels(kind=job["kind"], status=status).observe(time.time() - started_at)
+    if status == "failed" and job["kind"] in WEBHOOK_SOURCES:
+        metrics.WEBHOOKS_TOTAL.labels(source=WEBHOOK_SOURCES[job["kind"]], outcome="failed").inc()
+
+
+def start_job_trace(job):
+    """Makes the trace IDs of a job current for the spans of its handler and records its time in the queue."""
+    traces = job["payload"].get("traces") or {}
+    tracing.current_trace_ids.set(tuple(traces))
+    created_at = datetime.fromisoformat(job["created_at"]).timestamp()
+    started_at = datetime.fromisoformat(job["started_at"]).timestamp()
+    for trace_id, received_at in traces.items():
+        # Events merged into a queued sync only waited from their own arrival
+        tracing.record(
+            f"{job['kind']}.queued", max(created_at, received_at), started_at, [trace_id],
+            job_id=job["id"], fabric=job.get("shard"),
+        )
+
+
+def finish_job_trace(job, status):
+    tracing.record(
+        f"{job['kind']}.job",
+        datetime.fromisoformat(job["started_at"]).timestamp(),
+        time.time(),
+        status="error" if status == "failed" else "ok",
+        job_id=job["id"],
+        fabric=job.get("shard"),
+    )
+    tracing.current_trace_ids.set(())
+
+
+if DEFAULT_FABRIC not in FABRICS:
+    raise ValueError(f"DEFAULT_FABRIC '{DEFAULT_FABRIC}' is not one of the FABRICS ({', '.join(FABRICS)})")
+fabrics = {name: Fabric(name, settings) for name, settings in FABRICS.items()}
+# Job ids are unique across all shards, so any queue can look a job up by id
+job_queue = fabrics[DEFAULT_FABRIC].jobs
+
 
+def route_fabric(data, headers):
+    """Picks the fabric of a NetBox event (None if it names an unknown fabric)."""
+    name = data.get('fabric') or headers.get('X-Fabric')
+    if name:
+        return fabrics.get(name)
+    site = (data.get('data') or {}).get('site')
+    for fabric in fabrics.values():
+        if site and site in fabric.sites:
+            return fabric
+    return fabrics[DEFAULT_FABRIC]
 
-def get_file_hash(filepath):
-    """Calculates and returns the SHA256 hash of a file's content."""
+
+def merge_sync_payloads(existing, new):
+    """Merges the VLAN lists and traces of two sync payloads, keeping each VLAN DB_ID and trace ID once."""
+    vlans = {vlan['vlan_db_id']: vlan for vlan in existing.get('vlans', [])}
+    for vlan in new.get('vlans', []):
+        vlans.setdefault(vlan['vlan_db_id'], vlan)
+    traces = dict(existing.get('traces', {}))
+    for trace_id, received_at in new.get('traces', {}).items():
+        traces.setdefault(trace_id, received_at)
+    return {"vlans": list(vlans.values()), "traces": traces}
+
+
+def enqueue_job(fabric, kind, payload=None, message=None, delivery=None, **options):
+    """Queues a job on the shard of a fabric and returns the webhook response as (body, status, headers), with 429 and Retry-After when the queue is full.
+
+    A delivery key that was already accepted is answered with 200 and the job of the first
+    delivery instead of queuing the work again.
+    """
+    if delivery:
+        claimed, job_id = deliveries.claim(delivery)
+        if not claimed:
+            request_console.print(f"[bold yellow]🔁 Duplicate {kind} delivery, already handled by job {job_id}[/bold yellow]")
+            job = job_queue.get(job_id) if job_id is not None else None
+            return {
+                "message": f"Duplicate delivery, {kind} job already queued.",
+                "job_id": job_id,
+                "status": job["status"] if job else None,
+                "duplicate": True,
+            }, 200, {}
     try:
-        with open(filepath, 'rb') as f:
-            return hashlib.sha256(f.read()).hexdigest()
-    except FileNotFoundError:
-        return None
+        job = fabric.jobs.submit(kind, payload, **options)
+    except QueueFullError as e:
+        request_console.print(f"[bold red]❌ {e} ({fabric.name}). Rejecting {kind} job.[/bold red]")
+        if delivery:
+            deliveries.release(delivery)
+        return {"error": str(e), "retry_after": e.retry_after}, 429, {"Retry-After": str(e.retry_after)}
+    if delivery:
+        deliveries.record(delivery, job["id"])
+    if job["coalesced"]:
+        request_console.print(f"[bold green]🧩 Merged {kind} event into queued job {job['id']} ({fabric.name})[/bold green]")
+    else:
+        request_console.print(f"[bold green]📥 Queued {kind} job {job['id']} ({fabric.name})[/bold green]")
+    return {
+        "message": message or f"{kind} job queued.",
+        "job_id": job["id"],
+        "fabric": fabric.name,
+        "coalesced": job["coalesced"],
+    }, 202, {}
+
+
+def enqueue_sync(fabric, vlans, message, delivery=None, traces=None):
+    """Queues a sync job, merging it into a sync of the same fabric that has not started yet.
+
+    traces maps the trace ID of each event to the time it was received.
+    """
+    if not fabric.stages:
+        request_console.print(f"[bold yellow]⚠️ Fabric '{fabric.name}' has no sync stages, ignoring sync event.[/bold yellow]")
+        return {"message": f"Fabric '{fabric.name}' has no sync stages, nothing to sync"}, 200, {}
+    return enqueue_job(
+        fabric,
+        "sync",
+        {"vlans": vlans, "traces": traces or {}},
+        message,
+        delivery=delivery,
+        coalesce_key="sync",
+        merge=merge_sync_payloads,
+        delay=SYNC_COALESCE_WINDOW,
+        max_delay=SYNC_COALESCE_MAX_WAIT,
+    )
+
+
+def count_webhook(source, body, status):
+    """Counts a webhook as accepted (queued), duplicate, ignored (200) or rejected (any error)."""
+    if body.get("duplicate"):
+        outcome = "duplicate"
+    elif status == 202:
+        outcome = "accepted"
+    elif status == 200:
+        outcome = "ignored"
+    else:
+        outcome = "rejected"
+    metrics.WEBHOOKS_TOTAL.labels(source=source, outcome=outcome).inc()
+
 
+def process_netbox_webhook(raw_data, headers):
+    """Verifies and queues a webhook from the NetBox plugins. Returns (body, status, headers)."""
+    received_at = time.time()
+    request_console.print("[bold blue]ℹ️ NETBOX Webhook received...[/bold blue]")
+
+    # Validate webhook secret
+    received_secret = headers.get('X-Hook-Signature')
+    expected_secret = hmac.new(NETBOX_WEBHOOK_SECRET.encode('utf-8'), raw_data, hashlib.sha512).hexdigest()
+    if not hmac.compare_digest(received_secret or '', expected_secret):
+        request_console.print("[bold red]❌ Invalid or missing NetBox webhook secret[/bold red]")
+        return {"error": "Invalid or missing webhook secret"}, 403, {}
 
-def update_local_repo():
-    """Checks out main and pulls the latest changes."""
-    console.print("[bold blue]GIT_UPDATE: Gitea webhook received. Pulling latest changes...[/bold blue]")
     try:
-        subprocess.run(["git", "checkout", "main"], cwd=REPO_PATH, check=True, capture_output=True)
-        subprocess.run(["git", "pull", "origin", "main"], cwd=REPO_PATH, check=True, capture_output=True)
-        console.print("[bold green]GIT_UPDATE: ✔️ Repository updated successfully.[/bold green]")
-    except subprocess.CalledProcessError as e:
-        console.print(f"[bold red]GIT_UPDATE: ❌ Git pull failed:[/bold red] {e.stderr}")
+        data = json.loads(raw_data)
     except Exception as e:
-        console.print(f"[bold red]GIT_UPDATE: ❌ An unexpected error occurred:[/bold red] {str(e)}")
+        request_console.print(f"[bold red]❌ Error parsing JSON:[/bold red] {str(e)}")
+        return {"error": "Invalid JSON"}, 400, {}
+
+    event_type = data.get('event')
+    fabric = route_fabric(data, headers)
+    if fabric is None:
+        request_console.print(f"[bold red]❌ Unknown fabric in '{event_type}' event[/bold red]")
+        return {"error": f"Unknown fabric, expected one of: {', '.join(fabrics)}"}, 400, {}
+    request_console.print(f"[bold yellow]Received event type: {event_type} ({fabric.name})[/bold yellow]")
+    # Retries of the same request carry the same body (including its timestamp)
+    delivery = delivery_key("netbox", headers, raw_data)
+    # Events from plugins that do not trace yet start their trace here
+    trace_id = data.get('trace_id') or headers.get('X-Trace-ID') or tracing.new_trace_id()
+    body, status, response_headers = dispatch_netbox_event(fabric, event_type, data, delivery, {trace_id: received_at})
+    if status in (200, 202):
+        body["trace_id"] = trace_id
+    tracing.record(
+        f"webhook.{event_type}", received_at, time.time(), [trace_id],
+        status="ok" if status in (200, 202) else "error",
+        fabric=fabric.name, job_id=body.get("job_id"), http_status=status,
+        **({"vlan_db_id": data["data"]["vlan_db_id"]} if event_type == "vlan_created" and status == 202 else {}),
+    )
+    return body, status, response_headers
+
+
+def dispatch_netbox_event(fabric, event_type, data, delivery, traces):
+    """Queues the job of a verified NetBox event. Returns (body, status, headers)."""
+    if event_type == "vlan_created":
+        vlan_data = data.get('data', {})
+        if not vlan_data.get('vlan_db_id') or not vlan_data.get('vlan_tag_id'):
+            request_console.print(f"[bold red]❌ Event '{event_type}' received without complete VLAN data.[/bold red]")
+            return {"error": "Missing vlan_db_id or vlan_tag_id for this event"}, 400, {}
+
+        request_console.print(f"[bold blue]🔄 Processing VLAN creation for DB_ID: {vlan_data['vlan_db_id']}, Tag: {vlan_data['vlan_tag_id']}...[/bold blue]")
+        return enqueue_sync(
+            fabric,
+            [{"vlan_db_id": vlan_data["vlan_db_id"], "vlan_tag_id": vlan_data["vlan_tag_id"]}],
+            f"VLAN sync process queued for DB_ID {vlan_data['vlan_db_id']}.",
+            delivery=delivery,
+            traces=traces,
+        )
+
+    elif event_type == "manual_sync":
+        request_console.print(f"[bold blue]🔄 Processing generic manual sync triggered at {data.get('timestamp')}[/bold blue]")
+        return enqueue_sync(
+            fabric, [], "Generic manual sync process queued in the background.", delivery=delivery, traces=traces
+        )
+
+    elif event_type == "run_anta_test":
+        request_console.print(f"[bold blue]🔬 Processing ANTA test triggered at {data.get('timestamp')}[/bold blue]")
+        scope = data.get('scope')
+        if scope not in (None, "full", "changed"):
+            return {"error": "scope must be 'full' or 'changed'"}, 400, {}
+        payload = {"traces": traces}
+        if scope:
+            payload["scope"] = scope
+        return enqueue_job(fabric, "anta", payload, "ANTA test queued in the background", delivery=delivery)
+
+    else:
+        request_console.print(f"[bold red]❌ Unknown event type: {event_type}[/bold red]")
+        return {"error": "Unknown event type"}, 400, {}
+
+
+def process_gitea_webhook(raw_data, headers):
+    """Verifies a Gitea push webhook and queues a repo update for pushes to main. Returns (body, status, headers)."""
+    request_console.print("[bold blue]ℹ️ GITEA Webhook received...[/bold blue]")
+    gitea_signature = headers.get('X-Gitea-Signature')
+    if not gitea_signature:
+        return {"error": "Missing signature"}, 403, {}
+    expected_signature = hmac.new(GITEA_WEBHOOK_SECRET.encode('utf-8'), raw_data, hashlib.sha256).hexdigest()
+    if not hmac.compare_digest(gitea_signature, expected_signature):
+        request_console.print("[bold red]GITEA_WEBHOOK: ❌ Invalid Gitea webhook secret[/bold red]")
+        return {"error": "Invalid signature"}, 403, {}
+
+    data = json.loads(raw_data)
+    if data.get('ref') != 'refs/heads/main':
+        request_console.print(f"[bold yellow]GITEA_WEBHOOK: Ignoring push to non-main branch ({data.get('ref')})[/bold yellow]")
+        return {"message": "Ignoring non-main branch push"}, 200, {}
+
+    # Pushes that arrive while an update is queued collapse into it, keeping the newest target
+    after = data.get('after')
+    if not after or set(after) == {"0"}:
+        after = None
+    delivery = delivery_key("gitea", headers, raw_data, ("X-Gitea-Delivery",))
+    # One update per main checkout, queued on the fabric that owns it
+    owners = [fabric for fabric in fabrics.values() if fabric.owns_checkout]
+    responses = [
+        enqueue_job(
+            fabric,
+            "repo_update",
+            {"after": after},
+            "Webhook received, update process queued",
+            delivery=delivery if len(owners) == 1 else f"{delivery}:{fabric.name}",
+            coalesce_key="repo_update",
+            merge=lambda existing, new: {"after": new.get("after") or existing.get("after")},
+        )
+        for fabric in owners
+    ]
+    if len(responses) == 1:
+        return responses[0]
+    failed = [response for response in responses if response[1] not in (200, 202)]
+    if failed:
+        return failed[0]
+    duplicate = all(body.get("duplicate") for body, _, _ in responses)
+    return {
+        "message": "Webhook received, update processes queued",
+        "jobs": [body for body, _, _ in responses],
+        "duplicate": duplicate,
+    }, 200 if duplicate else 202, {}
+
+
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    """Exposes timings, webhook counters and queue gauges in the Prometheus text format."""
+    if not metrics.ENABLED:
+        return jsonify({"error": "prometheus_client is not installed"}), 501
+    body, content_type = metrics.render_metrics()
+    return Response(body, content_type=content_type)
 
 
 @app.route('/status', methods=['GET'])
 def get_status():
-    """An endpoint for the NetBox plugin to query the real-time hash of the status file."""
-    console.print("[bold cyan]ℹ️ Received status request from NetBox plugin...[/bold cyan]")
-    status_file = f"{REPO_PATH}/status/latest_cvaas_cc_job.name"
-    current_hash = get_file_hash(status_file)
-    if current_hash:
-        console.print(f"[bold green]✔️ Found file, hash: {current_hash}[/bold green]")
-        return jsonify({"status": "ok", "file_hash": current_hash}), 200
+    """An endpoint for the NetBox plugin to query the real-time hash of the status file.
+
+    The hash is cached until the file changes and doubles as the ETag, so a poll with a
+    matching If-None-Match header is answered with 304 without reading the file.
+    """
+    request_console.print("[bold cyan]ℹ️ Received status request from NetBox plugin...[/bold cyan]")
+    snapshot = status_file.snapshot()
+    if snapshot:
+        current_hash = snapshot["hash"]
+        request_console.print(f"[bold green]✔️ Found file, hash: {current_hash}[/bold green]")
+        response = jsonify({"status": "ok", "file_hash": current_hash})
+        response.set_etag(current_hash)
+        response.headers["Cache-Control"] = "no-cache"
+        return response.make_conditional(request)
     else:
-        console.print(f"[bold red]❌ Status file not found at: {status_file}[/bold red]")
+        request_console.print(f"[bold red]❌ Status file not found at: {STATUS_FILE}[/bold red]")
         return jsonify({"status": "error", "message": "Status file not found"}), 404
 
 
+def render_report_html(markdown_text):
+    """Renders the ANTA report to an HTML fragment, the same way the NetBox plugin used to."""
+    if MarkdownIt is None:
+        return f"<pre>{html.escape(markdown_text)}</pre>"
+    md = MarkdownIt()
+    md.enable('table')
+    return md.render(markdown_text)
+
+
+def build_report_body(snapshot, report_format):
+    """Builds the uncompressed body of /latest-report for a report snapshot (None if missing)."""
+    if snapshot is None:
+        content = f"## Report Not Found\n\nThe report file (`{os.path.basename(REPORT_FILE)}`) was not found on the server."
+    else:
+        content = snapshot["content"].decode('utf-8')
+    if report_format == "html":
+        return render_report_html(content).encode('utf-8')
+    return json.dumps({"status": "ok", "report_content": content}).encode('utf-8')
+
+
+def compress_body(body, encoding):
+    if encoding == "br":
+        return brotli.compress(body)
+    if encoding == "gzip":
+        return gzip.compress(body)
+    return body
+
+
+REPORT_ENCODINGS = ["br", "gzip", "identity"] if brotli else ["gzip", "identity"]
+
+
+def report_body(snapshot, report_format, encoding):
+    """The cached, possibly rendered and compressed body of /latest-report."""
+    file_hash = snapshot["hash"] if snapshot else None
+    return report_cache.get_or_create(
+        (file_hash, report_format, encoding),
+        lambda: compress_body(build_report_body(snapshot, report_format), encoding),
+    )
+
+
 @app.route('/latest-report', methods=['GET'])
 def get_latest_report():
-    """An endpoint for the NetBox plugin to get the content of the latest report file."""
-    console.print("[bold cyan]ℹ️ Received latest report request from NetBox plugin...[/bold cyan]")
-    report_file_path = f"{REPO_PATH}/reports/ANDREAS_FABRIC-state.md"
+    """An endpoint for the NetBox plugin to get the content of the latest report file.
+
+    Returns the Markdown wrapped in JSON, or with ?format=html the rendered HTML fragment.
+    Bodies are cached per file hash, format and encoding (brotli or gzip, as accepted by
+    the client), and ETag/Last-Modified let the plugin skip unchanged reports with a 304.
+    """
+    request_console.print("[bold cyan]ℹ️ Received latest report request from NetBox plugin...[/bold cyan]")
+    report_format = "html" if request.args.get('format') == "html" else "json"
+    encoding = request.accept_encodings.best_match(REPORT_ENCODINGS, default="identity")
     try:
-        with open(report_file_path, 'r', encoding='utf-8') as f:
-            content = f.read()
-        console.print("[bold green]✔️ Found and returned report file content.[/bold green]")
-        return jsonify({"status": "ok", "report_content": content}), 200
-    except FileNotFoundError:
-        console.print(f"[bold red]❌ Report file not found at: {report_file_path}[/bold red]")
-        error_message = f"## Report Not Found\n\nThe report file (`{os.path.basename(report_file_path)}`) was not found on the server."
-        return jsonify({"status": "ok", "report_content": error_message}), 200
+        snapshot = report_file.snapshot()
+        body = report_body(snapshot, report_format, encoding)
     except Exception as e:
-        console.print(f"[bold red]❌ Error reading report file: {str(e)}[/bold red]")
+        request_console.print(f"[bold red]❌ Error reading report file: {str(e)}[/bold red]")
         return jsonify({"status": "error", "message": f"Server error reading file: {str(e)}"}), 500
 
+    mimetype = "text/html" if report_format == "html" else "application/json"
+    response = Response(body, mimetype=mimetype)
+    response.vary.add("Accept-Encoding")
+    if encoding != "identity":
+        response.headers["Content-Encoding"] = encoding
+    if snapshot is None:
+        request_console.print(f"[bold red]❌ Report file not found at: {REPORT_FILE}[/bold red]")
+        return response
+    request_console.print("[bold green]✔️ Found and returned report file content.[/bold green]")
+    # Weak, because the same ETag is used for every encoding of the report
+    response.set_etag(f"{snapshot['hash']}-{report_format}", weak=True)
+    response.last_modified = datetime.fromtimestamp(snapshot["mtime"], tz=timezone.utc)
+    response.headers["Cache-Control"] = "no-cache"
+    return response.make_conditional(request)
+
 
 @app.route('/webhook', methods=['POST'])
 def handle_webhook():
     """Handles incoming webhooks from the NetBox Plugin."""
-    console.print("[bold blue]ℹ️ NETBOX Webhook received...[/bold blue]")
-    raw_data = request.get_data()
+    body, status, headers = process_netbox_webhook(request.get_data(), request.headers)
+    count_webhook("netbox", body, status)
+    return jsonify(body), status, headers
 
-    # Validate webhook secret
-    received_secret = request.headers.get('X-Hook-Signature')
-    expected_secret = hmac.new(NETBOX_WEBHOOK_SECRET.encode('utf-8'), raw_data, hashlib.sha512).hexdigest()
-    if not hmac.compare_digest(received_secret or '', expected_secret):
-        console.print("[bold red]❌ Invalid or missing NetBox webhook secret[/bold red]")
-        return jsonify({"error": "Invalid or missing webhook secret"}), 403
 
+@app.route('/gitea-webhook', methods=['POST'])
+def handle_gitea_webhook():
+    """Handles incoming webhooks from Gitea to trigger a git pull."""
+    body, status, headers = process_gitea_webhook(request.get_data(), request.headers)
+    count_webhook("gitea", body, status)
+    return jsonify(body), status, headers
+
+
+# asgi mode: the same endpoints on the event loop; every other path goes to the Flask app
+ingress = IngressApp(app, executor_threads=INGRESS_THREADS, fallback_threads=SERVER_THREADS)
+
+
+@ingress.route("POST", "/webhook", offload=True)
+def ingress_webhook(req):
+    body, status, headers = process_netbox_webhook(req.body, req.headers)
+    count_webhook("netbox", body, status)
+    return IngressResponse.json(body, status, headers)
+
+
+@ingress.route("POST", "/gitea-webhook", offload=True)
+def ingress_gitea_webhook(req):
+    body, status, headers = process_gitea_webhook(req.body, req.headers)
+    count_webhook("gitea", body, status)
+    return IngressResponse.json(body, status, headers)
+
+
+@ingress.route("GET", "/status")
+async def ingress_status(req):
+    """/status from the cached hash; a changed or unwatched file is stat'ed (and reread) in the executor."""
+    cached, snapshot = status_file.cached()
+    if not cached:
+        snapshot = await ingress.run_in_executor(status_file.snapshot)
+    if not snapshot:
+        request_console.print(f"[bold red]❌ Status file not found at: {STATUS_FILE}[/bold red]")
+        return IngressResponse.json({"status": "error", "message": "Status file not found"}, 404)
+    response = IngressResponse.json({"status": "ok", "file_hash": snapshot["hash"]}, headers={"Cache-Control": "no-cache"})
+    response.set_etag(snapshot["hash"])
+    return response.make_conditional(req, snapshot["hash"])
+
+
+@ingress.route("GET", "/latest-report")
+async def ingress_latest_report(req):
+    """/latest-report from the render cache; reading, rendering and compressing a new report happens in the executor."""
+    report_format = "html" if req.args.get('format') == "html" else "json"
+    encoding = req.best_encoding(REPORT_ENCODINGS)
     try:
-        data = request.get_json()
+        cached, snapshot = report_file.cached()
+        if not cached:
+            snapshot = await ingress.run_in_executor(report_file.snapshot)
+        file_hash = snapshot["hash"] if snapshot else None
+        body = report_cache.get((file_hash, report_format, encoding))
+        if body is None:
+            body = await ingress.run_in_executor(report_body, snapshot, report_format, encoding)
     except Exception as e:
-        console.print(f"[bold red]❌ Error parsing JSON:[/bold red] {str(e)}")
-        return jsonify({"error": "Invalid JSON"}), 400
+        request_console.print(f"[bold red]❌ Error reading report file: {str(e)}[/bold red]")
+        return IngressResponse.json({"status": "error", "message": f"Server error reading file: {str(e)}"}, 500)
 
-    event_type = data.get('event')
-    console.print(f"[bold yellow]Received event type: {event_type}[/bold yellow]")
+    headers = {"Vary": "Accept-Encoding"}
+    if encoding != "identity":
+        headers["Content-Encoding"] = encoding
+    response = IngressResponse(body, headers=headers, content_type="text/html; charset=utf-8" if report_format == "html" else "application/json")
+    if snapshot is None:
+        request_console.print(f"[bold red]❌ Report file not found at: {REPORT_FILE}[/bold red]")
+        return response
+    etag = f"{file_hash}-{report_format}"
+    response.set_etag(etag, weak=True)
+    response.set_last_modified(snapshot["mtime"])
+    response.headers["Cache-Control"] = "no-cache"
+    return response.make_conditional(req, etag, snapshot["mtime"])
 
-    if event_type == "vlan_created":
-        vlan_data = data.get('data', {})
-        if not vlan_data.get('vlan_db_id') or not vlan_data.get('vlan_tag_id'):
-            console.print(f"[bold red]❌ Event '{event_type}' received without complete VLAN data.[/bold red]")
-            return jsonify({"error": "Missing vlan_db_id or vlan_tag_id for this event"}), 400
 
-        console.print(f"[bold blue]🔄 Processing VLAN creation for DB_ID: {vlan_data['vlan_db_id']}, Tag: {vlan_data['vlan_tag_id']}...[/bold blue]")
-        thread = threading.Thread(target=create_branch_and_push, args=(vlan_data,))
-        thread.start()
-        return jsonify({"message": f"VLAN sync process started for DB_ID {vlan_data['vlan_db_id']}."}), 202
+def resolve_anta_run(run_id):
+    """Returns the summary of run_id ("latest" for the newest run of ?fabric=), or None."""
+    if run_id == "latest":
+        return anta_results.run(fabric=request.args.get('fabric', DEFAULT_FABRIC))
+    if not run_id.isdigit():
+        return None
+    return anta_results.run(int(run_id))
 
-    elif event_type == "manual_sync":
-        console.print(f"[bold blue]🔄 Processing generic manual sync triggered at {data.get('timestamp')}[/bold blue]")
-        thread = threading.Thread(target=create_branch_and_push, args=(None,))
-        thread.start()
-        return jsonify({"message": "Generic manual sync process started in the background."}), 202
 
-    elif event_type == "run_anta_test":
-        console.print(f"[bold blue]🔬 Processing ANTA test triggered at {data.get('timestamp')}[/bold blue]")
-        thread = threading.Thread(target=run_anta_playbook)
-        thread.start()
-        return jsonify({"message": "ANTA test started in the background"}), 202
+def anta_response(payload, run):
+    """JSON response whose ETag is the run, so unchanged results can be answered with 304."""
+    response = jsonify(payload)
+    response.set_etag(f"anta-run-{run['id']}-{request.query_string.decode()}")
+    response.headers["Cache-Control"] = "no-cache"
+    return response.make_conditional(request)
 
-    else:
-        console.print(f"[bold red]❌ Unknown event type: {event_type}[/bold red]")
-        return jsonify({"error": "Unknown event type"}), 400
 
-@app.route('/gitea-webhook', methods=['POST'])
-def handle_gitea_webhook():
-    """Handles incoming webhooks from Gitea to trigger a git pull."""
-    console.print("[bold blue]ℹ️ GITEA Webhook received...[/bold blue]")
-    gitea_signature = request.headers.get('X-Gitea-Signature')
-    if not gitea_signature:
-        return jsonify({"error": "Missing signature"}), 403
-    expected_signature = hmac.new(GITEA_WEBHOOK_SECRET.encode('utf-8'), request.get_data(), hashlib.sha256).hexdigest()
-    if not hmac.compare_digest(gitea_signature, expected_signature):
-        console.print("[bold red]GITEA_WEBHOOK: ❌ Invalid Gitea webhook secret[/bold red]")
-        return jsonify({"error": "Invalid signature"}), 403
+@app.route('/anta/runs', methods=['GET'])
+def list_anta_runs():
+    """Lists the newest stored ANTA runs with their result counts, optionally for one fabric."""
+    limit = request.args.get('limit', 20, type=int)
+    return jsonify({"runs": anta_results.runs(fabric=request.args.get('fabric'), limit=limit)}), 200
+
+
+@app.route('/anta/runs/<run_id>', methods=['GET'])
+def get_anta_run(run_id):
+    """Returns the result counts of one ANTA run, or of the latest run of a fabric."""
+    run = resolve_anta_run(run_id)
+    if run is None:
+        return jsonify({"error": f"ANTA run {run_id} not found"}), 404
+    return anta_response(run, run)
+
+
+@app.route('/anta/runs/<run_id>/failures', methods=['GET'])
+def get_anta_failures(run_id):
+    """Returns the failed tests of an ANTA run grouped by device, optionally for one device or test category."""
+    run = resolve_anta_run(run_id)
+    if run is None:
+        return jsonify({"error": f"ANTA run {run_id} not found"}), 404
+    failures = anta_results.failures(run["id"], device=request.args.get('device'), category=request.args.get('category'))
+    return anta_response({"run": run["id"], "failures": failures}, run)
 
-    data = request.get_json()
-    if data.get('ref') != 'refs/heads/main':
-        console.print(f"[bold yellow]GITEA_WEBHOOK: Ignoring push to non-main branch ({data.get('ref')})[/bold yellow]")
-        return jsonify({"message": "Ignoring non-main branch push"}), 200
 
-    thread = threading.Thread(target=update_local_repo)
-    thread.start()
-    return jsonify({"message": "Webhook received, update process started"}), 202
+@app.route('/anta/runs/<run_id>/diff', methods=['GET'])
+def get_anta_diff(run_id):
+    """Returns the tests whose result changed since the previous ANTA run of the same fabric."""
+    run = resolve_anta_run(run_id)
+    if run is None:
+        return jsonify({"error": f"ANTA run {run_id} not found"}), 404
+    return anta_response(anta_results.diff(run["id"]), run)
+
+
+@app.route('/traces', methods=['POST'])
+def collect_spans():
+    """Collector for the spans of the NetBox plugin and the CI jobs (a span or a list of spans)."""
+    if not TRACE_FILE:
+        return jsonify({"error": "Tracing is disabled (TRACE_FILE is empty)"}), 501
+    if not TRACE_COLLECTOR_TOKEN:
+        return jsonify({"error": "Span collection is disabled (TRACE_COLLECTOR_TOKEN is not set)"}), 403
+    authorization = request.headers.get('Authorization', '')
+    if not hmac.compare_digest(authorization, f"Bearer {TRACE_COLLECTOR_TOKEN}"):
+        return jsonify({"error": "Invalid or missing collector token"}), 403
+    data = request.get_json(silent=True)
+    try:
+        spans = [tracing.validate_span(span) for span in (data if isinstance(data, list) else [data])]
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    tracing.write_spans(spans)
+    return jsonify({"accepted": len(spans)}), 202
+
+
+@app.route('/traces/<trace_id>', methods=['GET'])
+def get_trace(trace_id):
+    """Returns the spans of one trace, ordered by start, with their offset from the start of the trace."""
+    if not TRACE_FILE:
+        return jsonify({"error": "Tracing is disabled (TRACE_FILE is empty)"}), 501
+    summaries, _ = tracing.summarize(tracing.read_spans(TRACE_FILE, trace_id))
+    if not summaries:
+        return jsonify({"error": "Trace not found"}), 404
+    return jsonify(summaries[0])
+
+
+@app.route('/jobs', methods=['GET'])
+def list_jobs():
+    """Lists the most recent jobs, optionally filtered by status and fabric."""
+    status = request.args.get('status')
+    limit = request.args.get('limit', 50, type=int)
+    name = request.args.get('fabric')
+    if name:
+        if name not in fabrics:
+            return jsonify({"error": f"Fabric {name} not found"}), 404
+        queue = fabrics[name].jobs
+        return jsonify({"depth": queue.depth(), "jobs": queue.list(status=status, limit=limit)}), 200
+    depths = {name: fabric.jobs.depth() for name, fabric in fabrics.items()}
+    depth = {state: sum(counts[state] for counts in depths.values()) for state in ("queued", "running")}
+    return jsonify({
+        "depth": depth,
+        "fabrics": depths,
+        "jobs": job_queue.list(status=status, limit=limit, all_shards=True),
+    }), 200
+
+
+@app.route('/jobs/<int:job_id>', methods=['GET'])
+def get_job(job_id):
+    """Returns a single job and its current state."""
+    job = job_queue.get(job_id)
+    if job is None:
+        return jsonify({"error": f"Job {job_id} not found"}), 404
+    return jsonify(job), 200
+
+
+@app.route('/jobs/<int:job_id>/stream', methods=['GET'])
+def stream_job(job_id):
+    """Streams the output of a job as Server-Sent Events until the job has finished."""
+    job = job_queue.get(job_id)
+    if job is None:
+        return jsonify({"error": f"Job {job_id} not found"}), 404
+    # Reconnecting EventSource clients resume after the last line they received; an ID that is
+    # not a number starts from the beginning
+    since = request.headers.get('Last-Event-ID', -1, type=int) + 1
+    log = job_logs.get(job_id, create=job["status"] in ("queued", "running"))
+
+    def events():
+        nonlocal since
+        if log is not None:
+            while True:
+                entries, since, closed = log.read(since, timeout=15)
+                for seq, line in entries:
+                    yield f"id: {seq}\ndata: {line}\n\n"
+                if closed and not entries:
+                    break
+                if not entries:
+                    if job_queue.get(job_id)["status"] not in ("queued", "running"):
+                        break
+                    yield ": keepalive\n\n"
+        final = job_queue.get(job_id)
+        yield f"event: end\ndata: {json.dumps({'id': job_id, 'status': final['status']})}\n\n"
+
+    headers = {
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no",
+        "Access-Control-Allow-Origin": STREAM_ALLOW_ORIGIN,
+    }
+    return Response(stream_with_context(events()), mimetype="text/event-stream", headers=headers)
 
 
 if __name__ == "__main__":
@@ -312,4 +1256,17 @@ if __name__ == "__main__":
          sys.exit(1)
         
     print_startup_sequence()
-    serve(app, host="0.0.0.0", port=5000)
+    if not metrics.ENABLED:
+        console.print("[bold yellow]METRICS: ⚠️ prometheus_client is not installed, /metrics is disabled[/bold yellow]")
+    file_watcher.start()
+    ansible_engine.start()
+    for fabric in fabrics.values():
+        fabric.start()
+    if SERVER_MODE == "asgi":
+        request_console = BackgroundConsole(console)
+        try:
+            ingress.serve("0.0.0.0", SERVER_PORT)
+            sys.exit(0)
+        except ImportError as e:
+            console.print(f"[bold yellow]INGRESS: ⚠️ {e}, falling back to waitress[/bold yellow]")
+    serve(app, host="0.0.0.0", port=SERVER_PORT, threads=SERVER_THREADS)
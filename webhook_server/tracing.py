@@ -0,0 +1,302 @@
+"""Timed spans of a VLAN rollout, correlated by a trace ID and stored as JSON lines.
+
+The VLAN creator plugin creates a trace ID for every new VLAN. The ID travels with the
+webhook payload, the sync job, the commit message of the sync branch ("Trace-ID: <id>")
+and, in the CI pipeline, the TRACE_IDS environment variable. Every stage records spans
+under it: the plugin and the CI jobs post them to the /traces endpoint of the webhook
+server (TRACE_COLLECTOR_URL), which appends them, together with its own, to TRACE_FILE.
+
+Only needs the standard library, so the CI runner can use it as well:
+
+    python webhook_server/tracing.py run --name ci.build -- ansible-playbook -i inventory.yml build.yml
+    python webhook_server/tracing.py summarize --file webhook_server/traces.jsonl --last 5
+"""
+import argparse
+import contextvars
+import json
+import os
+import re
+import subprocess
+import sys
+import threading
+import time
+import urllib.request
+import uuid
+from contextlib import contextmanager
+
+TRACE_ID_PATTERN = re.compile(r"Trace-ID: ([0-9a-f]{32})")
+SPAN_FIELDS = {"trace_id": str, "span_id": str, "name": str, "service": str, "start": (int, float), "end": (int, float)}
+
+# Trace IDs of the job running in this context; spans recorded without explicit IDs use them
+current_trace_ids = contextvars.ContextVar("current_trace_ids", default=())
+
+_lock = threading.Lock()
+_config = {
+    "path": os.environ.get("TRACE_FILE") or None,
+    "max_bytes": int(os.environ.get("TRACE_FILE_MAX_BYTES", str(50 * 1024 * 1024))),
+    "collector_url": os.environ.get("TRACE_COLLECTOR_URL") or None,
+    "token": os.environ.get("TRACE_COLLECTOR_TOKEN") or None,
+    "service": os.environ.get("TRACE_SERVICE", "ci"),
+}
+
+
+def configure(**settings):
+    """Overrides the settings taken from the environment (path, max_bytes, collector_url, token, service)."""
+    unknown = set(settings) - set(_config)
+    if unknown:
+        raise TypeError(f"Unknown tracing settings: {', '.join(sorted(unknown))}")
+    _config.update(settings)
+
+
+def enabled():
+    return bool(_config["path"] or _config["collector_url"])
+
+
+def new_trace_id():
+    return uuid.uuid4().hex
+
+
+def trace_ids_in(text):
+    """Returns the trace IDs of the "Trace-ID: <id>" lines in text (e.g. commit messages), in order."""
+    return list(dict.fromkeys(TRACE_ID_PATTERN.findall(text or "")))
+
+
+def trace_trailer(trace_ids):
+    """Returns the commit message trailer carrying trace_ids (after a blank line), or "" without any."""
+    lines = [f"Trace-ID: {trace_id}" for trace_id in dict.fromkeys(trace_ids or [])]
+    return "\n\n" + "\n".join(lines) if lines else ""
+
+
+def validate_span(span):
+    """Checks a span received by the collector. Returns it with only the known fields, or raises ValueError."""
+    if not isinstance(span, dict):
+        raise ValueError("A span must be a JSON object")
+    for field, types in SPAN_FIELDS.items():
+        if not isinstance(span.get(field), types) or isinstance(span.get(field), bool):
+            raise ValueError(f"Span field '{field}' is missing or has the wrong type")
+    if span["end"] < span["start"]:
+        raise ValueError("Span ends before it starts")
+    attrs = span.get("attrs") or {}
+    if not isinstance(attrs, dict):
+        raise ValueError("Span field 'attrs' must be an object")
+    return {
+        **{field: span[field] for field in SPAN_FIELDS},
+        "duration": round(span["end"] - span["start"], 6),
+        "status": "error" if span.get("status") == "error" else "ok",
+        "attrs": attrs,
+    }
+
+
+def write_spans(spans, path=None):
+    """Appends spans to the trace file, moving a file over max_bytes to <file>.1 first."""
+    path = path or _config["path"]
+    if not path or not spans:
+        return
+    lines = "".join(json.dumps(span, separators=(",", ":")) + "\n" for span in spans)
+    with _lock:
+        try:
+            if os.path.getsize(path) > _config["max_bytes"]:
+                os.replace(path, f"{path}.1")
+        except FileNotFoundError:
+            pass
+        with open(path, "a", encoding="utf-8") as f:
+            f.write(lines)
+
+
+def post_spans(spans, url=None, token=None):
+    """Sends spans to the collector endpoint. Tracing never fails the caller, so errors are only reported."""
+    url = url or _config["collector_url"]
+    if not url or not spans:
+        return
+    request = urllib.request.Request(url, data=json.dumps(spans).encode("utf-8"), method="POST")
+    request.add_header("Content-Type", "application/json")
+    if token or _config["token"]:
+        request.add_header("Authorization", f"Bearer {token or _config['token']}")
+    try:
+        with urllib.request.urlopen(request, timeout=5):
+            pass
+    except Exception as e:
+        print(f"TRACE: could not send {len(spans)} span(s) to {url}: {e}", file=sys.stderr)
+
+
+def record(name, start, end, trace_ids=None, status="ok", **attrs):
+    """Records one span for each trace ID (the current ones by default). Does nothing without trace IDs."""
+    trace_ids = list(dict.fromkeys(trace_ids if trace_ids is not None else current_trace_ids.get()))
+    if not trace_ids or not enabled():
+        return
+    span_id = uuid.uuid4().hex[:16]
+    spans = [
+        {
+            "trace_id": trace_id,
+            "span_id": span_id,
+            "name": name,
+            "service": _config["service"],
+            "start": start,
+            "end": end,
+            "duration": round(end - start, 6),
+            "status": status,
+            "attrs": attrs,
+        }
+        for trace_id in trace_ids
+    ]
+    if _config["path"]:
+        write_spans(spans)
+    else:
+        post_spans(spans)
+
+
+@contextmanager
+def span(name, trace_ids=None, **attrs):
+    """Times the block as a span. The block can add attributes, or set attrs["status"] = "error", on the yielded dict."""
+    start = time.time()
+    status = "ok"
+    try:
+        yield attrs
+    except BaseException:
+        status = "error"
+        raise
+    finally:
+        status = attrs.pop("status", status)
+        record(name, start, time.time(), trace_ids, status=status, **attrs)
+
+
+def read_spans(path, trace_id=None):
+    """Reads the spans of the trace file and its rotated predecessor, optionally only those of one trace."""
+    spans = []
+    for file_name in (f"{path}.1", path):
+        try:
+            with open(file_name, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        item = json.loads(line)
+                    except ValueError:
+                        continue
+                    if trace_id is None or item.get("trace_id") == trace_id:
+                        spans.append(item)
+        except FileNotFoundError:
+            continue
+    return spans
+
+
+def _percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(fraction * (len(values) - 1))))]
+
+
+def summarize(spans, last=None):
+    """Groups spans by trace. Returns the traces, newest last, and the latency of every span name across them."""
+    traces = {}
+    for item in spans:
+        traces.setdefault(item["trace_id"], []).append(item)
+    summaries = []
+    for trace_id, items in traces.items():
+        items.sort(key=lambda item: (item["start"], item["end"]))
+        start = items[0]["start"]
+        vlans = sorted({str(item["attrs"]["vlan_db_id"]) for item in items if item.get("attrs", {}).get("vlan_db_id")})
+        summaries.append({
+            "trace_id": trace_id,
+            "start": start,
+            "total": max(item["end"] for item in items) - start,
+            "vlans": vlans,
+            "failed": any(item.get("status") == "error" for item in items),
+            "spans": [dict(item, offset=item["start"] - start) for item in items],
+        })
+    summaries.sort(key=lambda summary: summary["start"])
+    if last:
+        summaries = summaries[-last:]
+    durations = {}
+    for summary in summaries:
+        durations.setdefault("end_to_end", []).append(summary["total"])
+        for item in summary["spans"]:
+            durations.setdefault(item["name"], []).append(item["duration"])
+    stages = {
+        name: {
+            "count": len(values),
+            "p50": _percentile(values, 0.5),
+            "p90": _percentile(values, 0.9),
+            "max": max(values),
+        }
+        for name, values in durations.items()
+    }
+    return summaries, stages
+
+
+def format_seconds(seconds):
+    if seconds >= 60:
+        return f"{int(seconds // 60)}m{seconds % 60:04.1f}s"
+    return f"{seconds:.2f}s"
+
+
+def print_summary(summaries, stages):
+    for summary in summaries:
+        started = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(summary["start"]))
+        vlans = f", VLAN DB_ID {', '.join(summary['vlans'])}" if summary["vlans"] else ""
+        failed = ", FAILED" if summary["failed"] else ""
+        print(f"Trace {summary['trace_id']} ({started}{vlans}{failed}): {format_seconds(summary['total'])} end to end")
+        for item in summary["spans"]:
+            status = "  ERROR" if item.get("status") == "error" else ""
+            print(
+                f"  +{format_seconds(item['offset']):>9} {format_seconds(item['duration']):>9}  "
+                f"{item['service']:<15} {item['name']}{status}"
+            )
+        print()
+    if not stages:
+        print("No spans recorded.")
+        return
+    print(f"Latency over {len(summaries)} trace(s):")
+    print(f"  {'span':<32} {'count':>5} {'p50':>9} {'p90':>9} {'max':>9}")
+    for name, stats in sorted(stages.items(), key=lambda item: -item[1]["p50"]):
+        print(
+            f"  {name:<32} {stats['count']:>5} {format_seconds(stats['p50']):>9} "
+            f"{format_seconds(stats['p90']):>9} {format_seconds(stats['max']):>9}"
+        )
+
+
+def _parse_attrs(values):
+    attrs = {}
+    for value in values or []:
+        key, _, item = value.partition("=")
+        attrs[key] = item
+    return attrs
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run = commands.add_parser("run", help="Run a command and record it as a span of the traces in TRACE_IDS")
+    run.add_argument("--name", required=True, help="Span name, e.g. ci.build")
+    run.add_argument("--trace-ids", default=os.environ.get("TRACE_IDS", ""), help="Space or comma separated trace IDs")
+    run.add_argument("--attr", action="append", help="Span attribute as key=value (repeatable)")
+    run.add_argument("cmd", nargs=argparse.REMAINDER, help="Command to run, after --")
+
+    summary = commands.add_parser("summarize", help="Show the latency breakdown of recorded traces")
+    summary.add_argument("--file", default=_config["path"] or os.path.join(os.path.dirname(os.path.abspath(__file__)), "traces.jsonl"))
+    summary.add_argument("--trace", help="Only this trace ID")
+    summary.add_argument("--last", type=int, default=10, help="Number of newest traces to show")
+    summary.add_argument("--json", action="store_true", help="Print the summary as JSON")
+
+    args = parser.parse_args()
+    if args.command == "run":
+        cmd = args.cmd[1:] if args.cmd[:1] == ["--"] else args.cmd
+        if not cmd:
+            parser.error("run needs a command after --")
+        trace_ids = [trace_id for trace_id in re.split(r"[\s,]+", args.trace_ids) if trace_id]
+        start = time.time()
+        returncode = subprocess.call(cmd)
+        record(
+            args.name, start, time.time(), trace_ids, status="ok" if returncode == 0 else "error",
+            returncode=returncode, **_parse_attrs(args.attr),
+        )
+        return returncode
+
+    summaries, stages = summarize(read_spans(args.file, args.trace), args.last)
+    if args.json:
+        print(json.dumps({"traces": summaries, "stages": stages}, indent=2))
+    else:
+        print_summary(summaries, stages)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
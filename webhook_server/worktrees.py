@@ -0,0 +1,98 @@
+import os
+import subprocess
+import threading
+import uuid
+from contextlib import contextmanager
+
+from rich.console import Console
+
+from git_backend import CliGitBackend, GitError
+
+console = Console()
+
+
+class WorktreePool:
+    """Hands out isolated git worktrees of one repository so jobs never share a checkout.
+
+    Worktrees live under scratch_dir and share the object store of repo_path, so creating
+    one is cheap. Released worktrees are kept (up to max_idle) and reset for the next job.
+    Fetching and resetting go through the git backend; adding and removing worktrees always
+    uses the git binary.
+    """
+
+    def __init__(self, repo_path, scratch_dir, max_idle=4, backend=None, git_lock=None):
+        self.repo_path = repo_path
+        self.scratch_dir = scratch_dir
+        self.max_idle = max_idle
+        self.backend = backend or CliGitBackend()
+        # Serializes commands that write the shared .git directory (fetch, worktree add/remove).
+        # Pools of the same repository must be given the same lock.
+        self.git_lock = git_lock or threading.Lock()
+        self._idle = []
+        self._pool_lock = threading.Lock()
+
+    def start(self):
+        """Creates the scratch directory and adopts worktrees from a previous run."""
+        os.makedirs(self.scratch_dir, exist_ok=True)
+        self._adopt_existing()
+
+    def _git(self, *args, cwd=None):
+        return subprocess.run(
+            ["git", *args], cwd=cwd or self.repo_path, check=True, capture_output=True, text=True
+        )
+
+    def _adopt_existing(self):
+        """Reuses worktrees left in the scratch directory by a previous run of the server."""
+        with self.git_lock:
+            self._git("worktree", "prune")
+            listing = self._git("worktree", "list", "--porcelain").stdout
+        scratch = os.path.realpath(self.scratch_dir)
+        for line in listing.splitlines():
+            if not line.startswith("worktree "):
+                continue
+            path = os.path.realpath(line[len("worktree "):])
+            if os.path.dirname(path) == scratch:
+                self._idle.append(path)
+        if self._idle:
+            console.print(f"[bold green]WORKTREE: ♻️ Reusing {len(self._idle)} existing worktree(s) in {self.scratch_dir}[/bold green]")
+
+    def fetch(self, remote="origin"):
+        """Fetches the remote into the shared repository."""
+        with self.git_lock:
+            self.backend.fetch(self.repo_path, remote)
+
+    def _acquire(self, ref):
+        with self._pool_lock:
+            path = self._idle.pop() if self._idle else None
+            if path is None:
+                path = os.path.join(self.scratch_dir, f"wt-{uuid.uuid4().hex[:12]}")
+        if os.path.isdir(path):
+            self.backend.reset_detached(path, ref)
+        else:
+            with self.git_lock:
+                self._git("worktree", "add", "--detach", path, ref)
+            console.print(f"[bold green]WORKTREE: ✔️ Created worktree {path}[/bold green]")
+        return path
+
+    def _release(self, path):
+        with self._pool_lock:
+            if len(self._idle) < self.max_idle:
+                self._idle.append(path)
+                return
+        if hasattr(self.backend, "forget"):
+            self.backend.forget(path)
+        with self.git_lock:
+            self._git("worktree", "remove", "--force", path)
+        console.print(f"[bold blue]WORKTREE: 🧹 Removed worktree {path}[/bold blue]")
+
+    @contextmanager
+    def checkout(self, ref="origin/main"):
+        """Yields the path of a clean worktree with a detached HEAD at ref."""
+        path = self._acquire(ref)
+        try:
+            yield path
+        finally:
+            try:
+                self._release(path)
+            except (subprocess.CalledProcessError, GitError) as e:
+                console.print(f"[bold red]WORKTREE: ❌ Could not release {path}:[/bold red] {e.stderr}")